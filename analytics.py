@@ -0,0 +1,121 @@
+"""
+Reports over the hourly rollup tables (rollup_messages, rollup_confidence,
+rollup_feedback). The log writers keep them current, so these queries read a few
+rows per hour of traffic and never touch `messages` or `feedback`.
+
+    python analytics.py report --days 7
+    python analytics.py report --since 2026-10-01 --by hour --json
+    python analytics.py rebuild            # recount from the log tables (one-off)
+"""
+import argparse
+import json
+import time
+from typing import Any, Dict, List, Optional
+import db
+
+# ---------------- Query API ----------------
+
+def intent_summary(since: Optional[str] = None, until: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Incoming messages per NLU intent ('' = no intent matched): count, share and mean confidence."""
+    rows = [r for r in db.rollup_intents(since, until) if r.direction == "in"]
+    total = sum(r.messages for r in rows) or 1
+    return [{"intent": r.intent, "messages": int(r.messages), "share": round(r.messages / total, 4),
+             "avg_confidence": round(r.confidence_sum / r.messages, 3) if r.messages else 0.0} for r in rows]
+
+def reply_summary(since: Optional[str] = None, until: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Logged bot replies per kind (faq, schedule, ask_slot, fallback, ...)."""
+    return [{"reply": r.intent, "messages": int(r.messages)}
+            for r in db.rollup_intents(since, until) if r.direction == "out"]
+
+def fallback_rate(since: Optional[str] = None, until: Optional[str] = None, by: str = "day") -> List[Dict[str, Any]]:
+    """Per day (or hour): incoming turns, fallback replies and their ratio."""
+    return [{"period": r.period, "turns": int(r.turns), "fallbacks": int(r.fallbacks),
+             "fallback_rate": round(r.fallbacks / r.turns, 4) if r.turns else 0.0}
+            for r in db.rollup_timeline(since, until, by)]
+
+def confidence_histogram(since: Optional[str] = None, until: Optional[str] = None,
+                         intent: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Incoming messages per confidence decile [b/10, (b+1)/10)."""
+    return [{"from": r.bucket / 10, "to": (r.bucket + 1) / 10, "messages": int(r.messages)}
+            for r in db.rollup_confidence_histogram(since, until, intent)]
+
+def feedback_summary(since: Optional[str] = None, until: Optional[str] = None,
+                     by: str = "intent") -> List[Dict[str, Any]]:
+    """Ratings and mean rating per rated reply kind (by="intent") or per FAQ (by="faq")."""
+    groups: Dict[Any, List[int]] = {}
+    for r in db.rollup_feedback_totals(since, until):
+        if by == "faq" and not r.faq_id:
+            continue
+        g = groups.setdefault(r.faq_id if by == "faq" else r.intent, [0, 0])
+        g[0] += int(r.ratings)
+        g[1] += int(r.rating_sum)
+    out = [{by: key, "ratings": n, "avg_rating": round(s / n, 2)} for key, (n, s) in groups.items() if n]
+    return sorted(out, key=lambda row: -row["ratings"])
+
+def report(since: Optional[str] = None, until: Optional[str] = None, by: str = "day") -> Dict[str, Any]:
+    return {
+        "since": since, "until": until,
+        "fallback_rate": fallback_rate(since, until, by),
+        "intents": intent_summary(since, until),
+        "replies": reply_summary(since, until),
+        "confidence": confidence_histogram(since, until),
+        "feedback_by_intent": feedback_summary(since, until, "intent"),
+        "feedback_by_faq": feedback_summary(since, until, "faq"),
+    }
+
+# ---------------- CLI ----------------
+
+def _print_report(rep: Dict[str, Any]):
+    span_ = f"{rep['since'] or 'start'} .. {rep['until'] or 'now'}"
+    turns = sum(r["turns"] for r in rep["fallback_rate"])
+    fallbacks = sum(r["fallbacks"] for r in rep["fallback_rate"])
+    print(f"Turns {span_}: {turns}, fallbacks {fallbacks} ({fallbacks / max(turns, 1):.1%})")
+    for r in rep["fallback_rate"]:
+        print(f"  {r['period']:<13} turns {r['turns']:>7}  fallbacks {r['fallbacks']:>6}  ({r['fallback_rate']:.1%})")
+    print("Intents (incoming):")
+    for r in rep["intents"]:
+        print(f"  {r['intent'] or '(none)':<16} {r['messages']:>7}  {r['share']:>6.1%}  avg conf {r['avg_confidence']:.2f}")
+    print("Replies:")
+    for r in rep["replies"]:
+        print(f"  {r['reply']:<16} {r['messages']:>7}")
+    print("Confidence (incoming):")
+    for r in rep["confidence"]:
+        print(f"  {r['from']:.1f}-{r['to']:.1f}  {r['messages']:>7}")
+    if rep["feedback_by_intent"]:
+        print("Feedback by rated reply:")
+        for r in rep["feedback_by_intent"]:
+            print(f"  {r['intent'] or '(unknown)':<16} {r['ratings']:>5} ratings  avg {r['avg_rating']:.2f}")
+    if rep["feedback_by_faq"]:
+        questions = {f.id: f.question for f in db.list_faqs()}
+        print("Feedback by FAQ:")
+        for r in rep["feedback_by_faq"]:
+            print(f"  #{r['faq']:<5} {r['ratings']:>5} ratings  avg {r['avg_rating']:.2f}  {questions.get(r['faq'], '')}")
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Intent, fallback and feedback reports from the rollup tables.")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    rp = sub.add_parser("report", help="print a report")
+    rp.add_argument("--since", help="UTC lower bound, e.g. 2026-10-01 or '2026-10-01 08:00:00'")
+    rp.add_argument("--until", help="UTC upper bound (exclusive)")
+    rp.add_argument("--days", type=float, help="shorthand for --since <now - days>")
+    rp.add_argument("--by", choices=["day", "hour"], default="day")
+    rp.add_argument("--json", action="store_true")
+    rb = sub.add_parser("rebuild", help="recompute the rollups from the messages/feedback tables")
+    rb.add_argument("--since", help="only recount hours from here on (keeps older, e.g. archived, hours)")
+    args = ap.parse_args()
+
+    db.init_db()
+    t0 = time.perf_counter()
+    if args.cmd == "rebuild":
+        db.rebuild_rollups(args.since)
+        print(f"Rollups rebuilt in {time.perf_counter() - t0:.1f}s")
+    else:
+        since = args.since
+        if args.days:
+            since = time.strftime("%Y-%m-%d %H:00:00", time.gmtime(time.time() - args.days * 86400))
+        rep = report(since, args.until, args.by)
+        if args.json:
+            print(json.dumps(rep, indent=2, ensure_ascii=False))
+        else:
+            _print_report(rep)
+            print(f"({1000 * (time.perf_counter() - t0):.1f} ms)")
@@ -0,0 +1,95 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+from config import ANSWER_CACHE_MAX, ANSWER_CACHE_TTL
+from refresher import TableWatcher
+
+# Tables whose contents can change a computed reply
+SOURCE_TABLES = ("faqs", "intents", "schedules", "deadlines")
+
+def cache_key(text: str, ctx) -> Tuple[Hashable, ...]:
+    """
+    Key of a turn: the stripped text plus every session field the dialog logic reads.
+    The text is not folded further: the NLU sees it as-is, so two messages share a
+    reply only if they are the same message.
+    """
+    slots = ctx.get("slots") or {}
+    return (text.strip(), ctx.get("pending_intent"), tuple(sorted(slots.items())),
+            ctx.get("last_course"), ctx.get("last_assignment"))
+
+class AnswerCache:
+    """
+    LRU + TTL cache of computed replies.
+
+    Cleared whenever one of SOURCE_TABLES changes. `generation` is bumped on every
+    clear; a reply computed before a clear is refused by put(), so it can't sneak
+    stale data back in.
+    """
+    def __init__(self, max_entries: int = ANSWER_CACHE_MAX, ttl: float = ANSWER_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        now = time.monotonic()
+        with self._lock:
+            hit = self._entries.get(key)
+            if hit is None or hit[0] < now:
+                if hit is not None:
+                    del self._entries[key]
+                    self.evictions += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return hit[1]
+
+    def put(self, key: Hashable, value: Any, generation: int):
+        """Store a value computed while `generation` was current."""
+        with self._lock:
+            if generation != self.generation:
+                return
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.generation += 1
+            self.invalidations += 1
+
+    def watch_changes(self, watcher: TableWatcher):
+        """Invalidate on edits to the source tables. Register after the NLU's own
+        refresh callbacks, so the clear happens once the new index is in place."""
+        watcher.watch(SOURCE_TABLES, lambda _versions: self.clear())
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {"size": len(self._entries), "hits": self.hits, "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions, "invalidations": self.invalidations}
+
+_cache: Optional[AnswerCache] = None
+_cache_lock = threading.Lock()
+
+def get_answer_cache() -> AnswerCache:
+    """Return the process-wide answer cache."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = AnswerCache()
+    return _cache
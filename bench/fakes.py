@@ -0,0 +1,31 @@
+"""In-process stand-ins for the Telegram side of a conversation (no network)."""
+import datetime
+import itertools
+import time
+from typing import List, Tuple
+from telegram import Chat, Message, Update, User
+
+class FakeBot:
+    """Bot replacement that records replies instead of calling the Bot API."""
+    def __init__(self):
+        self.sent: List[Tuple[float, int, str]] = []  # (monotonic time, chat_id, text)
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.sent.append((time.monotonic(), chat_id, text))
+        return None
+
+    def replies_to(self, chat_id: int) -> List[str]:
+        return [t for _ts, cid, t in self.sent if cid == chat_id]
+
+_ids = itertools.count(1)
+
+def make_update(bot: FakeBot, tg_user_id: int, text: str, first_name: str = "Student") -> Update:
+    """A private-chat text message from `tg_user_id`, wired to `bot` for replies."""
+    uid = next(_ids)
+    user = User(tg_user_id, first_name, False, last_name="Bench", username=f"student{tg_user_id}")
+    chat = Chat(tg_user_id, Chat.PRIVATE)
+    msg = Message(uid, datetime.datetime.now(datetime.timezone.utc), chat, from_user=user, text=text)
+    msg.set_bot(bot)
+    update = Update(uid, message=msg)
+    update.set_bot(bot)
+    return update
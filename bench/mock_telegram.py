@@ -0,0 +1,348 @@
+"""
+Local mock of the Telegram Bot API, plus a load generator, for offline load tests.
+
+Point the unmodified bot at it with TELEGRAM_API_BASE_URL=http://127.0.0.1:PORT/bot.
+It answers the methods the bot uses:
+
+  getMe, logOut, close        fixed bot identity / true
+  getUpdates                  long poll over injected updates (offset/limit/timeout);
+                              409 while a webhook is set, like Telegram
+  setWebhook, deleteWebhook,  after setWebhook, injected updates are POSTed to the
+  getWebhookInfo              webhook URL instead (secret header, max_connections)
+  sendMessage                 recorded; matched to the oldest unanswered update of
+                              the chat to measure reply latency
+
+Other methods get a 404 error response and are counted. bench.soak drives a full run;
+on its own the mock serves (and optionally generates load) until Ctrl-C:
+
+    python -m bench.mock_telegram --port 8081 --rate 20 --users 200
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import time
+import urllib.parse
+from collections import defaultdict, deque
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
+
+from bench.replay import percentile, plan_conversations
+
+BOT_USER = {"id": 1_000_001, "is_bot": True, "first_name": "EduBot", "username": "edu_bot",
+            "can_join_groups": False, "can_read_all_group_messages": False, "supports_inline_queries": False}
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 409: "Conflict"}
+
+class LatencySample:
+    """Reservoir of reply latencies: exact for the current interval, sampled over the run."""
+    def __init__(self, keep: int = 50_000, seed: int = 7):
+        self.keep = keep
+        self.interval: List[float] = []
+        self.overall: List[float] = []
+        self.seen = 0
+        self._rnd = random.Random(seed)
+
+    def add(self, seconds: float):
+        self.interval.append(seconds)
+        self.seen += 1
+        if len(self.overall) < self.keep:
+            self.overall.append(seconds)
+        else:
+            k = self._rnd.randrange(self.seen)
+            if k < self.keep:
+                self.overall[k] = seconds
+
+    def take_interval(self) -> List[float]:
+        out, self.interval = self.interval, []
+        return out
+
+class MockBotAPI:
+    """Bot API server state and asyncio HTTP/1.1 front end (keep-alive, JSON or form bodies)."""
+    def __init__(self, host: str = "127.0.0.1", port: int = 8081):
+        self.host, self.port = host, port
+        self.calls: Dict[str, int] = defaultdict(int)
+        self.unknown: Dict[str, int] = defaultdict(int)
+        self.injected = 0
+        self.replies = 0
+        self.unmatched_replies = 0  # sendMessage with no outstanding update for the chat
+        self.webhook_errors = 0
+        self.latency = LatencySample()
+        self.webhook: Dict[str, Any] = {"url": "", "secret_token": "", "max_connections": 40}
+        self._updates: Deque[dict] = deque()  # not yet confirmed by getUpdates offset
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self._outstanding: Dict[int, Deque[float]] = defaultdict(deque)  # chat -> inject times
+        self._arrived = asyncio.Event()
+        self._push_queue: "asyncio.Queue[dict]" = asyncio.Queue()
+        self._pushers: List[asyncio.Task] = []
+        self._server: Optional[asyncio.base_events.Server] = None
+        self._conns: Dict[asyncio.Task, asyncio.StreamWriter] = {}
+        self._client = None
+
+    # ---------------- Lifecycle ----------------
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._serve_conn, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        for task in self._pushers:
+            task.cancel()
+        await asyncio.gather(*self._pushers, return_exceptions=True)
+        self._pushers = []
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        if self._server is not None:
+            self._server.close()
+            for task in list(self._conns):
+                task.cancel()  # keep-alive connections and long polls in progress
+            await asyncio.gather(*self._conns, return_exceptions=True)
+            await self._server.wait_closed()
+            self._server = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/bot"
+
+    @property
+    def connected(self) -> bool:
+        """The bot is fetching updates (getUpdates seen) or has registered a webhook."""
+        return bool(self.calls.get("getUpdates") or self.webhook["url"])
+
+    def outstanding(self) -> int:
+        return sum(len(q) for q in self._outstanding.values())
+
+    # ---------------- Updates ----------------
+
+    def inject(self, user_id: int, text: str) -> dict:
+        """Queue a private text message from `user_id`, as Telegram would deliver it."""
+        update_id = next(self._update_ids)
+        message = {
+            "message_id": update_id, "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "Student",
+                     "last_name": "Soak", "username": f"student{user_id}"},
+            "text": text,
+        }
+        if text.startswith("/"):
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        update = {"update_id": update_id, "message": message}
+        self._outstanding[user_id].append(time.perf_counter())
+        self.injected += 1
+        if self.webhook["url"]:
+            self._push_queue.put_nowait(update)
+        else:
+            self._updates.append(update)
+            self._arrived.set()
+        return update
+
+    async def _get_updates(self, params: Dict[str, Any]) -> Tuple[int, Any]:
+        if self.webhook["url"]:
+            return 409, "Conflict: can't use getUpdates method while webhook is active; use deleteWebhook to delete the webhook first"
+        offset = int(params.get("offset") or 0)
+        while self._updates and self._updates[0]["update_id"] < offset:
+            self._updates.popleft()  # confirmed
+        limit = max(1, min(100, int(params.get("limit") or 100)))
+        if not self._updates:
+            self._arrived.clear()
+            try:
+                await asyncio.wait_for(self._arrived.wait(), float(params.get("timeout") or 0))
+            except asyncio.TimeoutError:
+                pass
+        return 200, list(itertools.islice(self._updates, limit))
+
+    def _set_webhook(self, params: Dict[str, Any]) -> Tuple[int, Any]:
+        url = params.get("url") or ""
+        self.webhook = {"url": url, "secret_token": params.get("secret_token") or "",
+                        "max_connections": int(params.get("max_connections") or 40)}
+        for task in self._pushers:
+            task.cancel()
+        self._pushers = []
+        if url:
+            while self._updates:  # pending updates move over to the webhook, as on Telegram
+                self._push_queue.put_nowait(self._updates.popleft())
+            self._pushers = [asyncio.get_running_loop().create_task(self._push())
+                             for _ in range(self.webhook["max_connections"])]
+        elif params.get("drop_pending_updates") in (True, "true", "True"):
+            self._updates.clear()
+        return 200, True
+
+    async def _push(self):
+        """One webhook connection: POST queued updates until success, retrying like Telegram."""
+        import httpx  # installed with python-telegram-bot
+
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=60, limits=httpx.Limits(max_connections=None))
+        headers = {"Content-Type": "application/json"}
+        if self.webhook["secret_token"]:
+            headers["X-Telegram-Bot-Api-Secret-Token"] = self.webhook["secret_token"]
+        while True:
+            update = await self._push_queue.get()
+            for delay in (0.1, 0.5, 1, 2, 5, 10, 30):
+                try:
+                    resp = await self._client.post(self.webhook["url"], content=json.dumps(update), headers=headers)
+                    if resp.status_code == 200:
+                        break
+                except httpx.HTTPError:
+                    pass
+                self.webhook_errors += 1
+                await asyncio.sleep(delay)
+
+    def _send_message(self, params: Dict[str, Any]) -> Tuple[int, Any]:
+        chat_id = int(params["chat_id"])
+        queue = self._outstanding.get(chat_id)
+        if queue:
+            self.latency.add(time.perf_counter() - queue.popleft())
+            if not queue:
+                del self._outstanding[chat_id]
+        else:
+            self.unmatched_replies += 1
+        self.replies += 1
+        return 200, {"message_id": next(self._message_ids), "date": int(time.time()), "from": BOT_USER,
+                     "chat": {"id": chat_id, "type": "private"}, "text": params.get("text", "")}
+
+    async def call(self, method: str, params: Dict[str, Any]) -> Tuple[int, Any]:
+        """(HTTP status, result or error description) for one Bot API method."""
+        self.calls[method] += 1
+        if method == "sendMessage":
+            return self._send_message(params)
+        if method == "getUpdates":
+            return await self._get_updates(params)
+        if method == "getMe":
+            return 200, BOT_USER
+        if method == "setWebhook":
+            return self._set_webhook(params)
+        if method == "deleteWebhook":
+            return self._set_webhook({"drop_pending_updates": params.get("drop_pending_updates")})
+        if method == "getWebhookInfo":
+            return 200, {"url": self.webhook["url"], "has_custom_certificate": False,
+                         "pending_update_count": len(self._updates) + self._push_queue.qsize(),
+                         "max_connections": self.webhook["max_connections"]}
+        if method in ("logOut", "close"):
+            return 200, True
+        self.unknown[method] += 1
+        return 404, "Not Found: method not found"
+
+    # ---------------- HTTP ----------------
+
+    @staticmethod
+    def _params(target: str, headers: Dict[str, str], body: bytes) -> Dict[str, Any]:
+        params: Dict[str, Any] = {k: v[-1] for k, v in urllib.parse.parse_qs(urllib.parse.urlsplit(target).query).items()}
+        ctype = headers.get("content-type", "")
+        if "json" in ctype and body:
+            params.update(json.loads(body))
+        elif "x-www-form-urlencoded" in ctype and body:
+            params.update({k: v[-1] for k, v in urllib.parse.parse_qs(body.decode()).items()})
+        return params
+
+    async def _serve_conn(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        task = asyncio.current_task()
+        self._conns[task] = writer
+        try:
+            while True:
+                line = await reader.readline()
+                if not line.strip():
+                    break
+                _verb, target, _version = line.decode("latin-1").split()
+                headers: Dict[str, str] = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get("content-length") or 0)
+                body = await reader.readexactly(length) if length else b""
+                method = urllib.parse.urlsplit(target).path.rsplit("/", 1)[-1]
+                try:
+                    status, result = await self.call(method, self._params(target, headers, body))
+                except (KeyError, ValueError) as e:
+                    status, result = 400, f"Bad Request: {e}"
+                payload = {"ok": True, "result": result} if status == 200 else \
+                    {"ok": False, "error_code": status, "description": result}
+                data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                writer.write(f"HTTP/1.1 {status} {_REASONS.get(status, '')}\r\nContent-Type: application/json\r\n"
+                             f"Content-Length: {len(data)}\r\nConnection: keep-alive\r\n\r\n".encode("latin-1") + data)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        except asyncio.CancelledError:
+            pass  # stop(); ending normally keeps asyncio from logging the cancelled handler
+        finally:
+            self._conns.pop(task, None)
+            writer.close()
+
+class LoadGenerator:
+    """
+    Open-loop load: injects updates at `rate` per second (ramping linearly to `ramp_to`
+    over `duration` seconds, if given), regardless of how fast the bot answers. Users
+    take turns; each plays the replay benchmark's multi-turn scripts over and over.
+    """
+    def __init__(self, api: MockBotAPI, rate: float, users: int = 200, duration: float = 0,
+                 ramp_to: Optional[float] = None, seed: int = 7):
+        self.api = api
+        self.rate = rate
+        self.ramp_to = rate if ramp_to is None else ramp_to
+        self.duration = duration
+        plans = plan_conversations(users, 40, seed)
+        self._users: Iterator[Tuple[int, Iterator[str]]] = itertools.cycle(
+            [(uid, itertools.cycle(msgs)) for uid, msgs in plans.items()])
+        self.sent = 0
+
+    def rate_at(self, elapsed: float) -> float:
+        if not self.duration:
+            return self.rate
+        return self.rate + (self.ramp_to - self.rate) * min(1.0, elapsed / self.duration)
+
+    async def run(self, tick: float = 0.01):
+        """Inject until `duration` has passed (forever if 0) or the task is cancelled."""
+        loop = asyncio.get_running_loop()
+        t0 = last = loop.time()
+        due = 0.0
+        while True:
+            await asyncio.sleep(tick)
+            now = loop.time()
+            if self.duration and now - t0 >= self.duration:
+                return
+            due += self.rate_at(now - t0) * (now - last)  # integral of the rate since the last tick
+            last = now
+            while self.sent < int(due):
+                uid, msgs = next(self._users)
+                self.api.inject(uid, next(msgs))
+                self.sent += 1
+
+async def _serve(args):
+    api = MockBotAPI(args.host, args.port)
+    await api.start()
+    print(f"[mock] Bot API at {api.base_url} (TELEGRAM_API_BASE_URL)")
+    load = None
+    if args.rate:
+        load = asyncio.get_running_loop().create_task(LoadGenerator(api, args.rate, args.users).run())
+    try:
+        while True:
+            await asyncio.sleep(args.every)
+            lat = api.latency.take_interval()
+            print(f"[mock] injected {api.injected} replies {api.replies} outstanding {api.outstanding()} "
+                  f"p50 {1000 * percentile(lat, 50):.1f} ms p99 {1000 * percentile(lat, 99):.1f} ms "
+                  f"calls {dict(api.calls)}")
+    finally:
+        if load is not None:
+            load.cancel()
+        await api.stop()
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8081)
+    ap.add_argument("--rate", type=float, default=0, help="updates per second to inject (0 = serve only)")
+    ap.add_argument("--users", type=int, default=200)
+    ap.add_argument("--every", type=float, default=10, help="seconds between status lines")
+    args = ap.parse_args()
+    try:
+        asyncio.run(_serve(args))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+POST recorded (or synthetic) Telegram updates to a running webhook server.
+
+Input is JSONL, one Update object per line as Telegram would send it. Without
+--file, updates are generated from the replay benchmark's scripts. Users are
+sent in parallel, each user's updates strictly one after another.
+
+    BOT_MODE=webhook python chatbot_edu.py &
+    python -m bench.post_updates --file updates.jsonl --url http://127.0.0.1:8443/telegram
+    python -m bench.post_updates --users 50 --turns 10 --dump updates.jsonl
+"""
+import argparse
+import http.client
+import json
+import time
+import urllib.parse
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List
+
+from bench.replay import percentile, plan_conversations
+
+def synthetic_updates(users: int, turns: int, seed: int) -> List[dict]:
+    """Raw Update dicts for the replay scripts, interleaved round-robin across users."""
+    plans = plan_conversations(users, turns, seed)
+    out, update_id, now = [], 1, int(time.time())
+    for turn in range(turns):
+        for tg_id, msgs in plans.items():
+            if turn >= len(msgs):
+                continue
+            text = msgs[turn]
+            message = {
+                "message_id": update_id, "date": now,
+                "chat": {"id": tg_id, "type": "private"},
+                "from": {"id": tg_id, "is_bot": False, "first_name": "Student",
+                         "last_name": "Bench", "username": f"student{tg_id}"},
+                "text": text,
+            }
+            if text.startswith("/"):
+                message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+            out.append({"update_id": update_id, "message": message})
+            update_id += 1
+    return out
+
+def read_jsonl(path: str) -> Iterable[dict]:
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+def _sender_key(update: dict) -> int:
+    for field in ("message", "edited_message", "callback_query"):
+        if field in update:
+            return update[field].get("from", {}).get("id", 0)
+    return 0
+
+def post_all(updates: List[dict], url: str, secret: str = "", concurrency: int = 16) -> Dict[str, object]:
+    target = urllib.parse.urlsplit(url)
+    by_user: Dict[int, List[dict]] = defaultdict(list)
+    for u in updates:
+        by_user[_sender_key(u)].append(u)
+
+    def send_user(batch: List[dict]):
+        conn = http.client.HTTPConnection(target.hostname, target.port or 80, timeout=30)
+        headers = {"Content-Type": "application/json"}
+        if secret:
+            headers["X-Telegram-Bot-Api-Secret-Token"] = secret
+        results = []
+        try:
+            for u in batch:
+                t0 = time.perf_counter()
+                try:
+                    conn.request("POST", target.path or "/", body=json.dumps(u).encode(), headers=headers)
+                    resp = conn.getresponse()
+                    resp.read()
+                    status = resp.status
+                    if resp.getheader("Connection", "").lower() == "close":
+                        conn.close()
+                except (OSError, http.client.HTTPException):
+                    status = "error"
+                    conn.close()
+                results.append((status, time.perf_counter() - t0))
+        finally:
+            conn.close()
+        return results
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        results = [r for batch in pool.map(send_user, by_user.values()) for r in batch]
+    elapsed = time.perf_counter() - t0
+    statuses: Dict[object, int] = defaultdict(int)
+    for status, _ in results:
+        statuses[status] += 1
+    latencies = [dt * 1000 for _, dt in results]
+    return {
+        "updates": len(results),
+        "users": len(by_user),
+        "seconds": round(elapsed, 3),
+        "updates_per_sec": round(len(results) / elapsed, 1) if elapsed else 0.0,
+        "status": dict(statuses),
+        "post_ms_p50": round(percentile(latencies, 50), 2),
+        "post_ms_p99": round(percentile(latencies, 99), 2),
+    }
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--url", default="http://127.0.0.1:8443/telegram")
+    ap.add_argument("--secret", default="", help="value for X-Telegram-Bot-Api-Secret-Token")
+    ap.add_argument("--file", help="JSONL of recorded updates")
+    ap.add_argument("--users", type=int, default=20)
+    ap.add_argument("--turns", type=int, default=10)
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--concurrency", type=int, default=16)
+    ap.add_argument("--dump", help="write the updates as JSONL instead of sending them")
+    args = ap.parse_args()
+
+    updates = list(read_jsonl(args.file)) if args.file else synthetic_updates(args.users, args.turns, args.seed)
+    if args.dump:
+        with open(args.dump, "w", encoding="utf-8") as f:
+            for u in updates:
+                f.write(json.dumps(u, ensure_ascii=False) + "\n")
+        print(f"wrote {len(updates)} updates to {args.dump}")
+        return
+    print(json.dumps(post_all(updates, args.url, args.secret, args.concurrency), indent=2))
+
+if __name__ == "__main__":
+    main()
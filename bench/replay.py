@@ -0,0 +1,139 @@
+"""
+End-to-end replay benchmark for the bot's handlers.
+
+Drives chatbot_edu.start / reset_cmd / help_cmd / handle_text with synthetic
+Updates and a recording FakeBot, for N simulated users running realistic
+multi-turn scripts at a given concurrency. Runs offline against a temporary
+SQLite file seeded with seed_data.seed().
+
+    python -m bench.replay --users 200 --turns 20 --concurrency 32
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import time
+from typing import Dict, List
+
+# Multi-turn scripts; each simulated user plays a random sequence of them
+SCRIPTS: Dict[str, List[str]] = {
+    "schedule_slot_fill": ["what's the timetable this week?", "158.780"],
+    "deadline_slot_fill": ["when is the assignment due?", "158.780", "A2"],
+    "course_then_followup": ["158.780 what's this week?", "A1 deadline?"],
+    "course_clarify": ["158.780", "A1"],
+    "faq_hit": ["how do I book counseling?", "When does the exam week start this term?"],
+    "fallback": ["hello there", "I like turtles"],
+    "menu": ["FAQs", "Help"],
+    "feedback": ["5 very helpful, thanks"],
+    "reset": ["/reset", "A1 deadline?"],
+}
+
+def percentile(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = min(len(ordered) - 1, max(0, round(p / 100 * (len(ordered) - 1))))
+    return ordered[k]
+
+def plan_conversations(users: int, turns: int, seed: int) -> Dict[int, List[str]]:
+    """Per-user message lists: /start, then scripts until `turns` messages."""
+    rnd = random.Random(seed)
+    names = sorted(SCRIPTS)
+    plans = {}
+    for i in range(users):
+        msgs = ["/start"]
+        while len(msgs) < turns:
+            msgs.extend(SCRIPTS[rnd.choice(names)])
+        plans[100_000 + i] = msgs[:turns]
+    return plans
+
+async def replay(plans: Dict[int, List[str]], concurrency: int):
+    # Imported here: config reads DB_PATH etc. from the environment at import time
+    import chatbot_edu
+    from bench.fakes import FakeBot, make_update
+
+    handlers = {"/start": chatbot_edu.start, "/reset": chatbot_edu.reset_cmd, "/help": chatbot_edu.help_cmd}
+    bot = FakeBot()
+    latencies: List[float] = []
+    slots = asyncio.Semaphore(concurrency)
+
+    async def converse(tg_user_id: int, msgs: List[str]):
+        # A user's turns run in order (as the update processor guarantees); users overlap
+        for text in msgs:
+            handler = handlers.get(text, chatbot_edu.handle_text)
+            update = make_update(bot, tg_user_id, text)
+            async with slots:
+                t0 = time.perf_counter()
+                await handler(update, None)
+                latencies.append(time.perf_counter() - t0)
+
+    await chatbot_edu.get_nlu()  # warm-up is reported separately by the startup benchmark
+    t0 = time.perf_counter()
+    await asyncio.gather(*(converse(uid, msgs) for uid, msgs in plans.items()))
+    return time.perf_counter() - t0, latencies, bot
+
+def main():
+    ap = argparse.ArgumentParser(description="Replay synthetic conversations through the bot handlers.")
+    ap.add_argument("--users", type=int, default=100)
+    ap.add_argument("--turns", type=int, default=20, help="messages per user")
+    ap.add_argument("--concurrency", type=int, default=16, help="turns in flight at once")
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--json", action="store_true", help="print the report as JSON")
+    ap.add_argument("--keep", action="store_true", help="keep the temporary database directory")
+    args = ap.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="edu-bench-")
+    os.environ["DB_PATH"] = os.path.join(workdir, "bench.db")
+    os.environ["FAQ_INDEX_DIR"] = os.path.join(workdir, "faq_index")
+    try:
+        import seed_data
+        seed_data.seed()
+
+        from sqlalchemy import event
+        import db
+        from write_behind import close_log_buffer
+        from session_store import close_session_store
+
+        counts = {"statements": 0}
+
+        def count(*_args):
+            counts["statements"] += 1
+
+        event.listen(db.get_engine(), "before_cursor_execute", count)
+        plans = plan_conversations(args.users, args.turns, args.seed)
+        wall, latencies, bot = asyncio.run(replay(plans, args.concurrency))
+        close_log_buffer()      # include the final background flushes in the statement count
+        close_session_store()
+
+        turns = len(latencies)
+        report = {
+            "users": args.users, "turns": turns, "concurrency": args.concurrency,
+            "wall_s": round(wall, 3),
+            "throughput_tps": round(turns / wall, 1) if wall else 0.0,
+            "latency_ms": {name: round(1000 * percentile(latencies, p), 2)
+                           for name, p in (("p50", 50), ("p95", 95), ("p99", 99), ("max", 100))},
+            "mean_ms": round(1000 * statistics.fmean(latencies), 2) if latencies else 0.0,
+            "db_statements": counts["statements"],
+            "db_statements_per_turn": round(counts["statements"] / max(turns, 1), 2),
+            "replies": len(bot.sent),
+        }
+        if args.json:
+            print(json.dumps(report, indent=2))
+        else:
+            print(f"Replayed {turns} turns from {args.users} users at concurrency {args.concurrency}")
+            print(f"  wall {report['wall_s']} s, throughput {report['throughput_tps']} turns/s")
+            lat = report["latency_ms"]
+            print(f"  latency ms: p50 {lat['p50']}  p95 {lat['p95']}  p99 {lat['p99']}  max {lat['max']}")
+            print(f"  DB statements: {report['db_statements']} ({report['db_statements_per_turn']} per turn)")
+    finally:
+        if args.keep:
+            print(f"Database kept in {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+"""
+FAQ retrieval benchmark: the TF-IDF matcher against the dense and hybrid retrievers.
+
+Two parts, both offline:
+
+  paraphrases  hand-written rewordings of the seed FAQs (plus off-topic texts that
+               must not match), run through FAQMatcher with each backend: top-1 and
+               recall@3, answered correctly / wrongly at the backend's threshold,
+               false accepts, per-query latency, and the top-1 score distributions
+               the thresholds are chosen from (correct paraphrases, off-topic texts,
+               slot-only follow-ups such as "A1", which the NLU keeps away from the
+               FAQ bank).
+  scale        a synthetic bank of --scale FAQs: build time, query latency, for
+               the IVF index recall@10 against exact search at several nprobe values,
+               and top-1 scores of right, wrong and unanswerable (random-word) queries.
+
+    python -m bench.retrieval --scale 20000
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+from collections import namedtuple
+from typing import Dict, List, Tuple
+
+from bench.replay import percentile
+
+BACKENDS = ("tfidf", "dense", "hybrid")
+
+# (query, seed FAQ question it should retrieve)
+PARAPHRASES: List[Tuple[str, str]] = [
+    ("pay fees in parts", "Can tuition be paid in installments?"),
+    ("tuition installments", "Can tuition be paid in installments?"),
+    ("can I split my tuition payment?", "Can tuition be paid in installments?"),
+    ("is there a payment plan for fees", "Can tuition be paid in installments?"),
+    ("instalment plan for tuition", "Can tuition be paid in installments?"),
+    ("book a counsellor", "How do I book counseling?"),
+    ("I need to see a counselor", "How do I book counseling?"),
+    ("mental health appointment", "How do I book counseling?"),
+    ("where can I get counselling sessions", "How do I book counseling?"),
+    ("what happens if I hand in my assignment late", "Will late submissions be penalized?"),
+    ("late penalty", "Will late submissions be penalized?"),
+    ("penalties for submitting after the due date", "Will late submissions be penalized?"),
+    ("is there a grace period for late work", "Will late submissions be penalized?"),
+    ("when do exams start", "When does the exam week start this term?"),
+    ("exam period dates", "When does the exam week start this term?"),
+    ("which week are the final exams", "When does the exam week start this term?"),
+    ("how to switch courses", "How do I change courses during add/drop?"),
+    ("can I drop a paper and add another", "How do I change courses during add/drop?"),
+    ("changing my enrolled courses", "How do I change courses during add/drop?"),
+    ("academic office email address", "What's the academic office email?"),
+    ("how do I email the academic office", "What's the academic office email?"),
+    ("contact details for the academic office", "What's the academic office email?"),
+    ("158.780 timetable this week", "What is the schedule for 158.780 this week?"),
+    ("what's on in 158.780 this week", "What is the schedule for 158.780 this week?"),
+    ("158.780 A1 due date", "When is the deadline for 158.780 A1?"),
+    ("when do I have to submit A1 for 158.780", "When is the deadline for 158.780 A1?"),
+]
+# Texts no FAQ answers; a backend should leave them below its threshold
+OFF_TOPIC = ["hello there", "I like turtles", "what's the weather tomorrow", "tell me a joke",
+             "who won the football", "thanks a lot", "my cat is sleeping", "recommend a movie"]
+# Follow-ups that only fill a slot; scored for reference (nlu.slot_only() skips the FAQ search)
+SLOT_ONLY = ["A1", "a1", "A2", "158.780", "158780", "158 780", "158.780 A1", "158780 A1", "158.780 a2",
+             "assignment 1", "A1 158.780"]
+
+FAQRow = namedtuple("FAQRow", "id question answer tags")
+
+def _scores(values: List[float]) -> Dict[str, float]:
+    return {"min": round(min(values), 3), "p50": round(percentile(values, 50), 3), "max": round(max(values), 3)}
+
+def paraphrase_report(runs: int) -> Dict[str, Dict]:
+    """Score every backend on PARAPHRASES / OFF_TOPIC / SLOT_ONLY against the seeded FAQ bank."""
+    from nlu import FAQMatcher, extract_entities, slot_only
+
+    report = {}
+    for backend in BACKENDS:
+        t0 = time.perf_counter()
+        matcher = FAQMatcher(retriever=backend)
+        load_s = time.perf_counter() - t0
+        by_question = {q: faq_id for faq_id, q in matcher.page(0, len(matcher))}
+        top1 = recall3 = correct = wrong = 0
+        misses, hit_scores = [], []
+        for query, question in PARAPHRASES:
+            target = by_question[question]
+            top = matcher.search_topk(query, 3)
+            ranked = [faq_id for faq_id, _ in top]
+            if ranked and ranked[0] == target:
+                hit_scores.append(top[0][1])
+            top1 += bool(ranked) and ranked[0] == target
+            recall3 += target in ranked
+            faq_id, _score = matcher.search(query)
+            if faq_id == target:
+                correct += 1
+            else:
+                wrong += faq_id is not None
+                misses.append(query)
+        false_accepts = sum(matcher.search(text)[0] is not None for text in OFF_TOPIC)
+        off_scores = [matcher.search(text)[1] for text in OFF_TOPIC]
+        slot_scores = [matcher.search(text)[1] for text in SLOT_ONLY]
+        slot_answered = sum(matcher.search(text)[0] is not None and not slot_only(text, extract_entities(text))
+                            for text in SLOT_ONLY)
+        latencies = []
+        for _ in range(runs):
+            for query, _question in PARAPHRASES:
+                t = time.perf_counter()
+                matcher.search(query)
+                latencies.append(time.perf_counter() - t)
+        n = len(PARAPHRASES)
+        report[backend] = {
+            "threshold": matcher.threshold,
+            "top1": round(top1 / n, 3), "recall@3": round(recall3 / n, 3),
+            "answered_correctly": round(correct / n, 3), "answered_wrongly": round(wrong / n, 3),
+            "false_accepts": f"{false_accepts}/{len(OFF_TOPIC)}",
+            "slot_only_answered": f"{slot_answered}/{len(SLOT_ONLY)}",
+            "score_correct": _scores(hit_scores or [0.0]), "score_off_topic": _scores(off_scores),
+            "score_slot_only": _scores(slot_scores),
+            "p50_us": round(1e6 * percentile(latencies, 50), 1), "p99_us": round(1e6 * percentile(latencies, 99), 1),
+            "load_ms": round(1000 * load_s, 1), "missed": misses,
+        }
+    return report
+
+def synthetic_bank(size: int, seed: int) -> Tuple[List[FAQRow], List[Tuple[str, int]], List[str]]:
+    """
+    `size` FAQs over random topics, plus one reworded query (dropped word, typo) per 20 FAQs
+    and as many unanswerable queries (random words of the bank's vocabulary).
+    """
+    rnd = random.Random(seed)
+    letters = "abcdefghiklmnoprstuvw"
+    lexicon = sorted({"".join(rnd.choice(letters) for _ in range(rnd.randint(4, 9))) for _ in range(4000)})
+    topics = [rnd.sample(lexicon, 12) for _ in range(max(1, size // 50))]
+    rows, queries = [], []
+    for i in range(size):
+        topic = rnd.choice(topics)
+        words = rnd.sample(topic, 4) + rnd.sample(lexicon, 3)
+        rows.append(FAQRow(i + 1, " ".join(words) + "?", " ".join(rnd.sample(topic, 6) + rnd.sample(lexicon, 6)),
+                           ", ".join(rnd.sample(topic, 2))))
+        if i % 20 == 0:
+            reworded = words[:]
+            rnd.shuffle(reworded)
+            reworded.pop()
+            w = reworded[0]
+            k = rnd.randrange(len(w))
+            reworded[0] = w[:k] + w[k + 1:]  # typo: one letter dropped
+            queries.append((" ".join(reworded), i + 1))
+    negatives = [" ".join(rnd.sample(lexicon, 4)) for _ in queries]
+    return rows, queries, negatives
+
+def scale_report(size: int, seed: int, nprobes: List[int]) -> Dict:
+    """Build both index types over a synthetic bank and time queries; IVF recall is against exact search."""
+    from faq_index import FAQIndex
+    from dense_index import DenseIndex
+
+    rows, queries, negatives = synthetic_bank(size, seed)
+    texts = [q for q, _ in queries]
+    report: Dict = {"faqs": size, "queries": len(queries)}
+
+    t = time.perf_counter()
+    tfidf = FAQIndex.build(rows)
+    report["tfidf_build_s"] = round(time.perf_counter() - t, 2)
+    t = time.perf_counter()
+    dense = DenseIndex.build(rows)
+    report["dense_build_s"] = round(time.perf_counter() - t, 2)
+    report["dense_dim"] = int(dense.projection.shape[1])
+    report["ivf_cells"] = dense.nlist
+
+    def run(search) -> Tuple[List[List[int]], List[float]]:
+        results, latencies = [], []
+        for text in texts:
+            t0 = time.perf_counter()
+            results.append([faq_id for faq_id, _ in search(text)])
+            latencies.append(time.perf_counter() - t0)
+        return results, latencies
+
+    def summary(results, latencies) -> Dict:
+        hits = sum(bool(r) and r[0] == target for r, (_, target) in zip(results, queries))
+        return {"top1": round(hits / len(queries), 3),
+                "p50_us": round(1e6 * percentile(latencies, 50), 1),
+                "p99_us": round(1e6 * percentile(latencies, 99), 1)}
+
+    def score_summary(search) -> Dict:
+        """p5/p50/p95 top-1 score of right and wrong answers and of unanswerable queries."""
+        right, wrong = [], []
+        for text, target in queries:
+            top = search(text)
+            (right if top and top[0][0] == target else wrong).append(top[0][1] if top else 0.0)
+        unanswerable = [(search(text) or [(0, 0.0)])[0][1] for text in negatives]
+        pcts = lambda v: "/".join(f"{percentile(v, p):.2f}" for p in (5, 50, 95)) if v else "-"
+        return {"right": pcts(right), "wrong": pcts(wrong), "unanswerable": pcts(unanswerable)}
+
+    report["tfidf"] = summary(*run(lambda q: tfidf.search_topk(q, 10)))
+    exact, lat = run(lambda q: dense.search_topk(q, 10, nprobe=dense.nlist))
+    report["dense_exact"] = summary(exact, lat)
+    for nprobe in nprobes:
+        if nprobe >= dense.nlist:
+            continue
+        approx, lat = run(lambda q: dense.search_topk(q, 10, nprobe=nprobe))
+        overlap = sum(len(set(a) & set(e)) / max(len(e), 1) for a, e in zip(approx, exact))
+        report[f"dense_nprobe{nprobe}"] = dict(summary(approx, lat), recall_at_10=round(overlap / len(queries), 3))
+    report["hybrid"] = summary(*run(lambda q: dense.search_topk(q, 10, mode="hybrid")))
+    report["scores_tfidf"] = score_summary(lambda q: tfidf.search_topk(q, 1))
+    report["scores_dense"] = score_summary(lambda q: dense.search_topk(q, 1))
+    report["scores_hybrid"] = score_summary(lambda q: dense.search_topk(q, 1, mode="hybrid"))
+    return report
+
+def main():
+    ap = argparse.ArgumentParser(description="Compare FAQ retrieval backends: quality on paraphrases, latency at scale.")
+    ap.add_argument("--runs", type=int, default=20, help="timing passes over the paraphrase queries")
+    ap.add_argument("--scale", type=int, default=20000, help="synthetic FAQ bank size (0 = skip)")
+    ap.add_argument("--nprobe", default="1,4,8,16", help="IVF cells to scan, comma-separated")
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = ap.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="edu-retrieval-")
+    os.environ["DB_PATH"] = os.path.join(workdir, "bench.db")
+    os.environ["FAQ_INDEX_DIR"] = os.path.join(workdir, "faq_index")
+    try:
+        import seed_data
+        seed_data.seed()
+        report = {"paraphrases": paraphrase_report(args.runs)}
+        if args.scale:
+            report["scale"] = scale_report(args.scale, args.seed, [int(x) for x in args.nprobe.split(",")])
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"Paraphrase set: {len(PARAPHRASES)} queries over the seed FAQs, {len(OFF_TOPIC)} off-topic texts")
+    cols = ("threshold", "top1", "recall@3", "answered_correctly", "answered_wrongly", "false_accepts",
+            "slot_only_answered", "p50_us", "p99_us", "load_ms")
+    print(f"  {'':<20}" + "".join(f"{b:>10}" for b in BACKENDS))
+    for col in cols:
+        print(f"  {col:<20}" + "".join(f"{report['paraphrases'][b][col]!s:>10}" for b in BACKENDS))
+    print(f"  {'top-1 score min/p50/max':<24}" + "".join(f"{b:>16}" for b in BACKENDS))
+    for col in ("score_correct", "score_off_topic", "score_slot_only"):
+        print(f"    {col[6:]:<20}" + "".join(
+            f"{'{min:.2f}/{p50:.2f}/{max:.2f}'.format(**report['paraphrases'][b][col]):>16}" for b in BACKENDS))
+    for b in BACKENDS:
+        if report["paraphrases"][b]["missed"]:
+            print(f"  {b} not answered: " + "; ".join(report["paraphrases"][b]["missed"]))
+    if "scale" in report:
+        scale = report["scale"]
+        print(f"\nSynthetic bank: {scale['faqs']} FAQs, {scale['queries']} reworded queries; "
+              f"build tfidf {scale['tfidf_build_s']}s, dense {scale['dense_build_s']}s "
+              f"({scale['dense_dim']} dims, {scale['ivf_cells']} IVF cells)")
+        for name, row in scale.items():
+            if isinstance(row, dict):
+                print(f"  {name:<16} " + "  ".join(f"{k} {v}" for k, v in row.items()))
+
+if __name__ == "__main__":
+    main()
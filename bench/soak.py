@@ -0,0 +1,265 @@
+"""
+Soak / load test of the whole bot process against the mock Bot API (bench.mock_telegram).
+
+Starts the unmodified bot (`python chatbot_edu.py`, polling or webhook mode, optionally
+with WORKER_PROCESSES) on a temporary seeded SQLite file, points it at the mock and
+injects updates at a fixed or ramping rate for as long as asked. Every --sample seconds
+it records:
+
+  rss_mb        resident memory of the bot and its child processes
+  db_mb/wal_mb  size of the SQLite file and its -wal file
+  loop_lag_ms   worst event-loop lag the bot saw lately (edu_event_loop_lag_max_seconds)
+  reply p50/p99 time from injecting an update to the bot's sendMessage, this interval
+  sent/replied  updates injected and replies received per second; outstanding backlog
+  shed          busy replies so far (edu_updates_shed_total)
+
+Then it stops the load, waits for the backlog to drain, sends SIGTERM and writes a JSON
+report with the timeline and a summary. The summary covers RSS growth per hour after
+warm-up, the peak reply rate and the first interval that fell behind the load.
+
+    python -m bench.soak --duration 2h --rate 30 --report soak.json
+    python -m bench.soak --duration 10m --rate 10 --ramp-to 300 --mode webhook   # find the ceiling
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import secrets
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from typing import Any, Dict, List, Optional
+
+from bench.mock_telegram import LoadGenerator, MockBotAPI
+from bench.replay import percentile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_METRIC_RE = re.compile(r"^([a-zA-Z_:][\w:]*)(\{[^}]*\})?\s+(\S+)$")
+
+def parse_duration(text: str) -> float:
+    """Seconds from "90", "90s", "15m", "2h"."""
+    units = {"s": 1, "m": 60, "h": 3600}
+    text = text.strip().lower()
+    if text and text[-1] in units:
+        return float(text[:-1]) * units[text[-1]]
+    return float(text)
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def process_tree_rss(pid: int) -> Optional[float]:
+    """Resident set size (MB) of `pid` and all its descendants; None off Linux."""
+    if not os.path.isdir("/proc"):
+        return None
+    children: Dict[int, List[int]] = {}
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            try:
+                with open(f"/proc/{entry}/stat") as f:
+                    ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                continue
+            children.setdefault(ppid, []).append(int(entry))
+    total, stack = 0, [pid]
+    while stack:
+        p = stack.pop()
+        try:
+            with open(f"/proc/{p}/statm") as f:
+                total += int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except OSError:
+            pass
+        stack.extend(children.get(p, ()))
+    return total / 2 ** 20
+
+def file_mb(path: str) -> float:
+    try:
+        return os.path.getsize(path) / 2 ** 20
+    except OSError:
+        return 0.0
+
+def scrape(port: int) -> Dict[str, float]:
+    """Unlabelled metric values, labelled ones summed per name."""
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=2) as resp:
+            text = resp.read().decode("utf-8")
+    except OSError:
+        return {}
+    out: Dict[str, float] = {}
+    for line in text.splitlines():
+        m = _METRIC_RE.match(line)
+        if m and not line.startswith("#"):
+            out[m.group(1)] = out.get(m.group(1), 0.0) + float(m.group(3))
+    return out
+
+def scrape_bot(ports: List[int]) -> Dict[str, float]:
+    """The bot's readiness, loop lag and shed count across its metrics endpoints (one per worker)."""
+    scraped = [scrape(port) for port in ports]
+    if not all(scraped):
+        return {}
+    return {"edu_ready": min(m.get("edu_ready", 0.0) for m in scraped),
+            "edu_event_loop_lag_max_seconds": max(m.get("edu_event_loop_lag_max_seconds", 0.0) for m in scraped),
+            "edu_updates_shed_total": sum(m.get("edu_updates_shed_total", 0.0) for m in scraped)}
+
+def slope_per_hour(points: List[tuple]) -> Optional[float]:
+    """Least-squares slope of (seconds, value) points, per hour."""
+    if len(points) < 3:
+        return None
+    n = len(points)
+    mx = sum(x for x, _ in points) / n
+    my = sum(y for _, y in points) / n
+    var = sum((x - mx) ** 2 for x, _ in points)
+    if not var:
+        return None
+    return 3600 * sum((x - mx) * (y - my) for x, y in points) / var
+
+def summarize(samples: List[Dict[str, Any]], api: MockBotAPI, warmup: float) -> Dict[str, Any]:
+    steady = [s for s in samples if s["t"] >= warmup] or samples
+    rss = [(s["t"], s["rss_mb"]) for s in steady if s["rss_mb"] is not None]
+    growth = slope_per_hour(rss)
+    behind = next((s for s in samples if s["sent_per_s"] and s["outstanding"] > 2 * s["sent_per_s"] * s["interval_s"]), None)
+    lat = api.latency.overall
+    return {
+        "injected": api.injected, "replies": api.replies, "unanswered": api.outstanding(),
+        "unmatched_replies": api.unmatched_replies, "webhook_errors": api.webhook_errors,
+        "unknown_methods": dict(api.unknown),
+        "reply_ms": {p: round(1000 * percentile(lat, q), 1) for p, q in (("p50", 50), ("p95", 95), ("p99", 99))},
+        "reply_ms_max": round(1000 * max(lat, default=0.0), 1),
+        "rss_mb": {"start": samples[0]["rss_mb"] if samples else None,
+                   "end": samples[-1]["rss_mb"] if samples else None,
+                   "max": max((s["rss_mb"] for s in samples if s["rss_mb"] is not None), default=None)},
+        "rss_growth_mb_per_hour": round(growth, 2) if growth is not None else None,
+        "db_mb_max": max((s["db_mb"] for s in samples), default=0.0),
+        "wal_mb_max": max((s["wal_mb"] for s in samples), default=0.0),
+        "loop_lag_ms_max": max((s["loop_lag_ms"] for s in samples if s["loop_lag_ms"] is not None), default=None),
+        "peak_replies_per_s": max((s["replied_per_s"] for s in samples), default=0.0),
+        "fell_behind_at": {"t": behind["t"], "sent_per_s": behind["sent_per_s"]} if behind else None,
+    }
+
+async def _sample(api: MockBotAPI, bot: subprocess.Popen, db_path: str, metrics_ports: List[int],
+                  t: float, interval: float, counts: Dict[str, int]) -> Dict[str, Any]:
+    # Off the event loop: the mock keeps serving the bot while /proc and /metrics are read
+    metrics, rss = await asyncio.gather(asyncio.to_thread(scrape_bot, metrics_ports),
+                                        asyncio.to_thread(process_tree_rss, bot.pid))
+    lat = api.latency.take_interval()
+    sent, replied = api.injected - counts["sent"], api.replies - counts["replied"]
+    counts.update(sent=api.injected, replied=api.replies)
+    lag = metrics.get("edu_event_loop_lag_max_seconds")
+    return {
+        "t": round(t, 1), "interval_s": round(interval, 2),
+        "rss_mb": round(rss, 1) if rss is not None else None,
+        "db_mb": round(file_mb(db_path), 2), "wal_mb": round(file_mb(db_path + "-wal"), 2),
+        "loop_lag_ms": round(1000 * lag, 1) if lag is not None else None,
+        "reply_p50_ms": round(1000 * percentile(lat, 50), 1), "reply_p99_ms": round(1000 * percentile(lat, 99), 1),
+        "sent_per_s": round(sent / interval, 1), "replied_per_s": round(replied / interval, 1),
+        "outstanding": api.outstanding(), "shed": int(metrics.get("edu_updates_shed_total", 0)),
+    }
+
+async def soak(args, workdir: str) -> Dict[str, Any]:
+    api = MockBotAPI(port=args.mock_port)
+    await api.start()
+    db_path = os.path.join(workdir, "soak.db")
+    metrics_port = free_port()
+    # With worker processes each worker serves its own metrics on METRICS_PORT + 1 + index
+    metrics_ports = [metrics_port + 1 + k for k in range(args.workers)] if args.workers > 1 else [metrics_port]
+    env = dict(os.environ, DB_PATH=db_path, FAQ_INDEX_DIR=os.path.join(workdir, "faq_index"),
+               TELEGRAM_API_BASE_URL=api.base_url, BOT_MODE=args.mode,
+               METRICS_ENABLED="1", METRICS_PORT=str(metrics_port), METRICS_DUMP_PATH="",
+               WORKER_PROCESSES=str(args.workers), PYTHONUNBUFFERED="1")
+    if args.mode == "webhook":
+        port = free_port()
+        env.update(WEBHOOK_LISTEN="127.0.0.1", WEBHOOK_PORT=str(port), WEBHOOK_URL=f"http://127.0.0.1:{port}",
+                   WEBHOOK_SECRET_TOKEN=secrets.token_hex(16))
+    subprocess.run([sys.executable, "seed_data.py"], cwd=ROOT, env=env, check=True, capture_output=True)
+    log = open(os.path.join(workdir, "bot.log"), "w")
+    bot = subprocess.Popen([sys.executable, "chatbot_edu.py"], cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+    samples: List[Dict[str, Any]] = []
+    exit_code = None
+    try:
+        deadline = time.monotonic() + args.startup_timeout
+        while not (api.connected and (await asyncio.to_thread(scrape_bot, metrics_ports)).get("edu_ready")):
+            if bot.poll() is not None or time.monotonic() > deadline:
+                raise RuntimeError(f"bot did not come up (exit code {bot.returncode}); see {log.name}")
+            await asyncio.sleep(0.2)
+
+        load = LoadGenerator(api, args.rate, args.users, args.duration, args.ramp_to, args.seed)
+        load_task = asyncio.get_running_loop().create_task(load.run())
+        counts = {"sent": 0, "replied": 0}
+        t0 = last = time.monotonic()
+        drain_until = None
+        while True:
+            await asyncio.sleep(args.sample)
+            now = time.monotonic()
+            samples.append(await _sample(api, bot, db_path, metrics_ports, now - t0, now - last, counts))
+            last = now
+            if not args.quiet:
+                s = samples[-1]
+                print(f"[soak] t={s['t']:>7}s sent {s['sent_per_s']:>6}/s replied {s['replied_per_s']:>6}/s "
+                      f"backlog {s['outstanding']:>6} p99 {s['reply_p99_ms']:>8} ms lag {s['loop_lag_ms']} ms "
+                      f"rss {s['rss_mb']} MB wal {s['wal_mb']} MB", flush=True)
+            if bot.poll() is not None:
+                raise RuntimeError(f"bot exited early (code {bot.returncode}); see {log.name}")
+            if drain_until is None and load_task.done():
+                drain_until = now + args.drain
+            if drain_until is not None and (not api.outstanding() or now >= drain_until):
+                break
+    finally:
+        if bot.poll() is None:
+            bot.send_signal(signal.SIGTERM)
+            try:
+                exit_code = bot.wait(timeout=60)
+            except subprocess.TimeoutExpired:
+                bot.kill()
+                exit_code = bot.wait()
+        else:
+            exit_code = bot.returncode
+        log.close()
+        await api.stop()
+    return {
+        "config": {"mode": args.mode, "workers": args.workers, "rate": args.rate,
+                   "ramp_to": args.ramp_to, "users": args.users, "duration_s": args.duration},
+        "summary": dict(summarize(samples, api, args.warmup), bot_exit_code=exit_code, calls=dict(api.calls)),
+        "timeline": samples,
+    }
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--duration", type=parse_duration, default=parse_duration("10m"), help="load time, e.g. 600, 30m, 4h")
+    ap.add_argument("--rate", type=float, default=20, help="updates per second")
+    ap.add_argument("--ramp-to", type=float, help="ramp the rate linearly to this by the end of the run")
+    ap.add_argument("--users", type=int, default=200)
+    ap.add_argument("--mode", choices=["polling", "webhook"], default="polling")
+    ap.add_argument("--workers", type=int, default=0, help="WORKER_PROCESSES for the bot")
+    ap.add_argument("--sample", type=parse_duration, default=10.0, help="seconds between samples")
+    ap.add_argument("--warmup", type=parse_duration, default=60.0, help="samples before this are left out of RSS growth")
+    ap.add_argument("--drain", type=parse_duration, default=60.0, help="max seconds to wait for replies after the load")
+    ap.add_argument("--startup-timeout", type=parse_duration, default=120.0)
+    ap.add_argument("--mock-port", type=int, default=0, help="mock Bot API port (0 = any free one)")
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--report", default="soak_report.json")
+    ap.add_argument("--keep", action="store_true", help="keep the temporary DB and bot log")
+    ap.add_argument("--quiet", action="store_true")
+    args = ap.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="edu-soak-")
+    try:
+        report = asyncio.run(soak(args, workdir))
+    finally:
+        if args.keep:
+            print(f"[soak] DB and bot.log kept in {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+    with open(args.report, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(report["summary"], indent=2))
+    print(f"[soak] report written to {args.report}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Cold-start benchmark: how long until a fresh bot process can answer.
+
+Each run is a new Python process (so imports are really cold) that times the
+startup phases one after another:
+
+  import       import chatbot_edu (telegram, SQLAlchemy; the NLU is imported lazily)
+  db_init      init_db(): schema/trigger setup on the existing file
+  index_load   importing nlu and loading (or, without a saved index, fitting) the FAQ index
+  nlu_ready    the rest of the warm-up: intent rules, catalog, table watcher
+  first_turn   plan_reply() for a first FAQ question
+
+Scenarios: "prebuilt" (saved FAQ index, the normal deploy) and "no_index" (index
+directory removed before each run, e.g. first start after a fresh checkout).
+
+    python -m bench.startup --runs 5
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+PHASES = ("import", "db_init", "index_load", "nlu_ready", "first_turn")
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def child():
+    """Runs in the measured process; prints the phase timings as JSON."""
+    timings = {}
+    t0 = time.perf_counter()
+    import chatbot_edu
+    timings["import"] = time.perf_counter() - t0
+
+    t = time.perf_counter()
+    chatbot_edu.init_db()
+    timings["db_init"] = time.perf_counter() - t
+
+    t = time.perf_counter()
+    import faq_index
+    faq_index.load_or_build()
+    import nlu  # noqa: F401  (numpy/scipy side of the NLU)
+    timings["index_load"] = time.perf_counter() - t
+
+    t = time.perf_counter()
+    chatbot_edu.warm_up_nlu().result()
+    timings["nlu_ready"] = time.perf_counter() - t
+
+    t = time.perf_counter()
+    from session_store import SessionContext
+    chatbot_edu.plan_reply(chatbot_edu.nlu, "How do I book counseling?", SessionContext())
+    timings["first_turn"] = time.perf_counter() - t
+
+    timings["total"] = time.perf_counter() - t0
+    chatbot_edu.stop_table_watcher()
+    print(json.dumps(timings))
+
+def measure(env, drop_index: bool):
+    if drop_index:
+        shutil.rmtree(env["FAQ_INDEX_DIR"], ignore_errors=True)
+    out = subprocess.run([sys.executable, "-m", "bench.startup", "--child"], cwd=ROOT, env=env,
+                         capture_output=True, text=True, check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+def main():
+    ap = argparse.ArgumentParser(description="Break down bot start-up time.")
+    ap.add_argument("--runs", type=int, default=5)
+    ap.add_argument("--json", action="store_true", help="print the report as JSON")
+    ap.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+    if args.child:
+        child()
+        return
+
+    workdir = tempfile.mkdtemp(prefix="edu-startup-")
+    env = dict(os.environ, DB_PATH=os.path.join(workdir, "bench.db"),
+               FAQ_INDEX_DIR=os.path.join(workdir, "faq_index"))
+    try:
+        subprocess.run([sys.executable, "seed_data.py"], cwd=ROOT, env=env, check=True, capture_output=True)
+        report = {}
+        for scenario, drop in (("prebuilt", False), ("no_index", True)):
+            runs = [measure(env, drop) for _ in range(args.runs)]
+            report[scenario] = {k: round(1000 * statistics.median(r[k] for r in runs), 1)
+                                for k in PHASES + ("total",)}
+        if args.json:
+            print(json.dumps(report, indent=2))
+        else:
+            print(f"Start-up phases, median of {args.runs} fresh processes (ms):")
+            print(f"  {'phase':<12}" + "".join(f"{s:>12}" for s in report))
+            for k in PHASES + ("total",):
+                print(f"  {k:<12}" + "".join(f"{report[s][k]:>12}" for s in report))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+import threading
+from typing import Dict, List, Optional, Tuple
+import db
+from gazetteer import Gazetteer
+from refresher import TableWatcher
+
+TABLES = ("schedules", "deadlines")
+
+class Catalog:
+    """
+    In-memory snapshot of the schedules and deadlines tables.
+
+    Holds the latest schedule per course, the latest deadline per (course, assignment)
+    and the assignments each course has, so dialog turns need no queries. Snapshots
+    are immutable; refresh() builds a new one and swaps it in. Each snapshot carries
+    the gazetteer that finds its courses and assignments in message text.
+    """
+    def __init__(self, schedules: Dict[str, Dict[str, str]], deadlines: Dict[Tuple[str, str], Dict[str, str]],
+                 versions: Optional[Dict[str, int]] = None):
+        self._schedules = schedules
+        self._deadlines = deadlines
+        self._assignments: Dict[str, List[str]] = {}
+        for course, assignment in deadlines:
+            self._assignments.setdefault(course, []).append(assignment)
+        self._courses = sorted(set(schedules) | set(self._assignments))
+        self.versions = dict(versions or {})
+        self.gazetteer = Gazetteer.build({c: schedules.get(c, {}).get("title", "") for c in self._courses},
+                                         (a for _, a in deadlines))
+
+    @classmethod
+    def load(cls) -> "Catalog":
+        # Versions first: a write that lands during the load triggers another refresh
+        current = db.get_data_versions()
+        schedules: Dict[str, Dict[str, str]] = {}
+        for r in db.list_schedules():  # id order: later rows win, like ORDER BY id DESC LIMIT 1
+            schedules[r.course_code] = {"title": r.title or "", "details": r.details or ""}
+        deadlines: Dict[Tuple[str, str], Dict[str, str]] = {}
+        for r in db.list_deadlines():
+            deadlines[(r.course_code, r.assignment)] = {"due_at": r.due_at or "", "submit_to": r.submit_to or ""}
+        return cls(schedules, deadlines, {t: current.get(t, 0) for t in TABLES})
+
+    def schedule(self, course: str) -> Optional[Dict[str, str]]:
+        """Latest schedule info for a course."""
+        return self._schedules.get(course)
+
+    def deadline(self, course: str, assignment: str) -> Optional[Dict[str, str]]:
+        """Deadline info for (course, assignment)."""
+        return self._deadlines.get((course, assignment))
+
+    def assignments(self, course: str) -> List[str]:
+        """Assignments with a deadline for the course, in the order they were added."""
+        return list(self._assignments.get(course, ()))
+
+    def courses(self) -> List[str]:
+        """Every course code that has a schedule or a deadline."""
+        return list(self._courses)
+
+    def __contains__(self, course: str) -> bool:
+        return course in self._schedules or course in self._assignments
+
+    def __len__(self) -> int:
+        return len(self._courses)
+
+_catalog: Optional[Catalog] = None
+_catalog_lock = threading.Lock()
+
+def get_catalog() -> Catalog:
+    """Return the current catalog snapshot, loading it on first use."""
+    global _catalog
+    if _catalog is None:
+        with _catalog_lock:
+            if _catalog is None:
+                _catalog = Catalog.load()
+    return _catalog
+
+def refresh_catalog() -> Catalog:
+    """Reload from the DB and swap the new snapshot in."""
+    global _catalog
+    fresh = Catalog.load()
+    with _catalog_lock:
+        _catalog = fresh
+    return fresh
+
+def watch_changes(watcher: TableWatcher):
+    """Reload the catalog whenever schedules or deadlines change."""
+    watcher.watch(TABLES, lambda _versions: refresh_catalog(), get_catalog().versions)
@@ -1,33 +1,100 @@
-import asyncio, re
-from typing import Optional
+import asyncio, re, threading, time
+from concurrent.futures import Future
+from typing import TYPE_CHECKING, Optional
 from telegram import Update, ReplyKeyboardMarkup
 from telegram.ext import ApplicationBuilder, CommandHandler, MessageHandler, ContextTypes, filters
-from config import TELEGRAM_BOT_TOKEN
-from db import (
-    init_db, get_or_create_user, log_message, add_feedback, list_faqs,
+from config import (
+    TELEGRAM_BOT_TOKEN, TELEGRAM_API_BASE_URL, BOT_MODE, MAX_CONCURRENT_UPDATES, WORKER_PROCESSES,
+    ANSWER_CACHE_ENABLED, ADMIN_USERNAMES
+)
+from db import init_db, get_engine
+import db_async
+from db_async import (
+    get_or_create_user, log_message, add_feedback,
     get_session, save_session, reset_session
 )
-from nlu import NLU
-from dialog import resolve_slots, handle_intent
+from write_behind import close_log_buffer, get_log_buffer, has_log_buffer
+from session_store import SessionContext, close_session_store, get_session_store
+from refresher import get_table_watcher, stop_table_watcher
+from retention import start_retention, stop_retention
+from dispatcher import UserOrderedUpdateProcessor
+from webhook import run_webhook
+from sharding import run_sharded
+from dialog import resolve_slots, handle_intent, known_course, unknown_course_prompt
+import catalog
+from answer_cache import get_answer_cache, cache_key
+import metrics
+from metrics import span, observe_turn, count_fallback
+
+if TYPE_CHECKING:
+    from nlu import NLU  # imported lazily: it pulls in numpy
 
 MAIN_MENU = [["📚 FAQs", "🗓️ Schedule"], ["⏰ Deadlines", "📝 Feedback"], ["❓Help", "🔄 Reset"]]
-nlu: Optional[NLU] = None
+FAQ_PAGE_SIZE = 10
+FAQ_PAGE_RE = re.compile(r"^(?:📚\s*)?faqs?\s+(\d+)$", re.I)  # "FAQs 2" pages the FAQ menu
+BUSY_TEXT = "I'm handling a lot of questions right now. Please send that again in a minute. 🙏"
+nlu: Optional["NLU"] = None
+nlu_ready = threading.Event()  # set once the NLU is loaded; readiness for /readyz and metrics
+_nlu_future: Optional[Future] = None
+_nlu_future_lock = threading.Lock()
+
+def _load_nlu() -> "NLU":
+    from nlu import NLU
+    instance = NLU()
+    watcher = get_table_watcher()
+    instance.watch_changes(watcher)
+    catalog.watch_changes(watcher)
+    if ANSWER_CACHE_ENABLED:
+        get_answer_cache().watch_changes(watcher)  # after the NLU: clear once the new index is live
+    return instance
+
+def _warm_up():
+    global nlu
+    t0 = time.perf_counter()
+    nlu = _load_nlu()
+    nlu_ready.set()
+    print(f"[startup] NLU ready in {time.perf_counter() - t0:.2f}s")
+
+def _forget_failed_warm_up(fut: Future):
+    global _nlu_future
+    if fut.exception() is not None:
+        with _nlu_future_lock:
+            _nlu_future = None  # the next get_nlu() tries again
+
+def warm_up_nlu() -> Future:
+    """Start loading the NLU (DB reads + FAQ index) on the DB pool, once; returns its future."""
+    global _nlu_future
+    with _nlu_future_lock:
+        if _nlu_future is None:
+            _nlu_future = db_async.get_executor().submit(_warm_up)
+            _nlu_future.add_done_callback(_forget_failed_warm_up)
+        return _nlu_future
+
+async def get_nlu() -> "NLU":
+    """The NLU, waiting for the warm-up started at launch (or starting it) if needed."""
+    if nlu is None:
+        await asyncio.wrap_future(warm_up_nlu())
+    return nlu
 
-def format_faq_list():
-    rows = list_faqs()
-    if not rows:
+async def format_faq_list(page: int = 1):
+    faq = (await get_nlu()).faq
+    pages = max(1, -(-len(faq) // FAQ_PAGE_SIZE))
+    page = min(max(page, 1), pages)
+    items = faq.page((page - 1) * FAQ_PAGE_SIZE, FAQ_PAGE_SIZE)
+    if not items:
         return "No FAQs available yet."
-    top10 = rows[:10]
-    lines = ["📚 Sample FAQs:"]
-    for r in top10:
-        lines.append(f"• {r.question}")
+    lines = ["📚 Sample FAQs:" if page == 1 else f"📚 FAQs (page {page}/{pages}):"]
+    for _faq_id, question in items:
+        lines.append(f"• {question}")
+    if page < pages:
+        lines.append(f"\nSend “FAQs {page + 1}” for more.")
     return "\n".join(lines)
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
-    uid = get_or_create_user(user.id, user.first_name or "", user.last_name or "", user.username or "")
-    reset_session(uid)
-    log_message(uid, "in", "/start", "start", 1.0)
+    uid = await get_or_create_user(user.id, user.first_name or "", user.last_name or "", user.username or "")
+    await reset_session(uid)
+    await log_message(uid, "in", "/start", "start", 1.0)
     text = (
         "Hi, I'm your educational assistant 🤖\n"
         "I can help with course schedules, assignment deadlines, enrollment, tuition, and contacts.\n"
@@ -38,8 +105,8 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def help_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
-    uid = get_or_create_user(user.id, user.first_name or "", user.last_name or "", user.username or "")
-    log_message(uid, "in", "/help", "help", 1.0)
+    uid = await get_or_create_user(user.id, user.first_name or "", user.last_name or "", user.username or "")
+    await log_message(uid, "in", "/help", "help", 1.0)
     text = (
         "Multi-turn example:\n"
         "You: 158.780 what's this week?\n"
@@ -52,63 +119,39 @@ async def help_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def reset_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
-    uid = get_or_create_user(user.id, user.first_name or "", user.last_name or "", user.username or "")
-    reset_session(uid)
+    uid = await get_or_create_user(user.id, user.first_name or "", user.last_name or "", user.username or "")
+    await reset_session(uid)
     await update.message.reply_text("Context has been reset.")
 
-async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    global nlu
-    msg = update.message
-    if not msg: return
-    user = update.effective_user
-    uid = get_or_create_user(user.id, user.first_name or "", user.last_name or "", user.username or "")
-    text = (msg.text or "").strip()
-
-    # Menu actions
-    if text in ["📚 FAQs", "FAQs", "FAQ", "faqs"]:
-        log_message(uid, "in", text, "menu_faq", 1.0)
-        await msg.reply_text(format_faq_list()); return
-    if text in ["🗓️ Schedule", "Schedule", "schedule"]:
-        log_message(uid, "in", text, "menu_schedule", 1.0)
-        await msg.reply_text("Please tell me the course code (e.g., 158.780)."); return
-    if text in ["⏰ Deadlines", "Deadlines", "Deadline", "deadline"]:
-        log_message(uid, "in", text, "menu_deadline", 1.0)
-        await msg.reply_text("Please tell me the course code and assignment (e.g., 158.780 A1)."); return
-    if text in ["❓Help", "Help", "/help"]:
-        await help_cmd(update, context); return
-    if text in ["🔄 Reset", "/reset"]:
-        await reset_cmd(update, context); return
+class Reply:
+    """Outcome of one free-text turn: what to log and send, and the session to save."""
+    __slots__ = ("intent", "conf", "text", "log_text", "log_intent", "log_conf", "ctx", "faq_id")
 
-    # Feedback pattern: "<rating 1-5> <comment>"
-    if m := re.match(r"^\s*([1-5])\s+(.+)$", text):
-        rating, comment = int(m.group(1)), m.group(2)
-        add_feedback(uid, None, rating, comment)
-        log_message(uid, "in", text, "feedback", 1.0)
-        await msg.reply_text("Thanks! Your feedback has been recorded. 🙏")
-        return
+    def __init__(self, intent: Optional[str], conf: float, text: str, log_text: str,
+                 log_intent: Optional[str], log_conf: float, ctx: Optional[SessionContext],
+                 faq_id: Optional[int] = None):
+        self.intent, self.conf = intent, conf  # NLU result, logged with the incoming message
+        self.text = text  # sent to the user
+        self.log_text, self.log_intent, self.log_conf = log_text, log_intent, log_conf  # outgoing log (skipped if no intent)
+        self.ctx = ctx  # session to save, or None to leave it untouched
+        self.faq_id = faq_id  # FAQ answered, for feedback attribution
 
-    # NLU
-    if nlu is None:
-        nlu = NLU()
+def plan_reply(nlu: "NLU", text: str, ctx: SessionContext) -> Reply:
+    """
+    Run NLU and the dialog logic for one message.
+    Only reads the DB, so the result depends on (text, ctx) and the data tables alone.
+    """
+    ctx = ctx.copy()
     intent, faq_id, conf, ents = nlu.analyze(text)
-    mid = log_message(uid, "in", text, intent, conf)
-
-    # Load session context
-    ctx = get_session(uid)
 
     # Direct FAQ answer if matched
     if intent == "faq" and faq_id is not None:
-        rows = list_faqs()
-        faq_map = {int(r.id): r for r in rows}
-        r = faq_map.get(faq_id)
-        answer = r.answer if r else "Sorry, I couldn't find a suitable answer."
-        log_message(uid, "out", answer, "faq", conf)
-        await msg.reply_text(f"[Possible answer] (confidence {conf:.2f})\n{answer}")
+        answer = nlu.faq.answer(faq_id) or "Sorry, I couldn't find a suitable answer."
         # Lightly update last-course/assignment if extracted
-        if ents.get("course"): ctx["last_course"] = ents["course"]
+        if known_course(ents.get("course")): ctx["last_course"] = ents["course"]
         if ents.get("assignment"): ctx["last_assignment"] = ents["assignment"]
-        save_session(uid, ctx)
-        return
+        return Reply(intent, conf, f"[Possible answer] (confidence {conf:.2f})\n{answer}", answer, "faq", conf, ctx,
+                     faq_id)
 
     # Business intents or continuation via pending_intent
     current_intent = intent or ctx.get("pending_intent")
@@ -118,33 +161,31 @@ async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
             # Persist pending intent and partial slots
             ctx["pending_intent"] = current_intent
             ctx["slots"] = merged_slots
-            save_session(uid, ctx)
-            log_message(uid, "out", prompt, "ask_slot", 1.0)
-            await msg.reply_text(prompt); return
+            return Reply(intent, conf, prompt, prompt, "ask_slot", 1.0, ctx)
         # All slots are ready; execute
-        reply = handle_intent(ctx, current_intent, merged_slots)
-        log_message(uid, "out", reply, current_intent, 1.0)
-        await msg.reply_text(reply)
+        with span("handle_intent"):
+            reply = handle_intent(ctx, current_intent, merged_slots)
         # Update memory
         if merged_slots.get("course"): ctx["last_course"] = merged_slots["course"]
         if merged_slots.get("assignment"): ctx["last_assignment"] = merged_slots["assignment"]
         # Clear pending intent/slots for a fresh turn next time
         ctx["pending_intent"] = None
         ctx["slots"] = {}
-        save_session(uid, ctx)
-        return
+        return Reply(intent, conf, reply, reply, current_intent, 1.0, ctx)
 
     # If we have entities but no intent, try guiding the user
     if ents.get("course") or ents.get("assignment"):
         if ents.get("course") and not ents.get("assignment"):
-            ctx["last_course"] = ents["course"]
             ctx["pending_intent"] = None
             ctx["slots"] = {}
-            save_session(uid, ctx)
+            if not known_course(ents["course"]):
+                # Not remembered: it would be inherited (and rejected) by every later turn
+                prompt = unknown_course_prompt(ents["course"])
+                return Reply(intent, conf, prompt, prompt, "ask_slot", 1.0, ctx)
+            ctx["last_course"] = ents["course"]
             reply = ("Course code received. Do you want the schedule 🗓️ or an assignment deadline ⏰?\n"
                      "Reply with “Schedule” or “Deadlines”, or ask directly like “A1 deadline?”.")
-            log_message(uid, "out", reply, "clarify_next", 1.0)
-            await msg.reply_text(reply); return
+            return Reply(intent, conf, reply, reply, "clarify_next", 1.0, ctx)
         if ents.get("assignment") and ctx.get("last_course"):
             # Auto-convert to a deadline query
             current_intent = "deadline"
@@ -152,16 +193,13 @@ async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
             if missing:
                 ctx["pending_intent"] = current_intent
                 ctx["slots"] = merged_slots
-                save_session(uid, ctx)
-                await msg.reply_text(prompt); return
-            reply = handle_intent(ctx, current_intent, merged_slots)
-            log_message(uid, "out", reply, current_intent, 1.0)
-            await msg.reply_text(reply)
+                return Reply(intent, conf, prompt, prompt, None, 1.0, ctx)
+            with span("handle_intent"):
+                reply = handle_intent(ctx, current_intent, merged_slots)
             if merged_slots.get("assignment"): ctx["last_assignment"] = merged_slots["assignment"]
             ctx["pending_intent"] = None
             ctx["slots"] = {}
-            save_session(uid, ctx)
-            return
+            return Reply(intent, conf, reply, reply, current_intent, 1.0, ctx)
 
     # Fallback
     fallback = (
@@ -170,24 +208,172 @@ async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "• Or ask directly: 158.780 A1 deadline?\n"
         "• Send “FAQs” to see examples."
     )
-    log_message(uid, "out", fallback, "fallback", 0.0)
-    await msg.reply_text(fallback)
+    return Reply(intent, conf, fallback, fallback, "fallback", 0.0, None)
+
+async def stats_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Admin-only runtime counters."""
+    user = update.effective_user
+    if not user or (user.username or "") not in ADMIN_USERNAMES:
+        return
+    st = get_answer_cache().stats()
+    lines = [f"Answer cache: {st['size']} entries, {st['hits']} hits / {st['misses']} misses "
+             f"({st['hit_rate']:.1%}), {st['evictions']} evictions, {st['invalidations']} invalidations"]
+    processor = context.application.update_processor
+    if isinstance(processor, UserOrderedUpdateProcessor):
+        q = processor.stats()
+        shed = ", ".join(f"{n} {reason}" for reason, n in q["shed"].items())
+        lines.append(f"Updates: {q['running']} running, {q['waiting']} waiting (peak {q['max_waiting']}), "
+                     f"shed: {shed}")
+    await update.message.reply_text("\n".join(lines))
+
+async def busy_reply(update: object, reason: str):
+    """Canned reply for an update the dispatcher sheds under load: no DB, NLU or logging."""
+    if isinstance(update, Update) and update.effective_message:
+        await update.effective_message.reply_text(BUSY_TEXT)
+
+async def send(msg, text: str, **kwargs):
+    with span("reply"):
+        await msg.reply_text(text, **kwargs)
+
+async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    t0 = time.perf_counter()
+    label = await _handle_text(update, context)
+    observe_turn(label, time.perf_counter() - t0)
+
+async def _handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Optional[str]:
+    """Handle one text message; returns the turn's label for metrics."""
+    msg = update.message
+    if not msg: return None
+    user = update.effective_user
+    uid = await get_or_create_user(user.id, user.first_name or "", user.last_name or "", user.username or "")
+    text = (msg.text or "").strip()
+
+    # Menu actions
+    if text in ["📚 FAQs", "FAQs", "FAQ", "faqs"]:
+        await log_message(uid, "in", text, "menu_faq", 1.0)
+        await send(msg, await format_faq_list()); return "menu_faq"
+    if m := FAQ_PAGE_RE.match(text):
+        await log_message(uid, "in", text, "menu_faq", 1.0)
+        await send(msg, await format_faq_list(int(m.group(1)))); return "menu_faq"
+    if text in ["🗓️ Schedule", "Schedule", "schedule"]:
+        await log_message(uid, "in", text, "menu_schedule", 1.0)
+        await send(msg, "Please tell me the course code (e.g., 158.780)."); return "menu_schedule"
+    if text in ["⏰ Deadlines", "Deadlines", "Deadline", "deadline"]:
+        await log_message(uid, "in", text, "menu_deadline", 1.0)
+        await send(msg, "Please tell me the course code and assignment (e.g., 158.780 A1)."); return "menu_deadline"
+    if text in ["❓Help", "Help", "/help"]:
+        await help_cmd(update, context); return "help"
+    if text in ["🔄 Reset", "/reset"]:
+        await reset_cmd(update, context); return "reset"
+
+    # Feedback pattern: "<rating 1-5> <comment>"
+    if m := re.match(r"^\s*([1-5])\s+(.+)$", text):
+        rating, comment = int(m.group(1)), m.group(2)
+        ctx = await get_session(uid)  # rates the last reply the bot logged for this user
+        await add_feedback(uid, ctx.last_reply_id, rating, comment, ctx.last_reply_intent, ctx.last_faq_id)
+        await log_message(uid, "in", text, "feedback", 1.0)
+        await send(msg, "Thanks! Your feedback has been recorded. 🙏")
+        return "feedback"
+
+    # NLU + dialog; repeated questions in the same session state are served from the cache
+    ctx = await get_session(uid)
+    cache = get_answer_cache() if ANSWER_CACHE_ENABLED else None
+    reply = cache.get(cache_key(text, ctx)) if cache is not None else None
+    if reply is None:
+        generation = cache.generation if cache is not None else 0
+        nlu_ = await get_nlu()
+        with span("plan_reply"):
+            reply = await db_async.run(plan_reply, nlu_, text, ctx)
+        if cache is not None:
+            cache.put(cache_key(text, ctx), reply, generation)
+
+    await log_message(uid, "in", text, reply.intent, reply.conf)
+    reply_id = await log_message(uid, "out", reply.log_text, reply.log_intent, reply.log_conf) if reply.log_intent else None
+    if reply.ctx is not None or reply_id is not None:
+        # A cached reply's session may come from another user: copy it, keeping this user's last reply
+        new_ctx = (reply.ctx if reply.ctx is not None else ctx).copy()
+        if reply_id is not None:
+            new_ctx.last_reply_id, new_ctx.last_reply_intent, new_ctx.last_faq_id = reply_id, reply.log_intent, reply.faq_id
+        else:
+            new_ctx.last_reply_id, new_ctx.last_reply_intent, new_ctx.last_faq_id = (
+                ctx.last_reply_id, ctx.last_reply_intent, ctx.last_faq_id)
+        await save_session(uid, new_ctx)
+    await send(msg, reply.text)
+    if reply.log_intent == "fallback":
+        count_fallback()
+    return reply.log_intent or reply.intent
 
 async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE) -> None:
     print(f"Exception: {context.error}")
 
 # --- keep all your imports and handlers above unchanged ---
 
-def main():
-    init_db()
-    app = ApplicationBuilder().token(TELEGRAM_BOT_TOKEN).build()
+def setup_metrics(port: int = metrics.METRICS_PORT, dump_path: str = metrics.METRICS_DUMP_PATH):
+    """Count DB commits, expose cache/buffer gauges and start the /metrics endpoint or dump."""
+    if not metrics.METRICS_ENABLED:
+        return
+    metrics.instrument_engine(get_engine())
+    cache = get_answer_cache()
+    metrics.add_gauge("edu_answer_cache_hits", "Answer cache hits", lambda: cache.hits)
+    metrics.add_gauge("edu_answer_cache_misses", "Answer cache misses", lambda: cache.misses)
+    metrics.add_gauge("edu_answer_cache_entries", "Answer cache size", lambda: len(cache))
+    metrics.add_gauge("edu_sessions_cached", "Sessions held in memory", lambda: len(get_session_store()))
+    metrics.add_gauge("edu_ready", "1 once the NLU is loaded and turns are answered without waiting",
+                      lambda: 1.0 if nlu_ready.is_set() else 0.0)
+    metrics.add_gauge("edu_log_rows_pending", "Log rows waiting for the next flush",
+                      lambda: get_log_buffer().pending() if has_log_buffer() else 0)
+    metrics.add_gauge("edu_log_rows_dropped", "Log rows dropped because the write-behind queue was full",
+                      lambda: get_log_buffer().dropped if has_log_buffer() else 0)
+    metrics.add_gauge("edu_log_rows_dead_lettered", "Log rows that failed on their own and were set aside",
+                      lambda: get_log_buffer().dead_lettered if has_log_buffer() else 0)
+    metrics.start_exporters(port, dump_path)
+
+async def on_startup(app) -> None:
+    metrics.watch_loop_lag()
+
+async def on_shutdown(app) -> None:
+    metrics.stop_loop_lag()
+    metrics.stop_exporters()
+    stop_table_watcher()
+    stop_retention()
+    close_log_buffer()
+    close_session_store()
+    db_async.shutdown()
+
+def build_application(with_updater: bool = True):
+    builder = (
+        ApplicationBuilder()
+        .token(TELEGRAM_BOT_TOKEN)
+        .base_url(TELEGRAM_API_BASE_URL)
+        .concurrent_updates(UserOrderedUpdateProcessor(MAX_CONCURRENT_UPDATES, on_shed=busy_reply))
+        .post_init(on_startup)
+        .post_shutdown(on_shutdown)
+    )
+    if not with_updater:
+        builder = builder.updater(None)  # updates are fed in by a sharding front process
+    app = builder.build()
     app.add_handler(CommandHandler("start", start))
     app.add_handler(CommandHandler("help", help_cmd))
     app.add_handler(CommandHandler("reset", reset_cmd))
+    app.add_handler(CommandHandler("stats", stats_cmd))
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_text))
     app.add_error_handler(error_handler)
-    # IMPORTANT: synchronous/blocking; no asyncio.run needed
-    app.run_polling()  # remove close_loop, no await here
+    return app
+
+def main():
+    init_db()
+    if WORKER_PROCESSES > 1:
+        run_sharded(WORKER_PROCESSES)  # the writer process runs the retention job
+        return
+    start_retention()
+    warm_up_nlu()  # loads while the application connects; early turns wait for it
+    setup_metrics()
+    app = build_application()
+    if BOT_MODE == "webhook":
+        run_webhook(app, ready=nlu_ready.is_set)
+    else:
+        # IMPORTANT: synchronous/blocking; no asyncio.run needed
+        app.run_polling()  # remove close_loop, no await here
 
 if __name__ == "__main__":
     main()
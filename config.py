@@ -9,8 +9,120 @@ TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN", "8311177614:AAGa_81VEf6EaUe
 # SQLite file path
 DB_PATH = os.getenv("DB_PATH", "db/edu_chatbot.db")
 
+# SQLite connection pool (one shared engine per process)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+
+# SQLite pragmas applied to every new connection
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))  # bytes
+SQLITE_CACHE_SIZE = int(os.getenv("SQLITE_CACHE_SIZE", "-65536"))  # negative = KiB, positive = pages
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+
+# Async access: size of the dedicated DB thread pool and max updates handled at once
+DB_THREADS = int(os.getenv("DB_THREADS", "4"))
+MAX_CONCURRENT_UPDATES = int(os.getenv("MAX_CONCURRENT_UPDATES", "32"))
+# Admission control: an update is answered with a short "busy" reply instead of being handled
+# when MAX_PENDING_UPDATES updates already wait for a handler, when its user already has
+# MAX_USER_PENDING updates queued or running, or when it waited over MAX_QUEUE_WAIT seconds
+# (0 = no limit)
+MAX_PENDING_UPDATES = int(os.getenv("MAX_PENDING_UPDATES", "1000"))
+MAX_USER_PENDING = int(os.getenv("MAX_USER_PENDING", "5"))
+MAX_QUEUE_WAIT = float(os.getenv("MAX_QUEUE_WAIT", "30"))
+
+# Write-behind message/feedback log: flush after this many rows or seconds, whichever comes first
+LOG_BUFFER_ENABLED = os.getenv("LOG_BUFFER_ENABLED", "1") == "1"
+LOG_FLUSH_MAX_ROWS = int(os.getenv("LOG_FLUSH_MAX_ROWS", "200"))
+LOG_FLUSH_INTERVAL = float(os.getenv("LOG_FLUSH_INTERVAL", "1.0"))
+# A batch that fails this many flushes in a row is retried row by row; rows that still fail
+# are appended to LOG_DEAD_LETTER_PATH (JSONL; "" = drop them). At most LOG_BUFFER_MAX_PENDING
+# rows are queued; beyond that the oldest are dropped (and counted)
+LOG_FLUSH_MAX_RETRIES = int(os.getenv("LOG_FLUSH_MAX_RETRIES", "3"))
+LOG_DEAD_LETTER_PATH = os.getenv("LOG_DEAD_LETTER_PATH", "db/log_dead_letter.jsonl")
+LOG_BUFFER_MAX_PENDING = int(os.getenv("LOG_BUFFER_MAX_PENDING", "100000"))
+
+# In-memory session cache with write-back to the sessions table
+SESSION_CACHE_ENABLED = os.getenv("SESSION_CACHE_ENABLED", "1") == "1"
+SESSION_CACHE_MAX = int(os.getenv("SESSION_CACHE_MAX", "10000"))  # entries kept in memory
+SESSION_TTL = float(os.getenv("SESSION_TTL", "1800"))  # seconds idle before eviction
+SESSION_FLUSH_INTERVAL = float(os.getenv("SESSION_FLUSH_INTERVAL", "2.0"))
+SESSION_FLUSH_MAX_DIRTY = int(os.getenv("SESSION_FLUSH_MAX_DIRTY", "200"))
+
+# Telegram id -> internal user id cache (entries)
+USER_CACHE_MAX = int(os.getenv("USER_CACHE_MAX", "50000"))
+
+# Precomputed FAQ index (built by `python faq_index.py`, memory-mapped at startup)
+FAQ_INDEX_DIR = os.getenv("FAQ_INDEX_DIR", "db/faq_index")
+
+# FAQ retrieval backend: "tfidf" (word TF-IDF above), "dense" (LSA vectors over character
+# n-grams, searched via IVF cells) or "hybrid" (dense fused with BM25, FAQ_HYBRID_ALPHA on dense).
+# The dense index is built by `python dense_index.py` into FAQ_DENSE_DIR.
+FAQ_RETRIEVER = os.getenv("FAQ_RETRIEVER", "tfidf").lower()
+FAQ_DENSE_DIR = os.getenv("FAQ_DENSE_DIR", FAQ_INDEX_DIR + "_dense")
+DENSE_DIM = int(os.getenv("DENSE_DIM", "128"))
+DENSE_NPROBE = int(os.getenv("DENSE_NPROBE", "8"))  # IVF cells scanned per query
+FAQ_HYBRID_ALPHA = float(os.getenv("FAQ_HYBRID_ALPHA", "0.5"))
+
+# How often (seconds) to poll data_versions for edits to cached tables (FAQs, ...)
+DATA_REFRESH_INTERVAL = float(os.getenv("DATA_REFRESH_INTERVAL", "5.0"))
+
+# Cache of computed replies for repeated questions (entries / seconds)
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "1") == "1"
+ANSWER_CACHE_MAX = int(os.getenv("ANSWER_CACHE_MAX", "5000"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "300"))
+
+# Per-stage latency metrics: Prometheus text on localhost:METRICS_PORT/metrics (0 = off)
+# and/or written to METRICS_DUMP_PATH every METRICS_DUMP_INTERVAL seconds
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "0") == "1"
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))
+METRICS_DUMP_PATH = os.getenv("METRICS_DUMP_PATH", "")
+METRICS_DUMP_INTERVAL = float(os.getenv("METRICS_DUMP_INTERVAL", "60"))
+# Event-loop lag probe: how late a sleep of this many seconds wakes up
+METRICS_LOOP_LAG_INTERVAL = float(os.getenv("METRICS_LOOP_LAG_INTERVAL", "0.25"))
+
+# How updates arrive: "polling" (getUpdates long-poll) or "webhook" (built-in HTTP server)
+BOT_MODE = os.getenv("BOT_MODE", "polling").lower()
+# Bot API endpoint; point at a local stub to run the bot fully offline
+TELEGRAM_API_BASE_URL = os.getenv("TELEGRAM_API_BASE_URL", "https://api.telegram.org/bot")
+
+# Webhook mode: listen address/path; if WEBHOOK_URL (public https base) is set, setWebhook is
+# called at startup. Requests must carry WEBHOOK_SECRET_TOKEN in X-Telegram-Bot-Api-Secret-Token.
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+WEBHOOK_SECRET_TOKEN = os.getenv("WEBHOOK_SECRET_TOKEN", "")
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))  # Telegram-side parallelism
+WEBHOOK_MAX_BODY = int(os.getenv("WEBHOOK_MAX_BODY", str(1024 * 1024)))  # bytes
+
+# Multi-process mode: >1 routes updates by user to this many worker processes,
+# with one writer process doing all DB writes (0/1 = single process)
+WORKER_PROCESSES = int(os.getenv("WORKER_PROCESSES", "0"))
+WORKER_STOP_TIMEOUT = float(os.getenv("WORKER_STOP_TIMEOUT", "30"))  # seconds to drain on shutdown before terminating
+
+# Message log retention: rows older than RETENTION_DAYS (0 = keep forever) are moved to
+# date-partitioned Parquet files under ARCHIVE_DIR every RETENTION_INTERVAL seconds,
+# RETENTION_BATCH rows per delete transaction
+RETENTION_DAYS = float(os.getenv("RETENTION_DAYS", "0"))
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "db/archive")
+ARCHIVE_COMPRESSION = os.getenv("ARCHIVE_COMPRESSION", "zstd")
+RETENTION_INTERVAL = float(os.getenv("RETENTION_INTERVAL", "3600"))
+RETENTION_BATCH = int(os.getenv("RETENTION_BATCH", "5000"))
+
 # Similarity threshold for FAQ matching (0~1)
 FAQ_SIM_THRESHOLD = float(os.getenv("FAQ_SIM_THRESHOLD", "0.33"))
+# Same for the dense and hybrid retrievers, whose scores are on other scales: set just above the
+# p95 top-1 score of unanswerable queries in `python -m bench.retrieval` (dense ~0.25, hybrid ~0.15
+# on 3k-20k FAQ banks). Dense right and wrong answers score alike on large banks, so no
+# threshold makes dense alone precise there; prefer tfidf or hybrid.
+FAQ_DENSE_THRESHOLD = float(os.getenv("FAQ_DENSE_THRESHOLD", "0.28"))
+FAQ_HYBRID_THRESHOLD = float(os.getenv("FAQ_HYBRID_THRESHOLD", "0.18"))
+
+# Course/assignment names in messages: words at least this long are matched with one typo
+# allowed (0 = exact matches only)
+ENTITY_FUZZY_MIN_LEN = int(os.getenv("ENTITY_FUZZY_MIN_LEN", "5"))
 
 # Admin usernames (optional, for future features like escalation)
 ADMIN_USERNAMES = [u.strip() for u in os.getenv("ADMIN_USERNAMES", "").split(",") if u.strip()]
@@ -1,12 +1,59 @@
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine, event, text
 from sqlalchemy.engine import Engine, Row
-from typing import List, Optional, Dict, Any
+from sqlalchemy.pool import QueuePool
+from typing import List, Optional, Dict, Any, Iterator
 import json
-from config import DB_PATH
+import os
+import threading
+import time
+from config import (
+    DB_PATH, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT,
+    SQLITE_JOURNAL_MODE, SQLITE_SYNCHRONOUS, SQLITE_MMAP_SIZE, SQLITE_CACHE_SIZE, SQLITE_BUSY_TIMEOUT_MS
+)
+
+SCHEMA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "schema.sql")
+
+_engine: Optional[Engine] = None
+_engine_lock = threading.Lock()
+
+def _apply_pragmas(dbapi_conn, _record):
+    """Configure every new SQLite connection once, when the pool opens it."""
+    cur = dbapi_conn.cursor()
+    try:
+        cur.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+        cur.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+        cur.execute(f"PRAGMA mmap_size={int(SQLITE_MMAP_SIZE)}")
+        cur.execute(f"PRAGMA cache_size={int(SQLITE_CACHE_SIZE)}")
+        cur.execute(f"PRAGMA busy_timeout={int(SQLITE_BUSY_TIMEOUT_MS)}")
+    finally:
+        cur.close()
 
 def get_engine() -> Engine:
-    """Create a SQLAlchemy engine connected to the SQLite file."""
-    return create_engine(f"sqlite:///{DB_PATH}", future=True)
+    """Return the process-wide SQLAlchemy engine, creating it on first use."""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                engine = create_engine(
+                    f"sqlite:///{DB_PATH}",
+                    future=True,
+                    poolclass=QueuePool,
+                    pool_size=DB_POOL_SIZE,
+                    max_overflow=DB_MAX_OVERFLOW,
+                    pool_timeout=DB_POOL_TIMEOUT,
+                    connect_args={"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000},
+                )
+                event.listen(engine, "connect", _apply_pragmas)
+                _engine = engine
+    return _engine
+
+def dispose_engine():
+    """Close all pooled connections (e.g. on shutdown or after fork); the next call reconnects."""
+    global _engine
+    with _engine_lock:
+        if _engine is not None:
+            _engine.dispose()
+            _engine = None
 
 def init_db():
     """
@@ -14,7 +61,7 @@ def init_db():
     which supports multiple statements in a single call.
     """
     engine = get_engine()
-    with open("schema.sql", "r", encoding="utf-8") as f:
+    with open(SCHEMA_PATH, "r", encoding="utf-8") as f:
         sql = f.read()
 
     # Use a SQLAlchemy connection to get the raw DB-API connection
@@ -23,20 +70,42 @@ def init_db():
         raw = conn.connection.driver_connection  # <-- DB-API sqlite3.Connection
         raw.executescript(sql)  # executes multiple statements safely
 
-def get_or_create_user(tg_user_id: int, first_name: str = "", last_name: str = "", username: str = "") -> int:
-    """Fetch existing internal user ID by Telegram user ID, or create a new record."""
+def find_user(tg_user_id: int) -> Optional[Row]:
+    """Return (id, first_name, last_name, username) for a Telegram user ID, if known."""
     engine = get_engine()
     with engine.begin() as conn:
-        row = conn.execute(text("SELECT id FROM users WHERE tg_user_id=:tid"), {"tid": tg_user_id}).fetchone()
-        if row:
-            return int(row[0])
-        conn.execute(text("""
+        return conn.execute(text("""
+            SELECT id, first_name, last_name, username FROM users WHERE tg_user_id=:tid
+        """), {"tid": tg_user_id}).fetchone()
+
+def upsert_user(tg_user_id: int, first_name: str = "", last_name: str = "", username: str = "") -> int:
+    """Insert a user or refresh their profile fields, returning the internal user ID in one statement."""
+    engine = get_engine()
+    with engine.begin() as conn:
+        uid = conn.execute(text("""
             INSERT INTO users (tg_user_id, first_name, last_name, username)
             VALUES (:tid, :fn, :ln, :un)
-        """), {"tid": tg_user_id, "fn": first_name, "ln": last_name, "un": username})
-        uid = conn.execute(text("SELECT last_insert_rowid()")).scalar_one()
+            ON CONFLICT(tg_user_id) DO UPDATE SET
+                first_name=excluded.first_name, last_name=excluded.last_name, username=excluded.username
+            RETURNING id
+        """), {"tid": tg_user_id, "fn": first_name, "ln": last_name, "un": username}).scalar_one()
         return int(uid)
 
+def get_or_create_user(tg_user_id: int, first_name: str = "", last_name: str = "", username: str = "") -> int:
+    """Fetch existing internal user ID by Telegram user ID, or create a new record.
+    Profile fields are only written when they differ from the stored ones."""
+    row = find_user(tg_user_id)
+    if row is None:
+        return upsert_user(tg_user_id, first_name, last_name, username)
+    if (row.first_name or "", row.last_name or "", row.username or "") != (first_name, last_name, username):
+        # Plain UPDATE: an upsert would burn an AUTOINCREMENT value on an existing row
+        engine = get_engine()
+        with engine.begin() as conn:
+            conn.execute(text("""
+                UPDATE users SET first_name=:fn, last_name=:ln, username=:un WHERE id=:id
+            """), {"fn": first_name, "ln": last_name, "un": username, "id": row.id})
+    return int(row.id)
+
 def log_message(user_id: int, direction: str, text_: str, intent: Optional[str], conf: Optional[float]) -> int:
     """Append a message record (in/out) to the log."""
     engine = get_engine()
@@ -46,16 +115,94 @@ def log_message(user_id: int, direction: str, text_: str, intent: Optional[str],
             VALUES (:uid, :dir, :tx, :it, :cf)
         """), {"uid": user_id, "dir": direction, "tx": text_, "it": intent, "cf": conf})
         mid = conn.execute(text("SELECT last_insert_rowid()")).scalar_one()
+        _update_rollups(conn, [{"dir": direction, "it": intent, "cf": conf}], [])
         return int(mid)
 
-def add_feedback(user_id: int, message_id: Optional[int], rating: int, comment: str):
-    """Insert a feedback record for a user/message."""
+def add_feedback(user_id: int, message_id: Optional[int], rating: int, comment: str,
+                 reply_intent: Optional[str] = None, faq_id: Optional[int] = None):
+    """Insert a feedback record for a user/message; reply_intent/faq_id describe the rated reply (rollups only)."""
     engine = get_engine()
     with engine.begin() as conn:
         conn.execute(text("""
             INSERT INTO feedback (user_id, message_id, rating, comment)
             VALUES (:uid, :mid, :rt, :cm)
         """), {"uid": user_id, "mid": message_id, "rt": rating, "cm": comment})
+        _update_rollups(conn, [], [{"rt": rating, "ri": reply_intent, "fq": faq_id}])
+
+def last_message_id() -> int:
+    """Highest message id ever handed out (AUTOINCREMENT ids are never reused)."""
+    engine = get_engine()
+    with engine.begin() as conn:
+        seq = conn.execute(text("SELECT seq FROM sqlite_sequence WHERE name='messages'")).scalar()
+        top = conn.execute(text("SELECT MAX(id) FROM messages")).scalar()
+        return int(max(seq or 0, top or 0))
+
+def first_message_id() -> Optional[int]:
+    """Lowest message id still in the table (None when it is empty)."""
+    engine = get_engine()
+    with engine.begin() as conn:
+        return conn.execute(text("SELECT MIN(id) FROM messages")).scalar()
+
+def write_log_batch(messages: List[Dict[str, Any]], feedback: List[Dict[str, Any]]):
+    """Insert buffered message and feedback rows with executemany in a single transaction."""
+    if not messages and not feedback:
+        return
+    engine = get_engine()
+    with engine.begin() as conn:
+        if messages:
+            conn.execute(text("""
+                INSERT INTO messages (id, user_id, direction, text, intent, confidence, created_at)
+                VALUES (:id, :uid, :dir, :tx, :it, :cf, :ts)
+            """), messages)
+        if feedback:
+            conn.execute(text("""
+                INSERT INTO feedback (user_id, message_id, rating, comment, created_at)
+                VALUES (:uid, :mid, :rt, :cm, :ts)
+            """), feedback)
+        _update_rollups(conn, messages, feedback)
+
+def iter_messages(direction: Optional[str] = "in", since: Optional[str] = None, until: Optional[str] = None,
+                  chunk_size: int = 5000) -> Iterator[Row]:
+    """Stream logged messages (id, user_id, direction, text, intent, confidence, created_at) in id order.
+    Reads in keyset-paginated chunks so huge logs never sit in memory or hold a long read transaction."""
+    engine = get_engine()
+    where = ["id > :after"]
+    params: Dict[str, Any] = {"lim": chunk_size}
+    if direction:
+        where.append("direction = :dir"); params["dir"] = direction
+    if since:
+        where.append("created_at >= :since"); params["since"] = since
+    if until:
+        where.append("created_at < :until"); params["until"] = until
+    sql = text(f"""
+        SELECT id, user_id, direction, text, intent, confidence, created_at FROM messages
+        WHERE {" AND ".join(where)} ORDER BY id LIMIT :lim
+    """)
+    after = 0
+    while True:
+        with engine.begin() as conn:
+            rows = conn.execute(sql, {**params, "after": after}).fetchall()
+        yield from rows
+        if len(rows) < chunk_size:
+            return
+        after = rows[-1].id
+
+def oldest_messages(before: str, limit: int) -> List[Row]:
+    """The `limit` lowest-id messages created before `before` (retention batches)."""
+    engine = get_engine()
+    with engine.begin() as conn:
+        return conn.execute(text("""
+            SELECT id, user_id, direction, text, intent, confidence, created_at FROM messages
+            WHERE created_at < :before ORDER BY id LIMIT :lim
+        """), {"before": before, "lim": limit}).fetchall()
+
+def delete_messages(first_id: int, last_id: int, before: str) -> int:
+    """Delete the messages of one retention batch (same predicate as oldest_messages)."""
+    engine = get_engine()
+    with engine.begin() as conn:
+        return conn.execute(text("""
+            DELETE FROM messages WHERE id BETWEEN :lo AND :hi AND created_at < :before
+        """), {"lo": first_id, "hi": last_id, "before": before}).rowcount
 
 def list_faqs() -> List[Row]:
     """Return all FAQs (id, question, answer, tags)."""
@@ -73,10 +220,150 @@ def upsert_intent(name: str, patterns_json: str):
         """), {"n": name, "p": patterns_json})
 
 def get_intents() -> List[Row]:
-    """Fetch all intents with their pattern JSON."""
+    """Fetch all intents with their pattern JSON, in priority (insertion) order."""
+    engine = get_engine()
+    with engine.begin() as conn:
+        return conn.execute(text("SELECT name, patterns FROM intents ORDER BY id")).fetchall()
+
+# ---------------- Analytics rollups ----------------
+
+def _hour(ts: Optional[str]) -> str:
+    # Rows without a timestamp get CURRENT_TIMESTAMP, i.e. now (UTC)
+    return (ts or time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime()))[:13] + ":00:00"
+
+def _confidence_bucket(conf: float) -> int:
+    return min(max(int(conf * 10), 0), 9)  # same as the CAST in rebuild_rollups()
+
+def _update_rollups(conn, messages: List[Dict[str, Any]], feedback: List[Dict[str, Any]]):
+    """
+    Add log rows (write_log_batch dicts: dir/it/cf/ts, rt/ri/fq/ts) to the hourly rollups,
+    inside the caller's transaction. The batch is pre-aggregated, so a flush costs one
+    upsert per (hour, key) touched rather than per row.
+    """
+    counts: Dict[tuple, List[float]] = {}
+    buckets: Dict[tuple, int] = {}
+    for m in messages:
+        hour, intent, conf = _hour(m.get("ts")), m.get("it") or "", m.get("cf")
+        c = counts.setdefault((hour, m["dir"], intent), [0, 0.0])
+        c[0] += 1
+        c[1] += conf or 0.0
+        if m["dir"] == "in" and conf is not None:
+            key = (hour, intent, _confidence_bucket(conf))
+            buckets[key] = buckets.get(key, 0) + 1
+    ratings: Dict[tuple, List[int]] = {}
+    for f in feedback:
+        if f.get("rt") is None:
+            continue
+        r = ratings.setdefault((_hour(f.get("ts")), f.get("ri") or "", int(f.get("fq") or 0)), [0, 0])
+        r[0] += 1
+        r[1] += int(f["rt"])
+    if counts:
+        conn.execute(text("""
+            INSERT INTO rollup_messages (hour, direction, intent, messages, confidence_sum)
+            VALUES (:h, :d, :i, :n, :cs)
+            ON CONFLICT(hour, direction, intent) DO UPDATE SET
+                messages = messages + excluded.messages, confidence_sum = confidence_sum + excluded.confidence_sum
+        """), [{"h": h, "d": d, "i": i, "n": n, "cs": cs} for (h, d, i), (n, cs) in counts.items()])
+    if buckets:
+        conn.execute(text("""
+            INSERT INTO rollup_confidence (hour, intent, bucket, messages) VALUES (:h, :i, :b, :n)
+            ON CONFLICT(hour, intent, bucket) DO UPDATE SET messages = messages + excluded.messages
+        """), [{"h": h, "i": i, "b": b, "n": n} for (h, i, b), n in buckets.items()])
+    if ratings:
+        conn.execute(text("""
+            INSERT INTO rollup_feedback (hour, intent, faq_id, ratings, rating_sum) VALUES (:h, :i, :f, :n, :s)
+            ON CONFLICT(hour, intent, faq_id) DO UPDATE SET
+                ratings = ratings + excluded.ratings, rating_sum = rating_sum + excluded.rating_sum
+        """), [{"h": h, "i": i, "f": f, "n": n, "s": rs} for (h, i, f), (n, rs) in ratings.items()])
+
+def rebuild_rollups(since: Optional[str] = None):
+    """
+    Recompute the rollups from the messages/feedback tables for hours from `since` on
+    (all hours if None), e.g. for a database that predates them. Archived messages are
+    not in the tables any more, so pass a `since` after the retention cutoff once
+    archiving runs. FAQ ids of older feedback are unknown and recorded as 0.
+    """
+    msg_hour = "strftime('%Y-%m-%d %H:00:00', created_at)"
+    fb_hour = "strftime('%Y-%m-%d %H:00:00', f.created_at)"
+    params = {"since": _hour(since) if since else ""}
+    engine = get_engine()
+    with engine.begin() as conn:
+        for table in ("rollup_messages", "rollup_confidence", "rollup_feedback"):
+            conn.execute(text(f"DELETE FROM {table} WHERE hour >= :since"), params)
+        conn.execute(text(f"""
+            INSERT INTO rollup_messages (hour, direction, intent, messages, confidence_sum)
+            SELECT {msg_hour}, direction, COALESCE(intent, ''), COUNT(*), TOTAL(confidence)
+            FROM messages WHERE {msg_hour} >= :since GROUP BY 1, 2, 3
+        """), params)
+        conn.execute(text(f"""
+            INSERT INTO rollup_confidence (hour, intent, bucket, messages)
+            SELECT {msg_hour}, COALESCE(intent, ''),
+                   MIN(MAX(CAST(confidence * 10 AS INTEGER), 0), 9), COUNT(*)
+            FROM messages
+            WHERE direction = 'in' AND confidence IS NOT NULL AND {msg_hour} >= :since
+            GROUP BY 1, 2, 3
+        """), params)
+        conn.execute(text(f"""
+            INSERT INTO rollup_feedback (hour, intent, faq_id, ratings, rating_sum)
+            SELECT {fb_hour}, COALESCE(m.intent, ''), 0, COUNT(*), SUM(f.rating)
+            FROM feedback f LEFT JOIN messages m ON m.id = f.message_id
+            WHERE f.rating IS NOT NULL AND {fb_hour} >= :since
+            GROUP BY 1, 2
+        """), params)
+
+def _hour_range(since: Optional[str], until: Optional[str]):
+    where, params = ["1=1"], {}
+    if since:
+        where.append("hour >= :since"); params["since"] = since
+    if until:
+        where.append("hour < :until"); params["until"] = until
+    return " AND ".join(where), params
+
+def rollup_intents(since: Optional[str] = None, until: Optional[str] = None) -> List[Row]:
+    """(direction, intent, messages, confidence_sum) totals over the hours in [since, until)."""
+    where, params = _hour_range(since, until)
+    engine = get_engine()
+    with engine.begin() as conn:
+        return conn.execute(text(f"""
+            SELECT direction, intent, SUM(messages) AS messages, SUM(confidence_sum) AS confidence_sum
+            FROM rollup_messages WHERE {where} GROUP BY direction, intent ORDER BY direction, messages DESC
+        """), params).fetchall()
+
+def rollup_timeline(since: Optional[str] = None, until: Optional[str] = None, period: str = "day") -> List[Row]:
+    """(period, turns, fallbacks) per day or hour: incoming messages and fallback replies."""
+    where, params = _hour_range(since, until)
+    params["n"] = 10 if period == "day" else 13
     engine = get_engine()
     with engine.begin() as conn:
-        return conn.execute(text("SELECT name, patterns FROM intents")).fetchall()
+        return conn.execute(text(f"""
+            SELECT substr(hour, 1, :n) AS period,
+                   COALESCE(SUM(CASE WHEN direction = 'in' THEN messages END), 0) AS turns,
+                   COALESCE(SUM(CASE WHEN direction = 'out' AND intent = 'fallback' THEN messages END), 0) AS fallbacks
+            FROM rollup_messages WHERE {where} GROUP BY period ORDER BY period
+        """), params).fetchall()
+
+def rollup_confidence_histogram(since: Optional[str] = None, until: Optional[str] = None,
+                                intent: Optional[str] = None) -> List[Row]:
+    """(bucket, messages) for incoming messages, optionally of one intent ('' = unmatched)."""
+    where, params = _hour_range(since, until)
+    if intent is not None:
+        where += " AND intent = :intent"; params["intent"] = intent
+    engine = get_engine()
+    with engine.begin() as conn:
+        return conn.execute(text(f"""
+            SELECT bucket, SUM(messages) AS messages FROM rollup_confidence
+            WHERE {where} GROUP BY bucket ORDER BY bucket
+        """), params).fetchall()
+
+def rollup_feedback_totals(since: Optional[str] = None, until: Optional[str] = None) -> List[Row]:
+    """(intent, faq_id, ratings, rating_sum) by rated reply."""
+    where, params = _hour_range(since, until)
+    engine = get_engine()
+    with engine.begin() as conn:
+        return conn.execute(text(f"""
+            SELECT intent, faq_id, SUM(ratings) AS ratings, SUM(rating_sum) AS rating_sum FROM rollup_feedback
+            WHERE {where} GROUP BY intent, faq_id ORDER BY ratings DESC
+        """), params).fetchall()
 
 # ---------------- Session (multi-turn) ----------------
 
@@ -102,6 +389,25 @@ def save_session(user_id: int, ctx: Dict[str, Any]):
             ON CONFLICT(user_id) DO UPDATE SET context_json=excluded.context_json, updated_at=excluded.updated_at
         """), {"u": user_id, "c": json.dumps(ctx, ensure_ascii=False)})
 
+def load_session(user_id: int) -> Optional[Dict[str, Any]]:
+    """Read a stored conversation context without creating one."""
+    engine = get_engine()
+    with engine.begin() as conn:
+        row = conn.execute(text("SELECT context_json FROM sessions WHERE user_id=:u"), {"u": user_id}).fetchone()
+        return json.loads(row[0]) if row else None
+
+def write_sessions(rows: List[Dict[str, Any]]):
+    """Upsert many serialized contexts ({"u": user_id, "c": context_json}) in one transaction."""
+    if not rows:
+        return
+    engine = get_engine()
+    with engine.begin() as conn:
+        conn.execute(text("""
+            INSERT INTO sessions (user_id, context_json, updated_at)
+            VALUES (:u, :c, CURRENT_TIMESTAMP)
+            ON CONFLICT(user_id) DO UPDATE SET context_json=excluded.context_json, updated_at=excluded.updated_at
+        """), rows)
+
 def reset_session(user_id: int):
     """Reset the conversation context to a clean state."""
     engine = get_engine()
@@ -113,6 +419,21 @@ def reset_session(user_id: int):
             ON CONFLICT(user_id) DO UPDATE SET context_json=excluded.context_json, updated_at=excluded.updated_at
         """), {"u": user_id, "c": json.dumps(ctx, ensure_ascii=False)})
 
+# ---------------- Change tracking ----------------
+
+def get_data_versions() -> Dict[str, int]:
+    """Return the change counter of every tracked table (see data_versions in schema.sql)."""
+    engine = get_engine()
+    with engine.begin() as conn:
+        return {r.name: int(r.version) for r in conn.execute(text("SELECT name, version FROM data_versions"))}
+
+def get_data_version(name: str) -> int:
+    """Return the change counter of one tracked table (0 if it has never been tracked)."""
+    engine = get_engine()
+    with engine.begin() as conn:
+        v = conn.execute(text("SELECT version FROM data_versions WHERE name=:n"), {"n": name}).scalar()
+        return int(v or 0)
+
 # ---------------- Business queries ----------------
 
 def get_schedule_by_course(course_code: str) -> Optional[Dict[str, str]]:
@@ -138,3 +459,17 @@ def get_deadline(course_code: str, assignment: str) -> Optional[Dict[str, str]]:
         if row:
             return {"due_at": row.due_at or "", "submit_to": row.submit_to or ""}
         return None
+
+def list_schedules() -> List[Row]:
+    """Return all schedule rows (id, course_code, title, details) in id order."""
+    engine = get_engine()
+    with engine.begin() as conn:
+        return conn.execute(text("SELECT id, course_code, title, details FROM schedules ORDER BY id")).fetchall()
+
+def list_deadlines() -> List[Row]:
+    """Return all deadline rows (id, course_code, assignment, due_at, submit_to) in id order."""
+    engine = get_engine()
+    with engine.begin() as conn:
+        return conn.execute(text("""
+            SELECT id, course_code, assignment, due_at, submit_to FROM deadlines ORDER BY id
+        """)).fetchall()
@@ -0,0 +1,87 @@
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, TypeVar, Union
+from sqlalchemy.engine import Row
+import db
+from config import DB_THREADS, LOG_BUFFER_ENABLED, SESSION_CACHE_ENABLED
+from metrics import span
+from user_cache import get_user_cache
+from session_store import SessionContext, get_session_store
+from write_behind import get_log_buffer, has_log_buffer
+
+T = TypeVar("T")
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+def get_executor() -> ThreadPoolExecutor:
+    """Return the bounded thread pool reserved for blocking DB work."""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=DB_THREADS, thread_name_prefix="db")
+    return _executor
+
+async def run(fn: Callable[..., T], *args, **kwargs) -> T:
+    """Run a blocking callable on the DB pool without stalling the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), functools.partial(fn, *args, **kwargs))
+
+def shutdown(wait: bool = True):
+    """Stop the DB pool; pending calls finish first when wait=True."""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=wait)
+            _executor = None
+
+# Awaitable counterparts of db.py (same names and arguments).
+# Callers await them one after another, so a single turn's DB work keeps its order;
+# ordering across a user's turns is enforced by dispatcher.UserOrderedUpdateProcessor.
+
+async def get_or_create_user(tg_user_id: int, first_name: str = "", last_name: str = "", username: str = "") -> int:
+    with span("get_or_create_user"):
+        cache = get_user_cache()
+        uid = cache.lookup(tg_user_id, first_name, last_name, username)
+        if uid is not None:
+            return uid
+        return await run(cache.resolve, tg_user_id, first_name, last_name, username)
+
+async def log_message(user_id: int, direction: str, text_: str, intent: Optional[str], conf: Optional[float]) -> int:
+    with span("log_message"):
+        if LOG_BUFFER_ENABLED:
+            buf = get_log_buffer() if has_log_buffer() else await run(get_log_buffer)
+            return buf.log_message(user_id, direction, text_, intent, conf)
+        return await run(db.log_message, user_id, direction, text_, intent, conf)
+
+async def add_feedback(user_id: int, message_id: Optional[int], rating: int, comment: str,
+                       reply_intent: Optional[str] = None, faq_id: Optional[int] = None):
+    if LOG_BUFFER_ENABLED:
+        buf = get_log_buffer() if has_log_buffer() else await run(get_log_buffer)
+        return buf.add_feedback(user_id, message_id, rating, comment, reply_intent, faq_id)
+    return await run(db.add_feedback, user_id, message_id, rating, comment, reply_intent, faq_id)
+
+async def list_faqs() -> List[Row]:
+    return await run(db.list_faqs)
+
+async def get_session(user_id: int) -> SessionContext:
+    with span("get_session"):
+        if SESSION_CACHE_ENABLED:
+            ctx = get_session_store().peek(user_id)
+            return ctx if ctx is not None else await run(get_session_store().get, user_id)
+        return SessionContext.from_dict(await run(db.get_session, user_id))
+
+async def save_session(user_id: int, ctx: Union[SessionContext, Dict[str, Any]]):
+    if SESSION_CACHE_ENABLED:
+        return get_session_store().save(user_id, ctx)
+    if isinstance(ctx, SessionContext):
+        ctx = ctx.to_dict()
+    return await run(db.save_session, user_id, ctx)
+
+async def reset_session(user_id: int):
+    if SESSION_CACHE_ENABLED:
+        return get_session_store().reset(user_id)
+    return await run(db.reset_session, user_id)
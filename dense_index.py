@@ -0,0 +1,336 @@
+"""
+Dense FAQ retrieval, the alternative to the word TF-IDF index in faq_index.py.
+
+FAQs are embedded as LSA vectors: character n-grams (3-5, word-bounded) hashed into
+2**HASH_BITS buckets, TF-IDF weighted, and projected onto the top singular vectors
+of the FAQ matrix. Character n-grams survive inflection and typos ("installment" /
+"instalments"); the projection maps terms that co-occur in the FAQ bank onto
+nearby directions. Everything is computed offline and saved as float32 .npy files
+that load memory-mapped; encoding a query needs no sklearn.
+
+Search goes through an IVF index (k-means cells over the vectors, `nprobe` nearest
+cells scanned). Hybrid mode fuses the cosine with a normalized BM25 score over the
+same word terms as faq_index.
+
+    python dense_index.py [output_dir]
+"""
+import re
+import sys
+import zlib
+from collections import Counter
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from config import FAQ_DENSE_DIR, DENSE_DIM, DENSE_NPROBE, FAQ_HYBRID_ALPHA
+from db import get_data_version, list_faqs
+from faq_index import analyze, load_artifact, load_current, save_artifact, save_best_effort
+
+WORD_RE = re.compile(r"(?u)\w+")
+CHAR_NGRAMS = (3, 5)
+HASH_BITS = 15
+BM25_K1, BM25_B = 1.2, 0.75
+IVF_MIN_ROWS = 2048  # smaller banks are scanned in full (exact search)
+KMEANS_ITERS = 10
+MODES = ("dense", "hybrid")
+
+_ARRAYS = ("ids", "char_idf", "projection", "vectors", "centroids", "list_ptr", "list_rows",
+           "bm25_idf", "bm25_indptr", "bm25_indices", "bm25_data")
+DENSE_FORMAT = 1  # bump when the saved layout changes; older artifacts are rebuilt
+
+def char_ngrams(text: str) -> List[str]:
+    """Character n-grams of every word, padded with spaces so word starts/ends are distinct."""
+    lo, hi = CHAR_NGRAMS
+    grams = []
+    for word in WORD_RE.findall(text.lower()):
+        padded = f" {word} "
+        for n in range(lo, hi + 1):
+            grams.extend(padded[i:i + n] for i in range(len(padded) - n + 1))
+    return grams
+
+def hash_features(text: str) -> Tuple[np.ndarray, np.ndarray]:
+    """(bucket columns, counts) of the text's n-grams; crc32 keeps buckets stable across processes."""
+    mask = (1 << HASH_BITS) - 1
+    buckets = np.fromiter((zlib.crc32(g.encode("utf-8")) & mask for g in char_ngrams(text)), dtype=np.int64)
+    return np.unique(buckets, return_counts=True)
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return (matrix / np.where(norms > 0, norms, 1)).astype(np.float32)
+
+def _lsa(weighted, dim: int) -> np.ndarray:
+    """(features x dim) orthonormal projection onto the top right singular vectors of `weighted`."""
+    if dim >= weighted.shape[0]:
+        # Small bank: keep the whole row space (exact SVD of a few dense rows)
+        _u, s, vt = np.linalg.svd(weighted.toarray(), full_matrices=False)
+        vt = vt[s > 1e-6]
+    else:
+        from sklearn.decomposition import TruncatedSVD
+
+        vt = TruncatedSVD(dim, algorithm="randomized", n_iter=7, random_state=0).fit(weighted).components_
+    return np.ascontiguousarray(vt.T, dtype=np.float32)  # a row per feature: queries gather a few rows
+
+def _nearest(vectors: np.ndarray, centroids: np.ndarray, chunk: int = 4096) -> np.ndarray:
+    out = np.empty(len(vectors), dtype=np.int64)
+    for lo in range(0, len(vectors), chunk):
+        out[lo:lo + chunk] = np.argmax(vectors[lo:lo + chunk] @ centroids.T, axis=1)
+    return out
+
+def _ivf(vectors: np.ndarray, seed: int = 0) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Spherical k-means cells: (centroids, list_ptr, list_rows); cell c holds list_rows[list_ptr[c]:list_ptr[c+1]]."""
+    n, dim = vectors.shape
+    if n < IVF_MIN_ROWS:
+        return np.zeros((1, dim), dtype=np.float32), np.array([0, n], dtype=np.int64), np.arange(n, dtype=np.int64)
+    nlist = int(round(np.sqrt(n)))
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(n, nlist, replace=False)].copy()
+    for _ in range(KMEANS_ITERS):
+        assign = _nearest(vectors, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, vectors)
+        empty = np.bincount(assign, minlength=nlist) == 0
+        sums[empty] = vectors[rng.choice(n, int(empty.sum()), replace=False)]  # re-seed empty cells
+        centroids = _normalize(sums)
+    assign = _nearest(vectors, centroids)
+    list_rows = np.argsort(assign, kind="stable").astype(np.int64)
+    list_ptr = np.zeros(nlist + 1, dtype=np.int64)
+    list_ptr[1:] = np.cumsum(np.bincount(assign, minlength=nlist))
+    return centroids, list_ptr, list_rows
+
+def _bm25(docs: Sequence[str]) -> Tuple[Dict[str, int], np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Term-major BM25 postings with the final per-(term, doc) weights precomputed."""
+    vocabulary: Dict[str, int] = {}
+    cols, rows, tfs, lengths = [], [], [], []
+    for row, doc in enumerate(docs):
+        terms = analyze(doc)
+        lengths.append(len(terms))
+        for term, tf in Counter(terms).items():
+            cols.append(vocabulary.setdefault(term, len(vocabulary)))
+            rows.append(row)
+            tfs.append(tf)
+    cols_a = np.array(cols, dtype=np.int64)
+    rows_a = np.array(rows, dtype=np.int32)
+    tf_a = np.array(tfs, dtype=np.float32)
+    lengths_a = np.array(lengths, dtype=np.float32)
+    df = np.bincount(cols_a, minlength=len(vocabulary)).astype(np.float32)
+    idf = np.log1p((len(docs) - df + 0.5) / (df + 0.5)).astype(np.float32)
+    avgdl = float(lengths_a.mean()) if len(docs) else 0.0
+    avgdl = avgdl or 1.0
+    norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths_a[rows_a] / avgdl)
+    data = idf[cols_a] * tf_a * (BM25_K1 + 1) / (tf_a + norm)
+    order = np.lexsort((rows_a, cols_a))
+    indptr = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum(df.astype(np.int64))
+    return vocabulary, idf, indptr, rows_a[order], data[order].astype(np.float32)
+
+class DenseIndex:
+    """
+    LSA vectors of the FAQ bank with an IVF index and BM25 postings.
+
+    Arrays (all saved as .npy): ids; char_idf (per hash bucket); projection (buckets x
+    dim); vectors (FAQs x dim, l2-normalized); centroids / list_ptr / list_rows (IVF
+    cells); bm25_idf / bm25_indptr / bm25_indices / bm25_data (term-major postings
+    over `vocabulary`).
+    """
+    def __init__(self, arrays: Dict[str, np.ndarray], vocabulary: Dict[str, int], meta: Optional[Dict] = None):
+        for name in _ARRAYS:
+            setattr(self, name, arrays[name])
+        self.vocabulary = vocabulary
+        self.meta = meta or {}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def version(self) -> Optional[int]:
+        """faqs change counter the index was built from."""
+        return self.meta.get("faqs_version")
+
+    @property
+    def nlist(self) -> int:
+        return len(self.centroids)
+
+    @classmethod
+    def build(cls, rows: Sequence, dim: int = DENSE_DIM, meta: Optional[Dict] = None) -> "DenseIndex":
+        """Embed FAQ rows (id, question, answer, tags). Needs scikit-learn once the bank has more than `dim` FAQs."""
+        from scipy.sparse import csr_matrix
+
+        n, width = len(rows), 1 << HASH_BITS
+        ids = np.array([int(r.id) for r in rows], dtype=np.int64)
+        # Answers add the vocabulary a paraphrase is likely to use; BM25 stays on questions + tags
+        texts = [f"{r.question} {r.tags or ''} {r.answer or ''}" for r in rows]
+        indptr, cols, counts = [0], [], []
+        for text in texts:
+            c, k = hash_features(text)
+            cols.append(c)
+            counts.append(k)
+            indptr.append(indptr[-1] + len(c))
+        matrix = csr_matrix((np.concatenate(counts).astype(np.float32) if n else np.zeros(0, dtype=np.float32),
+                             np.concatenate(cols) if n else np.zeros(0, dtype=np.int64),
+                             np.array(indptr, dtype=np.int64)), shape=(n, width))
+        df = np.bincount(matrix.indices, minlength=width)
+        char_idf = (np.log((1 + n) / (1 + df)) + 1).astype(np.float32)
+        matrix.data = (1 + np.log(matrix.data)) * char_idf[matrix.indices]
+        row_norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+        matrix = csr_matrix(matrix.multiply(1 / np.where(row_norms > 0, row_norms, 1)[:, None]))
+        projection = _lsa(matrix, dim) if n else np.zeros((width, 0), dtype=np.float32)
+        vectors = _normalize(np.asarray(matrix @ projection))
+        centroids, list_ptr, list_rows = _ivf(vectors)
+        vocabulary, bm25_idf, bm25_indptr, bm25_indices, bm25_data = _bm25(
+            [f"{r.question} {r.tags or ''}" for r in rows])
+        arrays = {"ids": ids, "char_idf": char_idf, "projection": projection, "vectors": vectors,
+                  "centroids": centroids, "list_ptr": list_ptr, "list_rows": list_rows, "bm25_idf": bm25_idf,
+                  "bm25_indptr": bm25_indptr, "bm25_indices": bm25_indices, "bm25_data": bm25_data}
+        return cls(arrays, vocabulary, meta)
+
+    def save(self, path: str = FAQ_DENSE_DIR):
+        """Write the index to `path`, replacing any previous one in a single rename."""
+        save_artifact(path, {name: getattr(self, name) for name in _ARRAYS}, self.vocabulary, self.meta)
+
+    @classmethod
+    def load(cls, path: str = FAQ_DENSE_DIR, mmap: bool = True) -> "DenseIndex":
+        """Open a saved index; arrays are memory-mapped unless mmap=False."""
+        return cls(*load_artifact(path, _ARRAYS, mmap))
+
+    # ---------------- Scoring ----------------
+
+    def encode(self, text: str) -> np.ndarray:
+        """
+        Dense vector of `text`: its l2-normalized n-gram vector, projected. It is not
+        re-normalized, so the dot product with an FAQ vector is the cosine between the
+        text and that FAQ's reconstruction, and text the bank has no words for scores low.
+        """
+        cols, counts = hash_features(text)
+        if not len(cols):
+            return np.zeros(self.projection.shape[1], dtype=np.float32)
+        weights = ((1 + np.log(counts)) * self.char_idf[cols]).astype(np.float32)
+        weights /= np.linalg.norm(weights)
+        return weights @ self.projection[cols]
+
+    def encode_many(self, texts: Sequence[str]) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, self.projection.shape[1]), dtype=np.float32)
+        return np.stack([self.encode(t) for t in texts])
+
+    def bm25(self, text: str) -> np.ndarray:
+        """
+        BM25 score of `text` against every FAQ, divided by its ceiling so it lies in [0, 1).
+        Query terms the bank never uses count in the ceiling at the highest idf, so a
+        text that only shares a common word with the bank stays near zero.
+        """
+        out = np.zeros(len(self.ids), dtype=np.float32)
+        terms = set(analyze(text))
+        cols = [self.vocabulary[t] for t in terms if t in self.vocabulary]
+        if not cols:
+            return out
+        for col in cols:
+            lo, hi = self.bm25_indptr[col], self.bm25_indptr[col + 1]
+            out[self.bm25_indices[lo:hi]] += self.bm25_data[lo:hi]
+        unseen_idf = np.log1p((len(self.ids) + 0.5) / 0.5)
+        ceiling = float(self.bm25_idf[cols].sum()) + (len(terms) - len(cols)) * unseen_idf
+        return out / (ceiling * (BM25_K1 + 1))  # a term adds at most idf * (k1 + 1) to a document
+
+    def _probe(self, query: np.ndarray, nprobe: int) -> Optional[np.ndarray]:
+        """Rows in the `nprobe` cells nearest to the query; None means all rows."""
+        if self.nlist <= 1 or nprobe >= self.nlist:
+            return None
+        near = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+        return np.concatenate([self.list_rows[self.list_ptr[c]:self.list_ptr[c + 1]] for c in near])
+
+    def search_topk(self, text: str, k: int = 5, mode: str = "dense", nprobe: int = DENSE_NPROBE,
+                    alpha: float = FAQ_HYBRID_ALPHA) -> List[Tuple[int, float]]:
+        """
+        Return up to k (faq_id, score) pairs with a positive score, best first.
+
+        dense: cosine of the LSA vectors, over the probed IVF cells. hybrid: alpha *
+        cosine + (1 - alpha) * normalized BM25, over the probed cells plus every FAQ
+        that shares a word term with the query.
+        """
+        if not len(self.ids) or k <= 0:
+            return []
+        query = self.encode(text)
+        rows = self._probe(query, nprobe)
+        lexical = self.bm25(text) if mode == "hybrid" else None
+        if lexical is not None and rows is not None:
+            rows = np.union1d(rows, np.flatnonzero(lexical))
+        if rows is None:
+            rows = np.arange(len(self.ids))
+        sims = np.asarray(self.vectors[rows] @ query, dtype=np.float32)
+        if lexical is not None:
+            sims = alpha * np.maximum(sims, 0) + (1 - alpha) * lexical[rows]
+        if k < len(sims):
+            top = np.argpartition(-sims, k - 1)[:k]
+        else:
+            top = np.arange(len(sims))
+        top = top[np.argsort(-sims[top], kind="stable")]
+        return [(int(self.ids[rows[i]]), float(sims[i])) for i in top if sims[i] > 0]
+
+    def best_many(self, texts: Sequence[str], mode: str = "dense", alpha: float = FAQ_HYBRID_ALPHA,
+                  chunk: int = 1024) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Best FAQ for every text by exact (non-IVF) search, `chunk` texts per matrix product.
+        Returns (faq_ids, scores); faq_id is -1 where nothing scores above zero.
+        """
+        n = len(texts)
+        ids = np.full(n, -1, dtype=np.int64)
+        scores = np.zeros(n, dtype=np.float32)
+        if not n or not len(self.ids):
+            return ids, scores
+        for lo in range(0, n, chunk):
+            batch = texts[lo:lo + chunk]
+            sims = self.encode_many(batch) @ np.asarray(self.vectors).T
+            if mode == "hybrid":
+                sims = alpha * np.maximum(sims, 0) + (1 - alpha) * np.stack([self.bm25(t) for t in batch])
+            best = np.argmax(sims, axis=1)
+            top = sims[np.arange(len(batch)), best]
+            hit = top > 0
+            ids[lo:lo + len(batch)][hit] = self.ids[best[hit]]
+            scores[lo:lo + len(batch)] = np.maximum(top, 0)
+        return ids, scores
+
+class DenseRetriever:
+    """search_topk / best_many of a DenseIndex in a fixed mode, interchangeable with FAQIndex in FAQMatcher."""
+    def __init__(self, index: DenseIndex, mode: str = "dense", nprobe: int = DENSE_NPROBE):
+        if mode not in MODES:
+            raise ValueError(f"unknown dense retrieval mode {mode!r}")
+        self.index = index
+        self.mode = mode
+        self.nprobe = nprobe
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    @property
+    def version(self) -> Optional[int]:
+        return self.index.version
+
+    def search_topk(self, text: str, k: int = 5) -> List[Tuple[int, float]]:
+        return self.index.search_topk(text, k, self.mode, self.nprobe)
+
+    def best_many(self, texts: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+        return self.index.best_many(texts, self.mode)
+
+def build_from_db(dim: int = DENSE_DIM) -> DenseIndex:
+    """Embed the current faqs table, stamped with its change counter."""
+    version = get_data_version("faqs")
+    return DenseIndex.build(list_faqs(), dim, meta={"faqs_version": version, "format": DENSE_FORMAT, "dim": dim})
+
+def rebuild(path: str = FAQ_DENSE_DIR) -> DenseIndex:
+    """Build a fresh index and save it (best effort) so the next start can load it."""
+    return save_best_effort(build_from_db(), path, "dense FAQ index")
+
+def load_or_build(path: str = FAQ_DENSE_DIR, version: Optional[int] = None) -> DenseIndex:
+    """
+    Load the saved index if it was built from faqs `version` (default: the current one)
+    with the current settings, otherwise rebuild and save it. A rebuild reads the table
+    as it is now, so check the result's version when it must match another index.
+    """
+    expected = {"faqs_version": get_data_version("faqs") if version is None else version,
+                "format": DENSE_FORMAT, "dim": DENSE_DIM}
+    return load_current(path, DenseIndex.load, rebuild, expected, "Dense FAQ index")
+
+if __name__ == "__main__":
+    # python dense_index.py [output_dir]  -- build the dense index offline from the faqs table
+    out = sys.argv[1] if len(sys.argv) > 1 else FAQ_DENSE_DIR
+    idx = build_from_db()
+    idx.save(out)
+    print(f"✅ Dense FAQ index with {len(idx)} entries, {idx.projection.shape[1]} dims "
+          f"and {idx.nlist} IVF cells saved to {out}")
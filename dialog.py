@@ -1,15 +1,31 @@
-from typing import Dict, Optional, Tuple
-from db import get_schedule_by_course, get_deadline
+from typing import Dict, List, Optional, Tuple
+from catalog import get_catalog
 
 # Slot requirements per intent
 REQUIRED_SLOTS = {
     "schedule": ["course"],
     "deadline": ["course", "assignment"]
 }
+# Longest list of choices offered in a re-prompt
+MAX_CHOICES = 10
+
+def _choices(items: List[str]) -> str:
+    shown = ", ".join(items[:MAX_CHOICES])
+    return shown + (", …" if len(items) > MAX_CHOICES else "")
+
+def known_course(course: Optional[str], catalog=None) -> bool:
+    """True if the catalog has `course`; any course passes while the catalog is empty."""
+    catalog = catalog or get_catalog()
+    return bool(course) and (not len(catalog) or course in catalog)
+
+def unknown_course_prompt(course: str, catalog=None) -> str:
+    catalog = catalog or get_catalog()
+    return f"I don't have course {course}. Courses I know: {_choices(catalog.courses())}."
 
 def resolve_slots(ctx: Dict, intent: str, new_slots: Dict[str, Optional[str]]) -> Tuple[Dict, Dict, Optional[str]]:
     """
     Merge newly extracted entities into session slots and check missing ones.
+    A remembered course the catalog rejects is also dropped from ctx["last_course"].
 
     Returns:
       (merged_slots, missing_slots_dict, prompt_text_if_missing)
@@ -27,12 +43,35 @@ def resolve_slots(ctx: Dict, intent: str, new_slots: Dict[str, Optional[str]]) -
         if v:
             slots[k] = v
 
+    # Check values against the catalog; unknown ones are re-asked with the valid choices
+    catalog = get_catalog()
+    required = REQUIRED_SLOTS.get(intent, [])
+    course = slots.get("course")
+    if course and not known_course(course, catalog):
+        slots.pop("course")
+        if ctx.get("last_course") == course:
+            ctx["last_course"] = None
+        return (
+            slots,
+            {s: None for s in required if not slots.get(s)},
+            unknown_course_prompt(course, catalog)
+        )
+    assignments = catalog.assignments(course) if course and "assignment" in required else []
+    assignment = slots.get("assignment")
+    if assignment and assignments and assignment not in assignments:
+        slots.pop("assignment")
+        return slots, {"assignment": None}, \
+            f"I don't have {assignment} for {course}. Assignments: {_choices(assignments)}."
+
     # Compute missing
-    missing = [s for s in REQUIRED_SLOTS.get(intent, []) if not slots.get(s)]
+    missing = [s for s in required if not slots.get(s)]
     if missing:
         if missing == ["course"]:
             return slots, {"course": None}, "Please tell me the course code (e.g., 158.780)."
         if missing == ["assignment"]:
+            if assignments:
+                return slots, {"assignment": None}, \
+                    f"Please tell me the assignment for {course}: {_choices(assignments)}."
             return slots, {"assignment": None}, "Please tell me the assignment name (e.g., A1)."
         if set(missing) == {"course", "assignment"}:
             return (
@@ -50,14 +89,15 @@ def handle_intent(ctx: Dict, intent: str, slots: Dict) -> str:
     course = slots.get("course")
     assignment = slots.get("assignment")
 
+    catalog = get_catalog()
     if intent == "schedule":
-        data = get_schedule_by_course(course)
+        data = catalog.schedule(course)
         if data:
             return f"Schedule for {course}:\n• {data['title']}\n{data['details']}"
         return f"I don't have schedule data for {course} yet. Please check the official announcement or contact the coordinator."
 
     if intent == "deadline":
-        data = get_deadline(course, assignment)
+        data = catalog.deadline(course, assignment)
         if data:
             return f"Deadline for {course} {assignment}: {data['due_at']}\nSubmit via: {data['submit_to']}"
         return f"I don't have a deadline record for {course} {assignment}. Please follow the course outline/announcement."
@@ -0,0 +1,132 @@
+import asyncio
+import contextlib
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+from config import MAX_PENDING_UPDATES, MAX_USER_PENDING, MAX_QUEUE_WAIT
+import metrics
+
+# PTB's own semaphore wraps do_process_update, including time spent waiting behind an
+# earlier update from the same user. Keep it out of the way and apply the real cap below.
+_ADMISSION_LIMIT = 10_000
+
+ShedCallback = Callable[[object, str], Awaitable[Any]]
+
+def update_key(update: object) -> Optional[int]:
+    """Ordering key for an update: the Telegram user id (or chat id), if any."""
+    if isinstance(update, Update):
+        if update.effective_user:
+            return update.effective_user.id
+        if update.effective_chat:
+            return update.effective_chat.id
+    return None
+
+class UserOrderedUpdateProcessor(BaseUpdateProcessor):
+    """
+    Process updates concurrently across users, but strictly in arrival order per user.
+
+    At most `max_concurrent_updates` handlers run at the same time; a user's next update
+    waits for their previous one, so session reads/writes of one user never interleave.
+
+    Waiting is bounded: an update is shed, i.e. its handler never runs and `on_shed`
+    (update, reason) is awaited instead, when `max_pending` updates are already
+    waiting ("queue_full"), when its user already has `max_user_pending` updates queued
+    or running ("user_backlog"), or when it waited longer than `max_wait` seconds for
+    its turn ("stale"). Limits of 0 disable the check.
+    """
+    def __init__(self, max_concurrent_updates: int, max_pending: int = MAX_PENDING_UPDATES,
+                 max_user_pending: int = MAX_USER_PENDING, max_wait: float = MAX_QUEUE_WAIT,
+                 on_shed: Optional[ShedCallback] = None):
+        super().__init__(_ADMISSION_LIMIT)
+        self._limit = max_concurrent_updates
+        self.max_pending = max_pending
+        self.max_user_pending = max_user_pending
+        self.max_wait = max_wait
+        self._on_shed = on_shed
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._locks: Dict[int, asyncio.Lock] = {}
+        self._refs: Dict[int, int] = {}
+        self.waiting = 0  # admitted, not yet running
+        self.running = 0
+        self.max_waiting = 0  # high-water mark of `waiting`
+        self.shed: Dict[str, int] = {"queue_full": 0, "user_backlog": 0, "stale": 0}
+
+    async def initialize(self) -> None:
+        self._slots = asyncio.Semaphore(self._limit)
+        metrics.add_gauge("edu_updates_waiting", "Updates admitted and waiting for a handler slot",
+                          lambda: self.waiting)
+        metrics.add_gauge("edu_updates_running", "Updates being handled", lambda: self.running)
+
+    async def shutdown(self) -> None:
+        self._locks.clear()
+        self._refs.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"waiting": self.waiting, "running": self.running, "max_waiting": self.max_waiting,
+                "users_queued": len(self._refs), "shed": dict(self.shed)}
+
+    def _admit(self, key: Optional[int]) -> Optional[str]:
+        """Reason to shed a new update right away, or None to queue it."""
+        if self.max_pending and self.waiting >= self.max_pending:
+            return "queue_full"
+        if key is not None and self.max_user_pending and self._refs.get(key, 0) >= self.max_user_pending:
+            return "user_backlog"
+        return None
+
+    async def _shed(self, update: object, coroutine: Awaitable[Any], reason: str):
+        if asyncio.iscoroutine(coroutine):
+            coroutine.close()  # never started; closing avoids the "never awaited" warning
+        self.shed[reason] += 1
+        metrics.count_shed(reason)
+        if self._on_shed is not None:
+            try:
+                await self._on_shed(update, reason)
+            except Exception as e:
+                print(f"[dispatcher] busy reply failed: {e}")
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        if self._slots is None:
+            await self.initialize()
+        key = update_key(update)
+        reason = self._admit(key)
+        if reason:
+            await self._shed(update, coroutine, reason)
+            return
+        # Everything up to the lock acquisition runs without yielding, so the lock's FIFO
+        # waiter queue preserves the order in which PTB handed us the updates.
+        if key is None:
+            lock = contextlib.nullcontext()
+        else:
+            lock = self._locks.get(key)
+            if lock is None:
+                lock = self._locks[key] = asyncio.Lock()
+            self._refs[key] = self._refs.get(key, 0) + 1
+        queued = time.monotonic()
+        self.waiting += 1
+        self.max_waiting = max(self.max_waiting, self.waiting)
+        started = stale = False
+        try:
+            async with lock:
+                async with self._slots:
+                    self.waiting -= 1
+                    started = True
+                    waited = time.monotonic() - queued
+                    metrics.observe_queue_wait(waited)
+                    stale = bool(self.max_wait) and waited > self.max_wait
+                    if not stale:
+                        self.running += 1
+                        try:
+                            await coroutine
+                        finally:
+                            self.running -= 1
+        finally:
+            if not started:
+                self.waiting -= 1
+            if key is not None:
+                self._refs[key] -= 1
+                if not self._refs[key]:
+                    del self._refs[key]
+                    del self._locks[key]
+        if stale:
+            await self._shed(update, coroutine, "stale")
@@ -0,0 +1,292 @@
+import json
+import os
+import re
+import shutil
+import sys
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from config import FAQ_INDEX_DIR
+from db import get_data_version, list_faqs
+
+# Must match the TfidfVectorizer settings used in build(): sklearn's default word
+# analyzer (lowercase, \b\w\w+\b tokens) with uni+bigrams and l2-normalized rows.
+TOKEN_RE = re.compile(r"(?u)\b\w\w+\b")
+NGRAM_RANGE = (1, 2)
+MAX_FEATURES = 5000
+
+_ARRAYS = ("ids", "idf", "indptr", "indices", "data")
+INDEX_FORMAT = 2  # bump when the saved layout changes; older artifacts are rebuilt
+
+def analyze(text: str) -> List[str]:
+    """Split text into the same unigram/bigram terms the vectorizer was fitted on."""
+    tokens = TOKEN_RE.findall(text.lower())
+    terms = []
+    lo, hi = NGRAM_RANGE
+    for n in range(lo, hi + 1):
+        terms.extend(" ".join(tokens[i:i + n]) for i in range(len(tokens) - n + 1))
+    return terms
+
+# ---------------- Saved artifacts ----------------
+# Shared with dense_index: a directory of .npy arrays plus vocabulary.json and meta.json
+
+def save_artifact(path: str, arrays: Dict[str, np.ndarray], vocabulary: Dict[str, int], meta: Dict):
+    """Write an index directory to `path`, replacing any previous one in a single rename."""
+    parent = os.path.dirname(os.path.abspath(path))
+    os.makedirs(parent, exist_ok=True)
+    tmp = f"{path}.tmp{os.getpid()}"  # the bot and the importer may save at the same time
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    for name, array in arrays.items():
+        np.save(os.path.join(tmp, f"{name}.npy"), array)
+    with open(os.path.join(tmp, "vocabulary.json"), "w", encoding="utf-8") as f:
+        json.dump(vocabulary, f, ensure_ascii=False)
+    with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    old = f"{path}.old{os.getpid()}"
+    shutil.rmtree(old, ignore_errors=True)
+    if os.path.exists(path):
+        os.rename(path, old)
+    os.rename(tmp, path)
+    shutil.rmtree(old, ignore_errors=True)
+
+def load_artifact(path: str, names: Sequence[str], mmap: bool = True) -> Tuple[Dict[str, np.ndarray], Dict[str, int], Dict]:
+    """(arrays, vocabulary, meta) of a saved index directory; arrays are memory-mapped unless mmap=False."""
+    mode = "r" if mmap else None
+    arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mode) for name in names}
+    with open(os.path.join(path, "vocabulary.json"), encoding="utf-8") as f:
+        vocabulary = json.load(f)
+    with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+        meta = json.load(f)
+    return arrays, vocabulary, meta
+
+def save_best_effort(index: Any, path: str, label: str) -> Any:
+    """Save a freshly built index so the next start can load it; a failed save only costs a rebuild."""
+    try:
+        index.save(path)
+    except OSError as e:
+        print(f"Could not save {label} to {path}: {e}")
+    return index
+
+def load_current(path: str, load: Callable[[str], Any], rebuild: Callable[[str], Any], expected: Dict,
+                 label: str) -> Any:
+    """The index saved at `path` if its meta has every `expected` item, otherwise rebuild(path)."""
+    if os.path.exists(os.path.join(path, "meta.json")):
+        try:
+            index = load(path)
+            if all(index.meta.get(key) == value for key, value in expected.items()):
+                return index
+        except (OSError, ValueError) as e:
+            print(f"{label} at {path} unreadable, rebuilding: {e}")
+    return rebuild(path)
+
+# ---------------- TF-IDF index ----------------
+
+def _pack(strings: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """Concatenate strings into one UTF-8 byte array plus start offsets (len + 1)."""
+    encoded = [x.encode("utf-8") for x in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    if encoded:
+        offsets[1:] = np.cumsum([len(b) for b in encoded])
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+class FAQStore:
+    """
+    Id-indexed FAQ questions and answers, built and swapped together with FAQIndex.
+
+    Texts are packed into UTF-8 blobs with offset arrays, so they memory-map like the
+    index arrays and are only decoded when looked up; lookups by id are O(1).
+    """
+    ARRAYS = ("q_blob", "q_offsets", "a_blob", "a_offsets")
+
+    def __init__(self, ids: np.ndarray, q_blob: np.ndarray, q_offsets: np.ndarray,
+                 a_blob: np.ndarray, a_offsets: np.ndarray):
+        self.ids = ids
+        self.q_blob, self.q_offsets = q_blob, q_offsets
+        self.a_blob, self.a_offsets = a_blob, a_offsets
+        self._pos = {faq_id: i for i, faq_id in enumerate(ids.tolist())}
+
+    @classmethod
+    def from_rows(cls, ids: np.ndarray, rows: Sequence) -> "FAQStore":
+        q_blob, q_offsets = _pack([r.question or "" for r in rows])
+        a_blob, a_offsets = _pack([r.answer or "" for r in rows])
+        return cls(ids, q_blob, q_offsets, a_blob, a_offsets)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __contains__(self, faq_id: int) -> bool:
+        return faq_id in self._pos
+
+    @staticmethod
+    def _text(blob: np.ndarray, offsets: np.ndarray, i: int) -> str:
+        return bytes(blob[offsets[i]:offsets[i + 1]]).decode("utf-8")
+
+    def question(self, faq_id: int) -> Optional[str]:
+        i = self._pos.get(faq_id)
+        return None if i is None else self._text(self.q_blob, self.q_offsets, i)
+
+    def answer(self, faq_id: int) -> Optional[str]:
+        i = self._pos.get(faq_id)
+        return None if i is None else self._text(self.a_blob, self.a_offsets, i)
+
+    def page(self, offset: int = 0, limit: int = 10) -> List[Tuple[int, str]]:
+        """(faq_id, question) pairs in id order, for menu listings."""
+        end = min(offset + limit, len(self.ids))
+        return [(int(self.ids[i]), self._text(self.q_blob, self.q_offsets, i)) for i in range(max(offset, 0), end)]
+
+class FAQIndex:
+    """
+    Precomputed TF-IDF index over the FAQ bank, with the FAQ texts in `store`.
+
+    The document matrix is stored term-major (CSC: postings of term t are
+    `indices/data[indptr[t]:indptr[t+1]]`), so scoring a query only touches the
+    postings of its own terms. Arrays are plain .npy files that load memory-mapped.
+    """
+    def __init__(self, ids: np.ndarray, vocabulary: Dict[str, int], idf: np.ndarray,
+                 indptr: np.ndarray, indices: np.ndarray, data: np.ndarray, store: FAQStore,
+                 meta: Optional[Dict] = None):
+        self.ids = ids
+        self.store = store
+        self.vocabulary = vocabulary
+        self.idf = idf
+        self.indptr = indptr
+        self.indices = indices
+        self.data = data
+        self.meta = meta or {}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def version(self) -> Optional[int]:
+        """faqs change counter the index was built from."""
+        return self.meta.get("faqs_version")
+
+    @classmethod
+    def build(cls, rows: Sequence, meta: Optional[Dict] = None) -> "FAQIndex":
+        """Fit TF-IDF over FAQ rows (id, question, answer, tags). Needs scikit-learn."""
+        from sklearn.feature_extraction.text import TfidfVectorizer
+
+        ids = np.array([int(r.id) for r in rows], dtype=np.int64)
+        store = FAQStore.from_rows(ids, rows)
+        questions = [f"{r.question} {r.tags or ''}" for r in rows]
+        if not questions:
+            empty = np.zeros(0, dtype=np.int32)
+            return cls(ids, {}, np.zeros(0, dtype=np.float32), np.zeros(1, dtype=np.int64), empty,
+                       np.zeros(0, dtype=np.float32), store, meta)
+        vectorizer = TfidfVectorizer(max_features=MAX_FEATURES, ngram_range=NGRAM_RANGE)
+        matrix = vectorizer.fit_transform(questions).tocsc()
+        matrix.sort_indices()
+        vocabulary = {term: int(col) for term, col in vectorizer.vocabulary_.items()}
+        return cls(ids, vocabulary, vectorizer.idf_.astype(np.float32), matrix.indptr.astype(np.int64),
+                   matrix.indices.astype(np.int32), matrix.data.astype(np.float32), store, meta)
+
+    def save(self, path: str = FAQ_INDEX_DIR):
+        """Write the index to `path`, replacing any previous one in a single rename."""
+        arrays = {name: getattr(self, name) for name in _ARRAYS}
+        arrays.update((name, getattr(self.store, name)) for name in FAQStore.ARRAYS)
+        save_artifact(path, arrays, self.vocabulary, self.meta)
+
+    @classmethod
+    def load(cls, path: str = FAQ_INDEX_DIR, mmap: bool = True) -> "FAQIndex":
+        """Open a saved index; arrays are memory-mapped unless mmap=False."""
+        arrays, vocabulary, meta = load_artifact(path, _ARRAYS + FAQStore.ARRAYS, mmap)
+        store = FAQStore(arrays["ids"], *(arrays[name] for name in FAQStore.ARRAYS))
+        return cls(arrays["ids"], vocabulary, arrays["idf"], arrays["indptr"], arrays["indices"], arrays["data"],
+                   store, meta)
+
+    def transform(self, text: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Sparse l2-normalized TF-IDF vector of `text` as (term columns, weights)."""
+        counts: Dict[int, int] = {}
+        for term in analyze(text):
+            col = self.vocabulary.get(term)
+            if col is not None:
+                counts[col] = counts.get(col, 0) + 1
+        if not counts:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        cols = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+        weights = np.fromiter(counts.values(), dtype=np.float32, count=len(counts)) * self.idf[cols]
+        weights /= np.linalg.norm(weights)
+        return cols, weights
+
+    def transform_many(self, texts: Sequence[str]):
+        """Vectorize a batch of texts into one l2-normalized scipy CSR matrix (len(texts) x vocabulary)."""
+        from scipy.sparse import csr_matrix
+
+        indptr, cols, vals = [0], [], []
+        for text in texts:
+            c, w = self.transform(text)
+            cols.append(c)
+            vals.append(w)
+            indptr.append(indptr[-1] + len(c))
+        return csr_matrix(
+            (np.concatenate(vals) if vals else np.zeros(0, dtype=np.float32),
+             np.concatenate(cols) if cols else np.zeros(0, dtype=np.int64),
+             np.array(indptr, dtype=np.int64)),
+            shape=(len(texts), len(self.idf)),
+        )
+
+    def best_many(self, texts: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Best FAQ for every text with one sparse matrix product.
+        Returns (faq_ids, scores); faq_id is -1 where nothing overlaps.
+        """
+        from scipy.sparse import csr_matrix
+
+        n = len(texts)
+        if not n or not len(self.ids):
+            return np.full(n, -1, dtype=np.int64), np.zeros(n, dtype=np.float32)
+        # The term-major arrays are exactly the CSR form of the transposed document matrix
+        docs_t = csr_matrix((self.data, self.indices, self.indptr), shape=(len(self.idf), len(self.ids)))
+        sims = (self.transform_many(texts) @ docs_t).tocsr()
+        ids = np.full(n, -1, dtype=np.int64)
+        scores = np.zeros(n, dtype=np.float32)
+        for row in range(n):
+            lo, hi = sims.indptr[row], sims.indptr[row + 1]
+            if hi > lo:
+                j = lo + int(np.argmax(sims.data[lo:hi]))
+                ids[row] = self.ids[sims.indices[j]]
+                scores[row] = sims.data[j]
+        return ids, scores
+
+    def scores(self, text: str) -> np.ndarray:
+        """Cosine similarity of `text` against every FAQ (sparse dot product over postings)."""
+        out = np.zeros(len(self.ids), dtype=np.float32)
+        cols, weights = self.transform(text)
+        for col, w in zip(cols, weights):
+            lo, hi = self.indptr[col], self.indptr[col + 1]
+            out[self.indices[lo:hi]] += w * self.data[lo:hi]
+        return out
+
+    def search_topk(self, text: str, k: int = 5) -> List[Tuple[int, float]]:
+        """Return up to k (faq_id, score) pairs with a positive score, best first."""
+        if not len(self.ids) or k <= 0:
+            return []
+        sims = self.scores(text)
+        if k < len(sims):
+            top = np.argpartition(-sims, k - 1)[:k]
+        else:
+            top = np.arange(len(sims))
+        top = top[np.argsort(-sims[top], kind="stable")]
+        return [(int(self.ids[i]), float(sims[i])) for i in top if sims[i] > 0]
+
+def build_from_db() -> FAQIndex:
+    """Fit a fresh index over the current faqs table, stamped with its change counter."""
+    version = get_data_version("faqs")  # read first: edits during the fit only make us rebuild again
+    return FAQIndex.build(list_faqs(), meta={"faqs_version": version, "format": INDEX_FORMAT})
+
+def rebuild(path: str = FAQ_INDEX_DIR) -> FAQIndex:
+    """Fit a fresh index and save it (best effort) so the next start can load it."""
+    return save_best_effort(build_from_db(), path, "FAQ index")
+
+def load_or_build(path: str = FAQ_INDEX_DIR) -> FAQIndex:
+    """Load the saved index if it matches the faqs table, otherwise rebuild and save it."""
+    expected = {"faqs_version": get_data_version("faqs"), "format": INDEX_FORMAT}
+    return load_current(path, FAQIndex.load, rebuild, expected, "FAQ index")
+
+if __name__ == "__main__":
+    # python faq_index.py [output_dir]  -- build the index offline from the faqs table
+    out = sys.argv[1] if len(sys.argv) > 1 else FAQ_INDEX_DIR
+    idx = build_from_db()
+    idx.save(out)
+    print(f"✅ FAQ index with {len(idx)} entries and {len(idx.vocabulary)} terms saved to {out}")
@@ -0,0 +1,198 @@
+"""
+Catalog gazetteer: finds course codes, course titles and assignment names in free
+text, including forms the entity regexes miss ("158780", "158 780", "assigment 2",
+"reasoning and optimisation").
+
+The message is split into lowercase word tokens and each token is mapped to a
+vocabulary id: exactly or, for words of at least ENTITY_FUZZY_MIN_LEN characters,
+within one edit (insert, delete, substitute, swap of neighbours) via a
+deletion-neighbourhood index. Number tokens are never corrected; a wrong digit
+names another course. The ids then run through one Aho-Corasick automaton over
+every surface form, so a lookup is linear in the message length however large the
+catalog is.
+"""
+import re
+from collections import deque
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+from config import ENTITY_FUZZY_MIN_LEN
+
+TOKEN_RE = re.compile(r"[^\W_]+")
+# "Week 4: LLM Reasoning & Optimization" -> the course topic only
+WEEK_PREFIX_RE = re.compile(r"^\s*week\s*\d+\s*[:\-–—]\s*", re.I)
+ASSIGN_NAME_RE = re.compile(r"^a(\d+)$")
+# Skipped in titles and messages alike ("a" stays: "a 1" is an assignment)
+STOPWORDS = frozenset("the of and to in for on with an at by from into".split())
+# Longer tokens are not looked up fuzzily (cost is quadratic in token length)
+MAX_FUZZY_LEN = 24
+
+Form = Tuple[str, str]  # (slot, canonical value), e.g. ("course", "158.780")
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in TOKEN_RE.findall(text.lower()) if t not in STOPWORDS]
+
+def _deletions(word: str) -> Set[str]:
+    return {word[:i] + word[i + 1:] for i in range(len(word))}
+
+def _within_one_edit(a: str, b: str) -> bool:
+    """Optimal string alignment distance <= 1."""
+    if a == b:
+        return True
+    la, lb = len(a), len(b)
+    if abs(la - lb) > 1:
+        return False
+    i = 0
+    while i < min(la, lb) and a[i] == b[i]:
+        i += 1
+    if la == lb:
+        if a[i + 1:] == b[i + 1:]:
+            return True  # substitution
+        return i + 1 < la and a[i] == b[i + 1] and a[i + 1] == b[i] and a[i + 2:] == b[i + 2:]
+    return a[i + 1:] == b[i:] if la > lb else a[i:] == b[i + 1:]
+
+def course_forms(code: str, title: str = "") -> List[Tuple[str, ...]]:
+    """Token sequences that name a course: its code, spaced or not, and its title or two-word runs of it."""
+    parts = tuple(TOKEN_RE.findall(code.lower()))
+    forms = [parts] if parts else []
+    if len(parts) > 1:
+        forms.append(("".join(parts),))
+    words = tuple(tokenize(WEEK_PREFIX_RE.sub("", title)))
+    if words and (len(words) > 1 or len(words[0]) >= 4):
+        forms.append(words)
+    forms.extend(words[i:j] for i in range(len(words)) for j in range(i + 2, len(words) + 1)
+                 if (i, j) != (0, len(words)))
+    return forms
+
+def assignment_forms(name: str) -> List[Tuple[str, ...]]:
+    """Token sequences that name an assignment: "A2" also as "a 2", "assignment 2"."""
+    parts = tuple(TOKEN_RE.findall(name.lower()))
+    forms = [parts] if parts else []
+    m = ASSIGN_NAME_RE.match("".join(parts))
+    if m:
+        n = m.group(1)
+        forms += [("a", n), ("assignment", n), ("assignment" + n,)]
+    return forms
+
+class Gazetteer:
+    """
+    Multi-pattern matcher over the catalog's surface forms.
+
+    Forms that would name more than one course (or assignment) are dropped, so a match is
+    never ambiguous. Built once per catalog snapshot; immutable and thread-safe.
+    """
+    def __init__(self, forms: Dict[Tuple[str, ...], Set[Form]], fuzzy_min_len: int = ENTITY_FUZZY_MIN_LEN):
+        self.fuzzy_min_len = fuzzy_min_len
+        self._vocab: Dict[str, int] = {}
+        self._words: List[str] = []
+        self._patterns: List[Tuple[int, Form]] = []  # (length in tokens, (slot, value))
+        # Aho-Corasick over token ids: goto transitions, failure links, outputs per state
+        self._goto: List[Dict[int, int]] = [{}]
+        self._out: List[List[int]] = [[]]
+        for seq, targets in sorted(forms.items()):
+            if len({slot for slot, _ in targets}) != len(targets):
+                continue
+            for target in sorted(targets):
+                self._add(seq, target)
+        self._link()
+        # Deletion neighbourhood of every correctable word: variant -> word ids
+        self._deletes: Dict[str, Set[int]] = {}
+        if fuzzy_min_len:
+            for word, wid in self._vocab.items():
+                if len(word) >= fuzzy_min_len and not word.isdigit():
+                    for variant in _deletions(word) | {word}:
+                        self._deletes.setdefault(variant, set()).add(wid)
+
+    @classmethod
+    def build(cls, courses: Dict[str, str], assignments: Iterable[str], **kwargs) -> "Gazetteer":
+        """From {course_code: title} and assignment names."""
+        forms: Dict[Tuple[str, ...], Set[Form]] = {}
+        for code, title in courses.items():
+            for seq in course_forms(code, title):
+                forms.setdefault(seq, set()).add(("course", code))
+        for name in set(assignments):
+            for seq in assignment_forms(name):
+                forms.setdefault(seq, set()).add(("assignment", name))
+        return cls(forms, **kwargs)
+
+    def _add(self, seq: Tuple[str, ...], target: Form):
+        state = 0
+        for word in seq:
+            wid = self._vocab.get(word)
+            if wid is None:
+                wid = self._vocab[word] = len(self._words)
+                self._words.append(word)
+            nxt = self._goto[state].get(wid)
+            if nxt is None:
+                nxt = self._goto[state][wid] = len(self._goto)
+                self._goto.append({})
+                self._out.append([])
+            state = nxt
+        self._out[state].append(len(self._patterns))
+        self._patterns.append((len(seq), target))
+
+    def _link(self):
+        self._fail = [0] * len(self._goto)
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for wid, nxt in self._goto[state].items():
+                f = self._fail[state]
+                while f and wid not in self._goto[f]:
+                    f = self._fail[f]
+                self._fail[nxt] = self._goto[f].get(wid, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+                queue.append(nxt)
+
+    def __len__(self) -> int:
+        return len(self._patterns)
+
+    def _word_id(self, token: str) -> Tuple[int, int]:
+        """(vocabulary id or -1, edits used)."""
+        wid = self._vocab.get(token)
+        if wid is not None:
+            return wid, 0
+        if not self._deletes or not self.fuzzy_min_len - 1 <= len(token) <= MAX_FUZZY_LEN or token.isdigit():
+            return -1, 0
+        candidates = set(self._deletes.get(token, ()))
+        for variant in _deletions(token):
+            candidates |= self._deletes.get(variant, set())
+        matches = [i for i in candidates if _within_one_edit(token, self._words[i])]
+        return (matches[0], 1) if len(matches) == 1 else (-1, 0)
+
+    def _scan(self, tokens: List[str]) -> Iterator[Tuple[int, int, int, Form]]:
+        """(start, end, corrected words, form) of every form found in the tokens; end is exclusive."""
+        edits: List[int] = []
+        state = 0
+        for pos, token in enumerate(tokens):
+            wid, cost = self._word_id(token)
+            edits.append(cost)
+            if wid < 0:
+                state = 0
+                continue
+            while state and wid not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(wid, 0)
+            for p in self._out[state]:
+                length, target = self._patterns[p]
+                start = pos - length + 1
+                yield start, pos + 1, sum(edits[start:pos + 1]), target
+
+    def extract(self, text: str) -> Dict[str, Optional[str]]:
+        """Best course and assignment named in the text: fewest corrected words, then longest, then first."""
+        found: Dict[str, Optional[str]] = {"course": None, "assignment": None}
+        if not self._patterns:
+            return found
+        best: Dict[str, Tuple[int, int, int]] = {}
+        for start, end, cost, (slot, value) in self._scan(tokenize(text)):
+            rank = (cost, start - end, start)
+            if slot not in best or rank < best[slot]:
+                best[slot] = rank
+                found[slot] = value
+        return found
+
+    def names_only(self, text: str) -> bool:
+        """True if every word of the text (stopwords aside) belongs to a course or assignment name."""
+        tokens = tokenize(text)
+        covered = [False] * len(tokens)
+        for start, end, _cost, _form in self._scan(tokens):
+            covered[start:end] = [True] * (end - start)
+        return all(covered)
@@ -0,0 +1,219 @@
+import argparse
+import csv
+import json
+import re
+import time
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+from sqlalchemy import text
+from db import get_engine, init_db
+
+class TableSpec(NamedTuple):
+    columns: Tuple[str, ...]   # importable columns (ids are assigned by the table)
+    key: Tuple[str, ...]       # natural key: a row with the same key replaces the earlier one
+    required: Tuple[str, ...]  # must be non-empty in every input row
+
+SPECS: Dict[str, TableSpec] = {
+    "faqs": TableSpec(("question", "answer", "tags"), ("question",), ("question", "answer")),
+    "schedules": TableSpec(("course_code", "title", "details"), ("course_code", "title"), ("course_code",)),
+    "deadlines": TableSpec(("course_code", "assignment", "due_at", "submit_to"),
+                           ("course_code", "assignment"), ("course_code", "assignment")),
+}
+CHUNK_SIZE = 1000
+
+# ---------------- Input ----------------
+
+def read_records(path: str, fmt: Optional[str] = None) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """Stream (line number, record) pairs from a CSV file with a header row or a JSONL file."""
+    fmt = fmt or ("jsonl" if path.endswith((".jsonl", ".ndjson")) else "csv")
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        if fmt == "csv":
+            reader = csv.DictReader(f)
+            for rec in reader:
+                yield reader.line_num, rec
+        else:
+            for lineno, line in enumerate(f, 1):
+                if line.strip():
+                    yield lineno, json.loads(line)
+
+def _clean(spec: TableSpec, records: Iterable[Tuple[int, Dict[str, Any]]], source: str) -> Iterator[Dict[str, Any]]:
+    for lineno, rec in records:
+        row = {}
+        for col in spec.columns:
+            value = rec.get(col)
+            if isinstance(value, str):
+                value = value.strip() or None
+            row[col] = value
+        missing = [c for c in spec.required if row[c] is None]
+        if missing:
+            raise ValueError(f"{source}:{lineno}: missing {', '.join(missing)}")
+        yield row
+
+def _chunks(rows: Iterable[Dict[str, Any]], size: int) -> Iterator[List[Dict[str, Any]]]:
+    it = iter(rows)
+    while True:
+        chunk = list(islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+# ---------------- Staging and swap ----------------
+
+def _shadow_name(table: str) -> str:
+    return f"_import_{table}"
+
+def _upsert_sql(target: str, spec: TableSpec, source: Optional[str] = None) -> str:
+    cols = ", ".join(spec.columns)
+    updates = ", ".join(f"{c}=excluded.{c}" for c in spec.columns if c not in spec.key)
+    conflict = f"ON CONFLICT({', '.join(spec.key)}) DO UPDATE SET {updates}"
+    if source:
+        # WHERE true: required by SQLite to parse an upsert on INSERT ... SELECT
+        return f"INSERT INTO {target} (id, {cols}) SELECT id, {cols} FROM {source} WHERE true ORDER BY id {conflict}"
+    values = ", ".join(f":{c}" for c in spec.columns)
+    return f"INSERT INTO {target} ({cols}) VALUES ({values}) {conflict}"
+
+def _create_shadow(conn, table: str, spec: TableSpec, merge: bool):
+    shadow = _shadow_name(table)
+    conn.execute(text(f"DROP TABLE IF EXISTS {shadow}"))  # leftover of an interrupted import
+    create = conn.execute(text("SELECT sql FROM sqlite_master WHERE type='table' AND name=:t"),
+                          {"t": table}).scalar()
+    if not create:
+        raise ValueError(f"unknown table {table}")
+    create = re.sub(rf"^CREATE TABLE\s+(?:IF NOT EXISTS\s+)?[\"`\[]?{table}[\"`\]]?",
+                    f"CREATE TABLE {shadow}", create, count=1, flags=re.I)
+    conn.execute(text(create))
+    conn.execute(text(f"CREATE UNIQUE INDEX {shadow}_key ON {shadow} ({', '.join(spec.key)})"))
+    # Continue the live table's AUTOINCREMENT sequence so ids are never reused
+    seq = conn.execute(text("SELECT seq FROM sqlite_sequence WHERE name=:t"), {"t": table}).scalar()
+    if seq:
+        conn.execute(text("INSERT INTO sqlite_sequence (name, seq) VALUES (:t, :s)"), {"t": shadow, "s": seq})
+    if merge:
+        conn.execute(text(_upsert_sql(shadow, spec, source=table)))
+
+def _keep_live_ids(conn, table: str, spec: TableSpec):
+    """
+    Give staged rows whose natural key is live the live row's id, so references to it
+    (feedback rollups, sessions' last_faq_id) survive a plain re-import. Only new keys
+    keep the fresh ids they were staged with.
+    """
+    shadow = _shadow_name(table)
+    match = " AND ".join(f"s.{c} IS l.{c}" for c in spec.key)
+    conn.execute(text("DROP TABLE IF EXISTS temp._import_ids"))
+    conn.execute(text("CREATE TEMP TABLE _import_ids (staged_id INTEGER PRIMARY KEY, live_id INTEGER NOT NULL)"))
+    # Scans the live table once, probing the shadow's unique key index
+    conn.execute(text(f"""
+        INSERT INTO temp._import_ids (staged_id, live_id)
+        SELECT s.id, MIN(l.id) FROM {table} l JOIN {shadow} s ON {match} GROUP BY s.id
+    """))
+    # Staged ids are above the live sequence, so a live id is never taken by another staged row
+    conn.execute(text(f"""
+        UPDATE {shadow} SET id = (SELECT live_id FROM temp._import_ids WHERE staged_id = {shadow}.id)
+        WHERE id IN (SELECT staged_id FROM temp._import_ids)
+    """))
+    conn.execute(text("DROP TABLE temp._import_ids"))
+    # The staged ids given back were never visible: the sequence only needs to cover what is kept
+    conn.execute(text(f"""
+        UPDATE sqlite_sequence
+        SET seq = MAX(COALESCE((SELECT MAX(id) FROM {shadow}), 0),
+                      COALESCE((SELECT seq FROM sqlite_sequence WHERE name = :t), 0))
+        WHERE name = :s
+    """), {"t": table, "s": shadow})
+
+def _swap(table: str):
+    """Replace `table` by its shadow in one transaction, keeping its indexes and triggers."""
+    shadow, old = _shadow_name(table), f"_old_{table}"
+    raw = get_engine().raw_connection()
+    try:
+        # Raw connection: the DB-API driver would commit around DDL on its own otherwise
+        cur = raw.driver_connection.cursor()
+        cur.execute("BEGIN IMMEDIATE")
+        try:
+            extras = [sql for (sql,) in cur.execute(
+                "SELECT sql FROM sqlite_master WHERE tbl_name=? AND type IN ('index', 'trigger') "
+                "AND sql IS NOT NULL ORDER BY type, name", (table,)).fetchall()]
+            cur.execute(f"DROP INDEX {shadow}_key")
+            cur.execute(f"ALTER TABLE {table} RENAME TO {old}")
+            cur.execute(f"ALTER TABLE {shadow} RENAME TO {table}")
+            cur.execute(f"DROP TABLE {old}")  # takes the old indexes and triggers with it
+            for sql in extras:
+                cur.execute(sql)
+            # The rows went into the shadow table, so no trigger counted them
+            cur.execute("UPDATE data_versions SET version = version + 1 WHERE name = ?", (table,))
+            cur.execute("COMMIT")
+        except Exception:
+            cur.execute("ROLLBACK")
+            raise
+        finally:
+            cur.close()
+    finally:
+        raw.close()
+
+def _after_swap(table: str):
+    # Rebuild what this process can right away; running bots see the version bump and
+    # refresh on their own (the saved FAQ index is then loaded instead of re-fitted).
+    if table == "faqs":
+        from faq_index import rebuild
+        rebuild()
+        from config import FAQ_RETRIEVER
+        if FAQ_RETRIEVER != "tfidf":
+            import dense_index
+            dense_index.rebuild()
+    elif table in ("schedules", "deadlines"):
+        from catalog import refresh_catalog
+        refresh_catalog()
+
+def import_rows(table: str, rows: Iterable[Dict[str, Any]], merge: bool = False,
+                chunk_size: int = CHUNK_SIZE, rebuild: bool = True) -> Dict[str, Any]:
+    """
+    Load `rows` (dicts with the table's columns) into `table` without readers ever
+    seeing a partial load.
+
+    Rows are staged in a shadow table with chunked executemany, upserting on the
+    natural key (later rows win), then swapped in with a rename. With merge=True the
+    shadow starts as a copy of the live rows, so existing rows not in the input are kept.
+    Either way a row whose key is already live keeps its id.
+    """
+    spec = SPECS[table]
+    t0 = time.perf_counter()
+    engine = get_engine()
+    with engine.begin() as conn:
+        _create_shadow(conn, table, spec, merge)
+    read = 0
+    try:
+        sql = text(_upsert_sql(_shadow_name(table), spec))
+        for chunk in _chunks(rows, chunk_size):
+            with engine.begin() as conn:
+                conn.execute(sql, chunk)
+            read += len(chunk)
+        if not merge:
+            with engine.begin() as conn:
+                _keep_live_ids(conn, table, spec)
+        _swap(table)
+    except Exception:
+        with engine.begin() as conn:
+            conn.execute(text(f"DROP TABLE IF EXISTS {_shadow_name(table)}"))
+        raise
+    with engine.begin() as conn:
+        total = conn.execute(text(f"SELECT COUNT(*) FROM {table}")).scalar()
+    if rebuild:
+        _after_swap(table)
+    return {"table": table, "read": read, "rows": total, "seconds": round(time.perf_counter() - t0, 3)}
+
+def import_file(table: str, path: str, fmt: Optional[str] = None, **kwargs) -> Dict[str, Any]:
+    """Stream a CSV (header row) or JSONL file into `table`; see import_rows()."""
+    return import_rows(table, _clean(SPECS[table], read_records(path, fmt), path), **kwargs)
+
+if __name__ == "__main__":
+    # python importer.py faqs data/faqs.csv
+    # python importer.py deadlines exports/deadlines.jsonl --merge
+    ap = argparse.ArgumentParser(description="Bulk-load FAQs, schedules or deadlines from CSV/JSONL.")
+    ap.add_argument("table", choices=sorted(SPECS))
+    ap.add_argument("path")
+    ap.add_argument("--format", choices=["csv", "jsonl"], help="default: from the file extension")
+    ap.add_argument("--merge", action="store_true", help="keep existing rows that are not in the file")
+    ap.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    args = ap.parse_args()
+    init_db()
+    result = import_file(args.table, args.path, args.format, merge=args.merge, chunk_size=args.chunk_size)
+    print(f"Imported {result['read']} rows into {result['table']} "
+          f"({result['rows']} rows now, {result['seconds']}s)")
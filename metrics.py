@@ -0,0 +1,265 @@
+import asyncio
+import bisect
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from config import (
+    METRICS_ENABLED, METRICS_PORT, METRICS_DUMP_PATH, METRICS_DUMP_INTERVAL, METRICS_LOOP_LAG_INTERVAL
+)
+
+# Latency buckets (seconds) shared by the stage/turn histograms
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+CONFIDENCE_BUCKETS = (0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0)
+
+Labels = Tuple[str, ...]
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _fmt_labels(names: Sequence[str], values: Labels, extra: Sequence[Tuple[str, str]] = ()) -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in list(zip(names, values)) + list(extra)]
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+class Counter:
+    def __init__(self, name: str, help_: str, labels: Sequence[str] = ()):
+        self.name, self.help, self.labels = name, help_, tuple(labels)
+        self._values: Dict[Labels, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels: str, n: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + n
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for lv, v in sorted(self._values.items()):
+                lines.append(f"{self.name}{_fmt_labels(self.labels, lv)} {v:g}")
+        return lines
+
+class Histogram:
+    def __init__(self, name: str, help_: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name, self.help, self.labels = name, help_, tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series: Dict[Labels, List[float]] = {}  # bucket counts..., +Inf count, sum
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            s = self._series.get(labels)
+            if s is None:
+                s = self._series[labels] = [0] * (len(self.buckets) + 2)
+            s[i] += 1
+            s[-1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for lv, s in sorted(self._series.items()):
+                cum = 0
+                for le, c in zip(self.buckets, s):
+                    cum += c
+                    lines.append(f"{self.name}_bucket{_fmt_labels(self.labels, lv, [('le', f'{le:g}')])} {cum}")
+                cum += s[len(self.buckets)]
+                lines.append(f"{self.name}_bucket{_fmt_labels(self.labels, lv, [('le', '+Inf')])} {cum}")
+                lines.append(f"{self.name}_sum{_fmt_labels(self.labels, lv)} {s[-1]:.6f}")
+                lines.append(f"{self.name}_count{_fmt_labels(self.labels, lv)} {cum}")
+        return lines
+
+class Gauge:
+    """Value read from a callback at render time (e.g. cache size)."""
+    def __init__(self, name: str, help_: str, fn: Callable[[], float]):
+        self.name, self.help, self.fn = name, help_, fn
+
+    def render(self) -> List[str]:
+        try:
+            value = float(self.fn())
+        except Exception:
+            return []
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge", f"{self.name} {value:g}"]
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def add(self, metric):
+        with self._lock:
+            self._metrics = [m for m in self._metrics if m.name != metric.name] + [metric]
+        return metric
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics)
+        return "\n".join(line for m in metrics for line in m.render()) + "\n"
+
+REGISTRY = Registry()
+STAGE_SECONDS = REGISTRY.add(Histogram("edu_stage_seconds", "Time spent per turn stage", ["stage"]))
+TURN_SECONDS = REGISTRY.add(Histogram("edu_turn_seconds", "End-to-end handler time per turn", ["intent"]))
+FAQ_CONFIDENCE = REGISTRY.add(Histogram("edu_faq_confidence", "Best FAQ similarity of NLU lookups",
+                                        buckets=CONFIDENCE_BUCKETS))
+FALLBACKS = REGISTRY.add(Counter("edu_fallbacks_total", "Turns answered with the fallback reply"))
+DB_COMMITS = REGISTRY.add(Counter("edu_db_commits_total", "Committed DB transactions"))
+QUEUE_WAIT = REGISTRY.add(Histogram("edu_queue_wait_seconds", "Time an update waited for its user's turn and a handler slot",
+                                    buckets=WAIT_BUCKETS))
+SHED = REGISTRY.add(Counter("edu_updates_shed_total", "Updates answered with the busy reply instead of handled", ["reason"]))
+LOOP_LAG = REGISTRY.add(Histogram("edu_event_loop_lag_seconds", "How late the event loop ran a periodic wake-up",
+                                  buckets=WAIT_BUCKETS))
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NOOP = _NoopSpan()
+
+class _Span:
+    __slots__ = ("stage", "t0")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        STAGE_SECONDS.observe(time.perf_counter() - self.t0, self.stage)
+        return False
+
+def span(stage: str):
+    """Time a block into edu_stage_seconds{stage=...}; a shared no-op when metrics are off."""
+    return _Span(stage) if METRICS_ENABLED else _NOOP
+
+def observe_turn(intent: Optional[str], seconds: float):
+    if METRICS_ENABLED:
+        TURN_SECONDS.observe(seconds, intent or "none")
+
+def observe_faq_confidence(score: float):
+    if METRICS_ENABLED:
+        FAQ_CONFIDENCE.observe(score)
+
+def count_fallback():
+    if METRICS_ENABLED:
+        FALLBACKS.inc()
+
+def observe_queue_wait(seconds: float):
+    if METRICS_ENABLED:
+        QUEUE_WAIT.observe(seconds)
+
+def count_shed(reason: str):
+    if METRICS_ENABLED:
+        SHED.inc(reason)
+
+def add_gauge(name: str, help_: str, fn: Callable[[], float]):
+    REGISTRY.add(Gauge(name, help_, fn))
+
+class LoopLagMonitor:
+    """
+    Event-loop lag probe: a task sleeps `interval` seconds in a loop and records how much
+    later than that it woke up, i.e. how long callbacks (handlers, blocking calls) held
+    the loop. Keeps the last `window` samples for the edu_event_loop_lag_max_seconds gauge.
+    """
+    def __init__(self, interval: float = METRICS_LOOP_LAG_INTERVAL, window: int = 40):
+        self.interval = interval
+        self.recent: deque = deque(maxlen=window)
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run(), name="loop-lag")
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            t = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - t - self.interval)
+            self.recent.append(lag)
+            LOOP_LAG.observe(lag)
+
+    def max_recent(self) -> float:
+        return max(self.recent, default=0.0)
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+_loop_lag: Optional[LoopLagMonitor] = None
+
+def watch_loop_lag():
+    """Start the lag probe on the running event loop (call from a coroutine)."""
+    global _loop_lag
+    if not METRICS_ENABLED or not METRICS_LOOP_LAG_INTERVAL or _loop_lag is not None:
+        return
+    _loop_lag = LoopLagMonitor()
+    _loop_lag.start()
+    add_gauge("edu_event_loop_lag_max_seconds", "Worst event-loop lag over the last few probes",
+              _loop_lag.max_recent)
+
+def stop_loop_lag():
+    global _loop_lag
+    if _loop_lag is not None:
+        _loop_lag.stop()
+        _loop_lag = None
+
+def instrument_engine(engine):
+    """Count commits on a SQLAlchemy engine."""
+    if METRICS_ENABLED:
+        from sqlalchemy import event
+        event.listen(engine, "commit", lambda _conn: DB_COMMITS.inc())
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *_args):
+        pass
+
+_server: Optional[ThreadingHTTPServer] = None
+_dumper = None
+
+def start_exporters(port: int = METRICS_PORT, dump_path: str = METRICS_DUMP_PATH):
+    """Serve /metrics on localhost:`port` and/or dump the text to `dump_path` periodically."""
+    global _server, _dumper
+    if not METRICS_ENABLED:
+        return
+    if port and _server is None:
+        _server = ThreadingHTTPServer(("127.0.0.1", port), _Handler)
+        threading.Thread(target=_server.serve_forever, name="metrics-http", daemon=True).start()
+    if dump_path and _dumper is None:
+        from write_behind import BackgroundFlusher
+
+        def dump():
+            with open(dump_path, "w", encoding="utf-8") as f:
+                f.write(REGISTRY.render())
+
+        _dumper = BackgroundFlusher(dump, METRICS_DUMP_INTERVAL, name="metrics-dump")
+        _dumper.start()
+
+def stop_exporters():
+    global _server, _dumper
+    if _server is not None:
+        _server.shutdown()
+        _server.server_close()
+        _server = None
+    if _dumper is not None:
+        _dumper.stop()
+        _dumper = None
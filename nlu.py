@@ -1,10 +1,16 @@
 import json
 import re
-from typing import Tuple, Optional, List, Dict
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-from db import list_faqs, get_intents
-from config import FAQ_SIM_THRESHOLD
+try:  # the regex parser, for deriving keyword prefilters from intent patterns
+    from re import _constants as _sre, _parser as _sre_parse
+except ImportError:  # Python < 3.11
+    import sre_constants as _sre, sre_parse as _sre_parse
+from typing import Tuple, Optional, List, Dict, FrozenSet, Iterable, Iterator, Sequence
+from db import get_intents, get_data_version
+from faq_index import FAQIndex, load_or_build
+from refresher import TableWatcher
+from catalog import get_catalog
+from config import FAQ_SIM_THRESHOLD, FAQ_DENSE_THRESHOLD, FAQ_HYBRID_THRESHOLD, FAQ_RETRIEVER
+from metrics import span, observe_faq_confidence
 
 # Entity extractors:
 # - Course codes like 158.780
@@ -12,48 +18,166 @@ COURSE_RE = re.compile(r"\b(\d{3}\.\d{3})\b")
 # - Assignments like A1, Assignment 1
 ASSIGN_RE = re.compile(r"\b(?:A(?:ssignment)?\s*\d+|A\d+)\b", re.I)
 
+# Score needed to answer from the FAQ bank, per FAQ_RETRIEVER backend
+THRESHOLDS = {"tfidf": FAQ_SIM_THRESHOLD, "dense": FAQ_DENSE_THRESHOLD, "hybrid": FAQ_HYBRID_THRESHOLD}
+
+# Tries at loading a TF-IDF and a dense index of the same faqs version while faqs keeps changing
+LOAD_ATTEMPTS = 3
+
+def _load(kind: str, index: Optional[FAQIndex]):
+    """
+    The TF-IDF index (which holds the FAQ texts) and the `kind` retriever, both built from
+    the faqs version that is still current, so every id the retriever returns has an answer.
+    """
+    for _ in range(LOAD_ATTEMPTS):
+        index = index if index is not None else load_or_build()
+        if kind == "tfidf":
+            return index, index
+        import dense_index  # numpy-only at query time; the dense index is loaded next to the TF-IDF one
+        dense = dense_index.load_or_build(version=index.version)
+        if dense.version == index.version == get_data_version("faqs"):
+            return index, dense_index.DenseRetriever(dense, kind)
+        index = None  # faqs changed in between: load both again
+    raise RuntimeError(f"faqs kept changing; no TF-IDF and {kind} index of one version after {LOAD_ATTEMPTS} tries")
+
 class FAQMatcher:
-    """TF-IDF + cosine similarity FAQ retriever."""
-    def __init__(self):
-        self.faq_rows = list_faqs()
-        self.questions = [f"{r.question} {r.tags or ''}" for r in self.faq_rows]
-        self.vectorizer = TfidfVectorizer(max_features=5000, ngram_range=(1,2))
-        self.matrix = self.vectorizer.fit_transform(self.questions) if self.questions else None
+    """
+    FAQ retriever over a precomputed FAQIndex (questions, answers, TF-IDF).
+
+    Ranking uses FAQ_RETRIEVER: the TF-IDF index itself, or a dense_index retriever
+    ("dense" / "hybrid") built from the same faqs version, each with its own threshold.
+    A given `index` is replaced by a current one if the dense index is newer.
+    """
+    def __init__(self, index: Optional[FAQIndex] = None, retriever: str = FAQ_RETRIEVER):
+        self.index, self.retriever = _load(retriever, index)
+        self.threshold = THRESHOLDS[retriever]
+
+    def answer(self, faq_id: int) -> Optional[str]:
+        """Answer text of an FAQ from the in-memory store (no DB query)."""
+        return self.index.store.answer(faq_id)
+
+    def page(self, offset: int = 0, limit: int = 10) -> List[Tuple[int, str]]:
+        """(faq_id, question) pairs in id order, for paging through the FAQ bank."""
+        return self.index.store.page(offset, limit)
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def search_topk(self, text: str, k: int = 5) -> List[Tuple[int, float]]:
+        """Return up to k ranked (faq_id, similarity) candidates, regardless of threshold."""
+        return self.retriever.search_topk(text, k)
 
     def search(self, text: str) -> Tuple[Optional[int], float]:
         """Return (faq_id, similarity) if above threshold; otherwise (None, score)."""
-        if not self.questions:
+        top = self.search_topk(text, 1)
+        if not top:
             return None, 0.0
-        qv = self.vectorizer.transform([text])
-        sims = cosine_similarity(qv, self.matrix)[0]
-        best_idx = sims.argmax()
-        score = float(sims[best_idx])
-        if score >= FAQ_SIM_THRESHOLD:
-            faq_id = int(self.faq_rows[best_idx].id)
+        faq_id, score = top[0]
+        if score >= self.threshold:
             return faq_id, score
-        return None, float(score)
+        return None, score
+
+    def search_many(self, texts: Sequence[str], threshold: Optional[float] = None) -> List[Tuple[Optional[int], float]]:
+        """Batched search(): one matrix product for all texts, same (faq_id or None, score) results."""
+        threshold = self.threshold if threshold is None else threshold
+        ids, scores = self.retriever.best_many(texts)
+        return [(int(i) if i >= 0 and sc >= threshold else None, float(sc)) for i, sc in zip(ids, scores)]
+
+def _required_literals(items) -> Optional[FrozenSet[str]]:
+    """
+    Literals of which every match of a parsed pattern contains at least one (None if no
+    such set is found). Picks the most selective candidate: the set whose shortest
+    literal is longest.
+    """
+    best: Optional[FrozenSet[str]] = None
+
+    def offer(candidate: Optional[FrozenSet[str]]):
+        nonlocal best
+        if candidate and (best is None or min(map(len, candidate)) > min(map(len, best))):
+            best = candidate
+
+    run: List[str] = []
+    for op, av in items:
+        if op is _sre.LITERAL:
+            run.append(chr(av))
+            continue
+        if run:
+            offer(frozenset(["".join(run)]))
+            run = []
+        if op is _sre.AT:
+            continue  # zero-width (\b, ^, $): requires nothing
+        if op is _sre.SUBPATTERN:
+            offer(_required_literals(av[-1]))
+        elif op is _sre.BRANCH:
+            branches = [_required_literals(seq) for seq in av[1]]
+            if all(branches):
+                offer(frozenset().union(*branches))
+        elif op in (_sre.MAX_REPEAT, _sre.MIN_REPEAT) and av[0] >= 1:
+            offer(_required_literals(av[2]))
+    if run:
+        offer(frozenset(["".join(run)]))
+    return best
+
+def intent_keywords(pattern: str) -> Optional[FrozenSet[str]]:
+    """Case-folded ASCII keywords one of which any match of `pattern` contains, or None."""
+    try:
+        found = _required_literals(_sre_parse.parse(pattern, re.I))
+    except Exception:
+        return None
+    if not found or not all(k.isascii() for k in found):
+        return None
+    return frozenset(k.casefold() for k in found)
 
 class IntentDetector:
-    """Simple rule-based intent classifier driven by regex patterns from DB."""
+    """
+    Rule-based intent classifier driven by regex patterns from DB.
+
+    Intents are tried in `intents.id` order, but each intent's patterns only run if the
+    text contains one of the keywords they require (derived from the patterns, e.g.
+    "deadline", "due", "ddl" for `\\b(deadline|due|ddl)\\b`), so most messages run only
+    the patterns of the intent they end up with, or none at all.
+    """
     def __init__(self):
-        self.rules = []  # list of (intent_name, [compiled regex...])
+        self.version = get_data_version("intents")
+        self.rules = []  # list of (intent_name, [compiled regex...]) in priority order
+        self.keywords: List[Optional[FrozenSet[str]]] = []  # per intent; None = always run
         for row in get_intents():
             try:
                 patterns = json.loads(row.patterns or "[]")
             except Exception:
                 patterns = []
             self.rules.append((row.name, [re.compile(pat, re.I) for pat in patterns]))
+            keywords = [intent_keywords(pat) for pat in patterns]
+            self.keywords.append(frozenset().union(*keywords) if all(keywords) else None)
+
+    def _candidates(self, t: str) -> List[Tuple[str, List[re.Pattern]]]:
+        folded = t.casefold()
+        return [rule for rule, keywords in zip(self.rules, self.keywords)
+                if keywords is None or any(k in folded for k in keywords)]
 
     def detect(self, text: str) -> Optional[str]:
         t = text.strip()
-        for name, regs in self.rules:
+        folded = t.casefold()
+        for (name, regs), keywords in zip(self.rules, self.keywords):
+            if keywords is not None and not any(k in folded for k in keywords):
+                continue
             for rg in regs:
                 if rg.search(t):
                     return name
         return None
 
+    def detect_all(self, text: str) -> List[str]:
+        """Every intent whose patterns match, highest priority first."""
+        t = text.strip()
+        return [name for name, regs in self._candidates(t) if any(rg.search(t) for rg in regs)]
+
 def extract_entities(text: str) -> Dict[str, Optional[str]]:
-    """Extract basic entities (course code, assignment identifier)."""
+    """
+    Extract basic entities (course code, assignment identifier).
+
+    Exact patterns win; whatever they miss is looked up in the catalog gazetteer
+    ("158780", course titles, misspelled "assigment 2").
+    """
     course = None
     m = COURSE_RE.search(text)
     if m:
@@ -64,23 +188,91 @@ def extract_entities(text: str) -> Dict[str, Optional[str]]:
     if m2:
         assignment = m2.group(0).upper().replace("ASSIGNMENT", "A").replace(" ", "")
 
+    if course is None or assignment is None:
+        found = get_catalog().gazetteer.extract(text)
+        course = course or found["course"]
+        assignment = assignment or found["assignment"]
+
     return {"course": course, "assignment": assignment}
 
+def slot_only(text: str, ents: Dict[str, Optional[str]]) -> bool:
+    """
+    True for a message that does nothing but name a course and/or assignment ("A1",
+    "158780 A1"): a slot follow-up for the dialog, never an FAQ question.
+    """
+    if not (ents.get("course") or ents.get("assignment")):
+        return False
+    rest = ASSIGN_RE.sub(" ", COURSE_RE.sub(" ", text))
+    return get_catalog().gazetteer.names_only(rest)
+
 class NLU:
     """Orchestrates intent detection + FAQ retrieval + entity extraction."""
     def __init__(self):
         self.faq = FAQMatcher()
         self.intent = IntentDetector()
 
+    def refresh_faq(self):
+        """Load (or rebuild) the current FAQ index and swap it in; queries keep using the old one until then."""
+        self.faq = FAQMatcher(load_or_build())
+
+    def refresh_intents(self):
+        """Recompile intent rules after the intents table changed."""
+        self.intent = IntentDetector()
+
+    def watch_changes(self, watcher: TableWatcher):
+        """Keep this NLU in sync with edits to the tables it was built from."""
+        watcher.watch(["faqs"], lambda _versions: self.refresh_faq(), {"faqs": self.faq.index.version or 0})
+        watcher.watch(["intents"], lambda _versions: self.refresh_intents(), {"intents": self.intent.version})
+
     def analyze(self, user_text: str) -> Tuple[Optional[str], Optional[int], float, Dict[str, Optional[str]]]:
-        ents = extract_entities(user_text)
+        with span("nlu.entities"):
+            ents = extract_entities(user_text)
 
-        it = self.intent.detect(user_text)
+        with span("nlu.intent"):
+            it = self.intent.detect(user_text)
         if it:
             return it, None, 1.0, ents
+        if slot_only(user_text, ents):
+            return None, None, 0.0, ents
 
-        faq_id, score = self.faq.search(user_text)
+        with span("nlu.faq"):
+            faq_id, score = self.faq.search(user_text)
+        observe_faq_confidence(score)
         if faq_id is not None:
             return "faq", faq_id, score, ents
 
         return None, None, 0.0, ents
+
+    def analyze_many(self, texts: Iterable[str], batch_size: int = 1024,
+                     threshold: Optional[float] = None) -> Iterator[Tuple[Optional[str], Optional[int], float, Dict[str, Optional[str]]]]:
+        """
+        Streamed analyze() over many texts (e.g. re-scoring the message log).
+
+        Texts are consumed and results yielded in batches of `batch_size`; the FAQ
+        scoring of each batch is a single matrix product. `threshold` overrides the
+        retriever's threshold, which makes threshold sweeps possible.
+        """
+        batch: List[str] = []
+        for text in texts:
+            batch.append(text)
+            if len(batch) >= batch_size:
+                yield from self._analyze_batch(batch, threshold)
+                batch = []
+        if batch:
+            yield from self._analyze_batch(batch, threshold)
+
+    def _analyze_batch(self, texts: List[str], threshold: Optional[float]):
+        faq, detector = self.faq, self.intent  # one consistent snapshot per batch
+        ents = [extract_entities(t) for t in texts]
+        intents = [detector.detect(t) for t in texts]
+        pending = [i for i, it in enumerate(intents) if not it and not slot_only(texts[i], ents[i])]
+        matches = dict(zip(pending, faq.search_many([texts[i] for i in pending], threshold)))
+        for i, text in enumerate(texts):
+            if intents[i]:
+                yield intents[i], None, 1.0, ents[i]
+                continue
+            faq_id, score = matches.get(i, (None, 0.0))
+            if faq_id is not None:
+                yield "faq", faq_id, score, ents[i]
+            else:
+                yield None, None, 0.0, ents[i]
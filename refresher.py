@@ -0,0 +1,88 @@
+import threading
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+import db
+from config import DATA_REFRESH_INTERVAL
+
+Callback = Callable[[Dict[str, int]], None]
+
+class TableWatcher:
+    """
+    Background poller of the data_versions change counters.
+
+    Callbacks registered with watch() run on the watcher's own thread whenever one of
+    their tables changes, so rebuilding in-memory structures never blocks the event
+    loop. A callback that raises is retried on the next poll.
+    """
+    def __init__(self, interval: float = DATA_REFRESH_INTERVAL):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._watches: List[Tuple[Tuple[str, ...], Callback, Dict[str, int]]] = []
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def watch(self, tables: Sequence[str], callback: Callback, versions: Optional[Dict[str, int]] = None):
+        """
+        Call `callback(current_versions)` whenever any of `tables` changes.
+        `versions` are the counters the caller's data already reflects (default: current).
+        """
+        tables = tuple(tables)
+        if versions is None:
+            current = db.get_data_versions()
+            versions = {t: current.get(t, 0) for t in tables}
+        with self._lock:
+            self._watches.append((tables, callback, dict(versions)))
+        self.start()
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="table-watcher", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def poll_once(self):
+        """Check the counters once and run callbacks for changed tables."""
+        current = db.get_data_versions()
+        with self._lock:
+            watches = list(self._watches)
+        for tables, callback, seen in watches:
+            changed = {t: current.get(t, 0) for t in tables if current.get(t, 0) != seen.get(t, 0)}
+            if not changed:
+                continue
+            try:
+                callback(current)
+            except Exception as e:
+                print(f"[table-watcher] refresh of {', '.join(tables)} failed: {e}")
+                continue
+            seen.update(changed)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.poll_once()
+            except Exception as e:
+                print(f"[table-watcher] poll failed: {e}")
+
+_watcher: Optional[TableWatcher] = None
+_watcher_lock = threading.Lock()
+
+def get_table_watcher() -> TableWatcher:
+    """Return the process-wide table watcher."""
+    global _watcher
+    if _watcher is None:
+        with _watcher_lock:
+            if _watcher is None:
+                _watcher = TableWatcher()
+    return _watcher
+
+def stop_table_watcher():
+    global _watcher
+    with _watcher_lock:
+        if _watcher is not None:
+            _watcher.stop()
+            _watcher = None
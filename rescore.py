@@ -0,0 +1,46 @@
+import argparse
+from collections import Counter
+from retention import iter_messages
+from nlu import NLU
+
+def rescore(since=None, until=None, thresholds=None, batch_size=1024):
+    """
+    Re-run the current NLU over logged incoming messages (archived and live).
+
+    Returns (total, intent_counts, faq_hits) where faq_hits[t] is how many messages
+    would be answered from the FAQ bank with threshold t (default: the retriever's own).
+    """
+    nlu = NLU()
+    thresholds = thresholds or (nlu.faq.threshold,)
+    floor = min(thresholds)
+    texts = (r.text or "" for r in iter_messages("in", since, until))
+    total, intents, scores = 0, Counter(), []
+    for intent, _faq_id, conf, _ents in nlu.analyze_many(texts, batch_size=batch_size, threshold=floor):
+        total += 1
+        if intent == "faq":
+            scores.append(conf)
+        else:
+            intents[intent or "fallback"] += 1
+    faq_hits = {t: sum(1 for s in scores if s >= t) for t in thresholds}
+    return total, intents, faq_hits
+
+if __name__ == "__main__":
+    # python rescore.py --since 2026-10-01 --thresholds 0.2,0.25,0.3,0.35,0.4
+    ap = argparse.ArgumentParser(description="Re-score the message log with the current NLU.")
+    ap.add_argument("--since", help="created_at lower bound, e.g. 2026-10-01")
+    ap.add_argument("--until", help="created_at upper bound (exclusive)")
+    ap.add_argument("--thresholds", help="comma-separated FAQ thresholds to compare (default: the configured one)")
+    ap.add_argument("--batch-size", type=int, default=1024)
+    args = ap.parse_args()
+    ths = sorted(float(t) for t in args.thresholds.split(",")) if args.thresholds else None
+    total, intents, faq_hits = rescore(args.since, args.until, ths, args.batch_size)
+    ths = sorted(faq_hits)
+    print(f"Messages re-scored: {total}")
+    for name, n in intents.most_common():
+        if name != "fallback":
+            print(f"  intent {name:<12} {n}")
+    for t in ths:
+        # Below-threshold texts fall back (before dialog-level entity handling)
+        fallback = intents["fallback"] + faq_hits[ths[0]] - faq_hits[t]
+        print(f"  threshold {t:.2f}: faq {faq_hits[t]} ({faq_hits[t] / max(total, 1):.1%}), "
+              f"fallback {fallback} ({fallback / max(total, 1):.1%})")
@@ -0,0 +1,183 @@
+import argparse
+import atexit
+import os
+import threading
+import time
+from collections import namedtuple
+from typing import Dict, Iterator, List, Optional
+import db
+from config import RETENTION_DAYS, ARCHIVE_DIR, ARCHIVE_COMPRESSION, RETENTION_INTERVAL, RETENTION_BATCH
+
+COLUMNS = ("id", "user_id", "direction", "text", "intent", "confidence", "created_at")
+Message = namedtuple("Message", COLUMNS)  # same fields as db.iter_messages rows
+PAUSE = 0.05  # seconds between delete batches, so buffered log writes get the lock in between
+
+def _pandas():
+    # Imported lazily: only archiving and reading archives need pandas + pyarrow
+    import pandas as pd
+    return pd
+
+def _cutoff(days: float) -> str:
+    # Same text format as created_at (UTC CURRENT_TIMESTAMP)
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(time.time() - days * 86400))
+
+def _partition(archive_dir: str, day: str) -> str:
+    return os.path.join(archive_dir, "messages", f"date={day}")
+
+# ---------------- Archiving ----------------
+
+def archive_batch(rows: List, archive_dir: str = ARCHIVE_DIR, compression: str = ARCHIVE_COMPRESSION) -> int:
+    """Write rows to one Parquet file per day, named by id range (re-archiving a batch overwrites it)."""
+    pd = _pandas()
+    by_day: Dict[str, List] = {}
+    for r in rows:
+        by_day.setdefault(str(r.created_at)[:10], []).append(r)
+    for day, day_rows in by_day.items():
+        frame = pd.DataFrame([tuple(r) for r in day_rows], columns=list(COLUMNS))
+        frame = frame.astype({"id": "int64", "user_id": "int64", "confidence": "float64"})
+        frame["created_at"] = frame["created_at"].astype(str)
+        part = _partition(archive_dir, day)
+        os.makedirs(part, exist_ok=True)
+        path = os.path.join(part, f"part-{day_rows[0].id:012d}-{day_rows[-1].id:012d}.parquet")
+        tmp = path + ".tmp"
+        frame.to_parquet(tmp, compression=compression, index=False)
+        os.replace(tmp, path)
+    return len(rows)
+
+def run_once(days: float = RETENTION_DAYS, archive_dir: str = ARCHIVE_DIR, batch: int = RETENTION_BATCH,
+             stop: Optional[threading.Event] = None) -> int:
+    """
+    Move messages older than `days` into the archive; returns the number moved.
+
+    Works in batches of `batch` rows: archive first, then delete exactly those rows in
+    a short transaction. A crash in between only means the batch is archived again
+    (same file name) on the next run.
+    """
+    if days <= 0:
+        return 0
+    before = _cutoff(days)
+    moved = 0
+    while stop is None or not stop.is_set():
+        rows = db.oldest_messages(before, batch)
+        if not rows:
+            break
+        archive_batch(rows, archive_dir)
+        moved += db.delete_messages(rows[0].id, rows[-1].id, before)
+        if len(rows) < batch:
+            break
+        time.sleep(PAUSE)
+    return moved
+
+# ---------------- Reading ----------------
+
+def _archive_days(archive_dir: str) -> List[str]:
+    root = os.path.join(archive_dir, "messages")
+    if not os.path.isdir(root):
+        return []
+    return sorted(d[len("date="):] for d in os.listdir(root) if d.startswith("date="))
+
+def iter_archived(direction: Optional[str] = None, since: Optional[str] = None, until: Optional[str] = None,
+                  user_id: Optional[int] = None, archive_dir: str = ARCHIVE_DIR) -> Iterator[Message]:
+    """Archived messages in id order; partitions outside [since, until) are not opened."""
+    days = [d for d in _archive_days(archive_dir)
+            if (not since or d >= since[:10]) and (not until or d <= until[:10])]
+    if not days:
+        return
+    pd = _pandas()
+    for day in days:
+        part = _partition(archive_dir, day)
+        files = sorted(f for f in os.listdir(part) if f.endswith(".parquet"))
+        if not files:
+            continue
+        frame = pd.concat([pd.read_parquet(os.path.join(part, f)) for f in files], ignore_index=True)
+        mask = pd.Series(True, index=frame.index)
+        if direction:
+            mask &= frame["direction"] == direction
+        if since:
+            mask &= frame["created_at"] >= since
+        if until:
+            mask &= frame["created_at"] < until
+        if user_id is not None:
+            mask &= frame["user_id"] == user_id
+        frame = frame[mask].drop_duplicates("id").sort_values("id")
+        frame = frame.astype(object).where(frame.notna(), None)
+        for rec in frame.itertuples(index=False, name=None):
+            yield Message(*rec)
+
+def iter_messages(direction: Optional[str] = "in", since: Optional[str] = None, until: Optional[str] = None,
+                  user_id: Optional[int] = None, archive_dir: str = ARCHIVE_DIR) -> Iterator:
+    """
+    Like db.iter_messages, but over archived and live messages together: archived
+    rows first (oldest days first), then the live table. A row present in both (a
+    batch archived but not yet deleted) is returned once.
+    """
+    first_live = db.first_message_id()
+    overlap = set()  # archived ids that may still be live; normally none
+    for m in iter_archived(direction, since, until, user_id, archive_dir):
+        if first_live is not None and m.id >= first_live:
+            overlap.add(m.id)
+        yield m
+    for r in db.iter_messages(direction, since, until):
+        if (user_id is None or r.user_id == user_id) and r.id not in overlap:
+            yield r
+
+# ---------------- Periodic job ----------------
+
+class RetentionJob:
+    """Daemon thread that runs run_once() every `interval` seconds."""
+    def __init__(self, days: float = RETENTION_DAYS, interval: float = RETENTION_INTERVAL):
+        self.days = days
+        self.interval = interval
+        self.moved = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="retention", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stop between batches; rows not yet moved wait for the next start."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.moved += run_once(self.days, stop=self._stop)
+            except Exception as e:
+                print(f"[retention] archiving failed: {e}")
+            self._stop.wait(self.interval)
+
+_job: Optional[RetentionJob] = None
+
+def start_retention() -> Optional[RetentionJob]:
+    """Start the process-wide retention job if RETENTION_DAYS is set."""
+    global _job
+    if RETENTION_DAYS > 0 and _job is None:
+        _job = RetentionJob()
+        _job.start()
+    return _job
+
+@atexit.register
+def stop_retention():
+    global _job
+    if _job is not None:
+        _job.stop()
+        _job = None
+
+if __name__ == "__main__":
+    # python retention.py --days 90
+    ap = argparse.ArgumentParser(description="Move old messages from the DB into the Parquet archive.")
+    ap.add_argument("--days", type=float, default=RETENTION_DAYS or 90)
+    ap.add_argument("--batch", type=int, default=RETENTION_BATCH)
+    ap.add_argument("--archive-dir", default=ARCHIVE_DIR)
+    args = ap.parse_args()
+    t0 = time.perf_counter()
+    n = run_once(args.days, args.archive_dir, args.batch)
+    print(f"Archived {n} messages older than {args.days:g} days to {args.archive_dir} "
+          f"in {time.perf_counter() - t0:.1f}s")
@@ -75,6 +75,76 @@ CREATE TABLE IF NOT EXISTS deadlines (
     submit_to   TEXT
 );
 
+-- Change counters for tables the bot caches in memory; triggers bump them on every write
+-- so long-running processes can notice edits and refresh (see refresher.py)
+CREATE TABLE IF NOT EXISTS data_versions (
+    name TEXT PRIMARY KEY,
+    version INTEGER NOT NULL DEFAULT 0
+);
+
+INSERT OR IGNORE INTO data_versions (name, version) VALUES ('faqs', 0);
+CREATE TRIGGER IF NOT EXISTS trg_faqs_version_ins AFTER INSERT ON faqs
+BEGIN UPDATE data_versions SET version = version + 1 WHERE name = 'faqs'; END;
+CREATE TRIGGER IF NOT EXISTS trg_faqs_version_upd AFTER UPDATE ON faqs
+BEGIN UPDATE data_versions SET version = version + 1 WHERE name = 'faqs'; END;
+CREATE TRIGGER IF NOT EXISTS trg_faqs_version_del AFTER DELETE ON faqs
+BEGIN UPDATE data_versions SET version = version + 1 WHERE name = 'faqs'; END;
+
+INSERT OR IGNORE INTO data_versions (name, version) VALUES ('intents', 0);
+CREATE TRIGGER IF NOT EXISTS trg_intents_version_ins AFTER INSERT ON intents
+BEGIN UPDATE data_versions SET version = version + 1 WHERE name = 'intents'; END;
+CREATE TRIGGER IF NOT EXISTS trg_intents_version_upd AFTER UPDATE ON intents
+BEGIN UPDATE data_versions SET version = version + 1 WHERE name = 'intents'; END;
+CREATE TRIGGER IF NOT EXISTS trg_intents_version_del AFTER DELETE ON intents
+BEGIN UPDATE data_versions SET version = version + 1 WHERE name = 'intents'; END;
+
+INSERT OR IGNORE INTO data_versions (name, version) VALUES ('schedules', 0);
+CREATE TRIGGER IF NOT EXISTS trg_schedules_version_ins AFTER INSERT ON schedules
+BEGIN UPDATE data_versions SET version = version + 1 WHERE name = 'schedules'; END;
+CREATE TRIGGER IF NOT EXISTS trg_schedules_version_upd AFTER UPDATE ON schedules
+BEGIN UPDATE data_versions SET version = version + 1 WHERE name = 'schedules'; END;
+CREATE TRIGGER IF NOT EXISTS trg_schedules_version_del AFTER DELETE ON schedules
+BEGIN UPDATE data_versions SET version = version + 1 WHERE name = 'schedules'; END;
+
+INSERT OR IGNORE INTO data_versions (name, version) VALUES ('deadlines', 0);
+CREATE TRIGGER IF NOT EXISTS trg_deadlines_version_ins AFTER INSERT ON deadlines
+BEGIN UPDATE data_versions SET version = version + 1 WHERE name = 'deadlines'; END;
+CREATE TRIGGER IF NOT EXISTS trg_deadlines_version_upd AFTER UPDATE ON deadlines
+BEGIN UPDATE data_versions SET version = version + 1 WHERE name = 'deadlines'; END;
+CREATE TRIGGER IF NOT EXISTS trg_deadlines_version_del AFTER DELETE ON deadlines
+BEGIN UPDATE data_versions SET version = version + 1 WHERE name = 'deadlines'; END;
+
+-- Hourly rollups of the message/feedback log, updated in the same transaction as the log
+-- rows (db.write_log_batch), so reports never scan the log (see analytics.py).
+-- hour is 'YYYY-MM-DD HH:00:00' UTC; intent '' means none.
+CREATE TABLE IF NOT EXISTS rollup_messages (
+    hour TEXT NOT NULL,
+    direction TEXT NOT NULL,
+    intent TEXT NOT NULL,
+    messages INTEGER NOT NULL DEFAULT 0,
+    confidence_sum REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (hour, direction, intent)
+) WITHOUT ROWID;
+
+-- Confidence histogram of incoming messages: bucket b counts confidence in [b/10, (b+1)/10), 1.0 in bucket 9
+CREATE TABLE IF NOT EXISTS rollup_confidence (
+    hour TEXT NOT NULL,
+    intent TEXT NOT NULL,
+    bucket INTEGER NOT NULL,
+    messages INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (hour, intent, bucket)
+) WITHOUT ROWID;
+
+-- Ratings by the reply they rate: intent of the bot's last reply, faq_id 0 if it was not an FAQ answer
+CREATE TABLE IF NOT EXISTS rollup_feedback (
+    hour TEXT NOT NULL,
+    intent TEXT NOT NULL,
+    faq_id INTEGER NOT NULL,
+    ratings INTEGER NOT NULL DEFAULT 0,
+    rating_sum INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (hour, intent, faq_id)
+) WITHOUT ROWID;
+
 CREATE INDEX IF NOT EXISTS idx_messages_user_created ON messages(user_id, created_at DESC);
 CREATE INDEX IF NOT EXISTS idx_faqs_tags ON faqs(tags);
 CREATE INDEX IF NOT EXISTS idx_schedules_course ON schedules(course_code);
@@ -1,6 +1,6 @@
 import json
-from sqlalchemy import text
-from db import init_db, get_engine, upsert_intent
+from db import init_db, upsert_intent
+from importer import import_rows
 
 # FAQ seed data (demo content; replace with your real course data)
 FAQS = [
@@ -53,25 +53,10 @@ DEADLINES = [
 def seed():
     """Initialize DB and load seed content."""
     init_db()
-    eng = get_engine()
-    with eng.begin() as conn:
-        # FAQs
-        conn.execute(text("DELETE FROM faqs"))
-        for q, a, tags in FAQS:
-            conn.execute(text("INSERT INTO faqs (question, answer, tags) VALUES (:q,:a,:t)"),
-                         {"q": q, "a": a, "t": tags})
-
-        # Schedules
-        conn.execute(text("DELETE FROM schedules"))
-        for c, title, details in SCHEDULES:
-            conn.execute(text("INSERT INTO schedules (course_code, title, details) VALUES (:c,:t,:d)"),
-                         {"c": c, "t": title, "d": details})
-
-        # Deadlines
-        conn.execute(text("DELETE FROM deadlines"))
-        for c, a, due, sub in DEADLINES:
-            conn.execute(text("INSERT INTO deadlines (course_code, assignment, due_at, submit_to) VALUES (:c,:a,:du,:s)"),
-                         {"c": c, "a": a, "du": due, "s": sub})
+    import_rows("faqs", ({"question": q, "answer": a, "tags": tags} for q, a, tags in FAQS))
+    import_rows("schedules", ({"course_code": c, "title": title, "details": details} for c, title, details in SCHEDULES))
+    import_rows("deadlines", ({"course_code": c, "assignment": a, "due_at": due, "submit_to": sub}
+                              for c, a, due, sub in DEADLINES))
 
     # Intents
     for name, patterns in INTENTS.items():
@@ -0,0 +1,232 @@
+import atexit
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+import db
+from config import SESSION_CACHE_MAX, SESSION_TTL, SESSION_FLUSH_INTERVAL, SESSION_FLUSH_MAX_DIRTY
+from write_behind import BackgroundFlusher
+
+class SessionContext:
+    """
+    Conversation context of one user.
+
+    Compact replacement for the free-form context dict; it keeps the dict-style
+    access (`ctx["slots"]`, `ctx.get("last_course")`) that dialog.py relies on.
+    The last_reply_* fields describe the bot's latest logged reply, so feedback can
+    be attributed to it; the dialog logic does not read them.
+    """
+    __slots__ = ("pending_intent", "slots", "last_course", "last_assignment",
+                 "last_reply_id", "last_reply_intent", "last_faq_id")
+
+    def __init__(self, pending_intent: Optional[str] = None, slots: Optional[Dict[str, Any]] = None,
+                 last_course: Optional[str] = None, last_assignment: Optional[str] = None,
+                 last_reply_id: Optional[int] = None, last_reply_intent: Optional[str] = None,
+                 last_faq_id: Optional[int] = None):
+        self.pending_intent = pending_intent
+        self.slots = slots if slots is not None else {}
+        self.last_course = last_course
+        self.last_assignment = last_assignment
+        self.last_reply_id = last_reply_id
+        self.last_reply_intent = last_reply_intent
+        self.last_faq_id = last_faq_id
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "SessionContext":
+        return cls(d.get("pending_intent"), dict(d.get("slots") or {}), d.get("last_course"), d.get("last_assignment"),
+                   d.get("last_reply_id"), d.get("last_reply_intent"), d.get("last_faq_id"))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def copy(self) -> "SessionContext":
+        return SessionContext(self.pending_intent, dict(self.slots), self.last_course, self.last_assignment,
+                              self.last_reply_id, self.last_reply_intent, self.last_faq_id)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        value = getattr(self, key, None) if key in self.__slots__ else None
+        return default if value is None else value
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key: str, value: Any):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __repr__(self) -> str:
+        return f"SessionContext({self.to_dict()!r})"
+
+class _Entry:
+    __slots__ = ("ctx", "touched", "dirty")
+
+    def __init__(self, ctx: SessionContext, dirty: bool):
+        self.ctx = ctx
+        self.touched = time.monotonic()
+        self.dirty = dirty
+
+class SessionStore:
+    """
+    Session cache keyed by internal user id, with batched write-back.
+
+    Reads are served from memory after the first load; saves only mark the entry dirty
+    and a background thread upserts dirty entries in batches. Entries idle for more than
+    `ttl` seconds, or beyond `max_entries` (least recently used first), are evicted;
+    dirty ones are written before they are dropped.
+    """
+    def __init__(self, max_entries: int = SESSION_CACHE_MAX, ttl: float = SESSION_TTL,
+                 interval: float = SESSION_FLUSH_INTERVAL, max_dirty: int = SESSION_FLUSH_MAX_DIRTY,
+                 writer: Callable[[List[Dict[str, Any]]], None] = db.write_sessions):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_dirty = max_dirty
+        self._writer = writer
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._evicted: Dict[int, SessionContext] = {}  # dirty entries dropped before being written
+        self._dirty = 0
+        self._flusher = BackgroundFlusher(self.flush, interval, name="session-store")
+        self._flusher.start()
+
+    def peek(self, user_id: int) -> Optional[SessionContext]:
+        """Return a copy of the cached context, or None when it would need a DB read."""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                ctx = self._evicted.get(user_id)
+                return ctx.copy() if ctx is not None else None
+            entry.touched = time.monotonic()
+            self._entries.move_to_end(user_id)
+            return entry.ctx.copy()
+
+    def get(self, user_id: int) -> SessionContext:
+        """Get a copy of the user's context, loading (or creating) it on a cache miss."""
+        ctx = self.peek(user_id)
+        if ctx is not None:
+            return ctx
+        stored = db.load_session(user_id)
+        with self._lock:
+            if user_id in self._evicted:
+                self._put(user_id, self._evicted[user_id], dirty=True)
+            elif user_id not in self._entries:  # another thread may have loaded it meanwhile
+                if stored is None:
+                    self._put(user_id, SessionContext(), dirty=True)
+                else:
+                    self._put(user_id, SessionContext.from_dict(stored), dirty=False)
+            return self._entries[user_id].ctx.copy()
+
+    def save(self, user_id: int, ctx: SessionContext):
+        """Replace the user's context; it is written back on the next flush."""
+        if not isinstance(ctx, SessionContext):
+            ctx = SessionContext.from_dict(ctx)
+        with self._lock:
+            self._put(user_id, ctx.copy(), dirty=True)
+            full = self._dirty >= self.max_dirty
+        if full:
+            self._flusher.poke()
+
+    def reset(self, user_id: int):
+        """Reset the user's context to a clean state."""
+        self.save(user_id, SessionContext())
+
+    def _put(self, user_id: int, ctx: SessionContext, dirty: bool):
+        # Caller holds self._lock
+        self._evicted.pop(user_id, None)
+        entry = self._entries.get(user_id)
+        if entry is None:
+            self._entries[user_id] = _Entry(ctx, dirty)
+            self._dirty += dirty
+        else:
+            entry.ctx = ctx
+            entry.touched = time.monotonic()
+            if dirty and not entry.dirty:
+                entry.dirty = True
+                self._dirty += 1
+            self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_entries:
+            self._evict(*self._entries.popitem(last=False))
+
+    def _evict(self, user_id: int, entry: _Entry):
+        # Caller holds self._lock; the entry is already out of self._entries
+        if entry.dirty:
+            self._dirty -= 1
+            self._evicted[user_id] = entry.ctx
+
+    def flush(self) -> int:
+        """Write back dirty contexts and evict idle ones; returns the number of rows written."""
+        with self._flush_lock:
+            cutoff = time.monotonic() - self.ttl
+            with self._lock:
+                rows = dict(self._evicted)
+                for uid, entry in self._entries.items():
+                    if entry.dirty:
+                        rows[uid] = entry.ctx
+                        entry.dirty = False
+                self._dirty = 0
+                # LRU order: idle entries sit at the front
+                while self._entries:
+                    uid, entry = next(iter(self._entries.items()))
+                    if entry.touched > cutoff:
+                        break
+                    del self._entries[uid]
+                    if uid in rows:
+                        self._evicted[uid] = entry.ctx  # still readable until written
+            if not rows:
+                return 0
+            payload = [{"u": uid, "c": json.dumps(ctx.to_dict(), ensure_ascii=False)} for uid, ctx in rows.items()]
+            try:
+                self._writer(payload)
+            except Exception:
+                with self._lock:
+                    for uid, ctx in rows.items():
+                        entry = self._entries.get(uid)
+                        if entry is not None and entry.ctx is ctx and not entry.dirty:
+                            entry.dirty = True
+                            self._dirty += 1
+                raise
+            with self._lock:
+                for uid, ctx in rows.items():
+                    if self._evicted.get(uid) is ctx:
+                        del self._evicted[uid]
+            return len(rows)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def close(self):
+        """Stop the background writer after a final flush."""
+        self._flusher.stop()
+
+_store: Optional[SessionStore] = None
+_store_lock = threading.Lock()
+
+def get_session_store() -> SessionStore:
+    """Return the process-wide session store, starting it on first use."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = SessionStore()
+    return _store
+
+def install_session_store(store: SessionStore):
+    """Make `store` the process-wide session store (e.g. one that writes through another process)."""
+    global _store
+    with _store_lock:
+        if _store is not None and _store is not store:
+            _store.close()
+        _store = store
+
+@atexit.register
+def close_session_store():
+    """Flush and stop the process-wide session store (safe to call more than once)."""
+    global _store
+    with _store_lock:
+        if _store is not None:
+            _store.close()
+            _store = None
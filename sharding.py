@@ -0,0 +1,296 @@
+"""
+Multi-process mode: one front process, N conversation workers, one DB writer.
+
+The front process receives updates (polling or webhook) and forwards each one to
+worker `shard_of(user id)`, so all turns of a user land on the same worker, in
+order. Every worker runs the normal handlers with its own NLU, answer cache,
+session store, user cache and log buffer; these hand their writes to the single
+writer process, which owns all user/message/feedback/session writes and runs the
+retention job. Message ids stay unique because worker k only allocates ids
+congruent to k modulo N, starting above the highest id the writer has seen (so a
+restarted worker skips ids its predecessor left queued but not yet committed).
+"""
+import asyncio, multiprocessing, os, queue, signal, threading, time, zlib
+from typing import Any, Dict, List, Optional, Tuple
+from telegram import Update
+from telegram.ext import ApplicationBuilder, TypeHandler
+from config import TELEGRAM_BOT_TOKEN, TELEGRAM_API_BASE_URL, BOT_MODE, WORKER_PROCESSES, WORKER_STOP_TIMEOUT
+import db
+from dispatcher import update_key
+
+_POLL = 1.0  # seconds between liveness checks while blocked on a queue
+
+def shard_of(key: int, shards: int) -> int:
+    """Stable shard for a user id (the same in every process and across restarts)."""
+    return zlib.crc32(str(key).encode()) % shards
+
+def strided_start(last_id: int, offset: int, step: int) -> int:
+    """First id above `last_id` that is congruent to `offset` modulo `step`."""
+    first = last_id + 1
+    return first + (offset - first) % step
+
+def _parent_alive() -> bool:
+    parent = multiprocessing.parent_process()
+    return parent is None or parent.is_alive()
+
+def _ignore_signals():
+    # Ctrl-C reaches the whole process group; only the front decides when to stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+
+# ---------------- Writer process ----------------
+
+class WriterClient:
+    """Blocking stand-in for the db calls that write (or need the writer's view), run in the writer process."""
+    def __init__(self, worker: int, requests, replies):
+        self._worker = worker
+        self._requests = requests
+        self._replies = replies
+        self._lock = threading.Lock()  # one request in flight per worker
+        self._seq = 0
+
+    def _call(self, kind: str, *payload):
+        with self._lock:
+            self._seq += 1
+            token = (os.getpid(), self._seq)  # a restarted worker must not take its predecessor's replies
+            self._requests.put((kind, self._worker, token, payload))
+            while True:
+                try:
+                    got, result, error = self._replies.get(timeout=_POLL)
+                except queue.Empty:
+                    if not _parent_alive():
+                        raise RuntimeError("writer process unavailable")
+                    continue
+                if got == token:
+                    break
+        if error:
+            raise RuntimeError(f"writer: {error}")
+        return result
+
+    def last_message_id(self) -> int:
+        """Highest message id committed or queued so far; requests sent before this one are counted."""
+        return self._call("last_id")
+
+    def get_or_create_user(self, tg_user_id: int, first_name: str = "", last_name: str = "", username: str = "") -> int:
+        return self._call("user", tg_user_id, first_name, last_name, username)
+
+    def write_log_batch(self, messages: List[Dict[str, Any]], feedback: List[Dict[str, Any]]):
+        self._call("log", messages, feedback)
+
+    def write_sessions(self, rows: List[Dict[str, Any]]):
+        self._call("sessions", rows)
+
+_WRITES = ("log", "sessions")  # request kinds committed together; the rest are answered one by one
+
+def _apply(batch: List[Tuple[str, int, Any, tuple]]):
+    messages, feedback, sessions = [], [], {}
+    for kind, _worker, _token, payload in batch:
+        if kind == "log":
+            messages.extend(payload[0])
+            feedback.extend(payload[1])
+        else:
+            sessions.update((row["u"], row) for row in payload[0])
+    db.write_log_batch(messages, feedback)
+    db.write_sessions(list(sessions.values()))
+
+def _apply_writes(batch: List[Tuple[str, int, Any, tuple]]) -> List[Optional[str]]:
+    """Commit log/session requests together; errors per request."""
+    if not batch:
+        return []
+    try:
+        _apply(batch)
+        return [None] * len(batch)
+    except Exception:
+        # Retry one by one so a single bad batch does not fail the others
+        errors = []
+        for one in batch:
+            try:
+                _apply([one])
+                errors.append(None)
+            except Exception as e:
+                errors.append(repr(e))
+        return errors
+
+def _answer(kind: str, payload: tuple, high_id: int) -> Any:
+    if kind == "last_id":
+        return high_id
+    if kind == "user":
+        return db.get_or_create_user(*payload)
+    raise ValueError(f"unknown request {kind!r}")
+
+def writer_main(requests, replies: list, max_batch: int = 64):
+    """Serialize all writes; log/session requests that are already queued are committed together."""
+    _ignore_signals()
+    from retention import start_retention, stop_retention
+    start_retention()
+    # Highest message id committed or queued: ids of failed batches count too, since
+    # the worker that allocated them may still retry them
+    high_id = db.last_message_id()
+    stopping = False
+    while not stopping:
+        try:
+            item = requests.get(timeout=_POLL)
+        except queue.Empty:
+            if not _parent_alive():
+                break
+            continue
+        if item is None:
+            break
+        batch = [item]
+        while len(batch) < max_batch:
+            try:
+                item = requests.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                stopping = True
+                break
+            batch.append(item)
+        high_id = max([high_id] + [row["id"] for kind, _w, _t, payload in batch if kind == "log"
+                                   for row in payload[0]])
+        writes = [item for item in batch if item[0] in _WRITES]
+        for (_kind, worker, token, _payload), error in zip(writes, _apply_writes(writes)):
+            replies[worker].put((token, None, error))
+        for kind, worker, token, payload in batch:
+            if kind in _WRITES:
+                continue
+            try:
+                replies[worker].put((token, _answer(kind, payload, high_id), None))
+            except Exception as e:
+                replies[worker].put((token, None, repr(e)))
+    stop_retention()
+    db.dispose_engine()
+
+# ---------------- Worker processes ----------------
+
+def worker_main(index: int, count: int, updates, requests, replies):
+    """Run the bot's handlers for shard `index`, reading forwarded updates from `updates`."""
+    _ignore_signals()
+    import chatbot_edu, metrics
+    from write_behind import LogBuffer, install_log_buffer
+    from session_store import SessionStore, install_session_store
+    from user_cache import UserCache, install_user_cache
+
+    client = WriterClient(index, requests, replies)
+    install_log_buffer(LogBuffer(writer=client.write_log_batch, id_step=count,
+                                 first_id=strided_start(client.last_message_id(), index, count)))
+    install_session_store(SessionStore(writer=client.write_sessions))
+    install_user_cache(UserCache(resolver=client.get_or_create_user))
+    chatbot_edu.setup_metrics(port=metrics.METRICS_PORT + 1 + index if metrics.METRICS_PORT else 0,
+                              dump_path=f"{metrics.METRICS_DUMP_PATH}.{index}" if metrics.METRICS_DUMP_PATH else "")
+    asyncio.run(_serve_worker(chatbot_edu, updates))
+
+async def _serve_worker(chatbot_edu, updates):
+    chatbot_edu.warm_up_nlu()
+    app = chatbot_edu.build_application(with_updater=False)
+    await app.initialize()
+    if app.post_init:
+        await app.post_init(app)
+    await app.start()
+    loop = asyncio.get_running_loop()
+
+    def next_update():
+        while True:
+            try:
+                return updates.get(timeout=_POLL)
+            except queue.Empty:
+                if not _parent_alive():
+                    return None
+
+    try:
+        while True:
+            data = await loop.run_in_executor(None, next_update)
+            if data is None:
+                break
+            await app.update_queue.put(Update.de_json(data, app.bot))
+    finally:
+        await app.stop()  # finishes queued and in-flight turns
+        await app.shutdown()
+        if app.post_shutdown:
+            await app.post_shutdown(app)  # final flush through the writer
+
+# ---------------- Front process ----------------
+
+def _join(proc: multiprocessing.Process, deadline: float):
+    proc.join(max(0.0, deadline - time.monotonic()))
+    if proc.is_alive():
+        print(f"[sharding] {proc.name} did not stop in time; terminating")
+        proc.terminate()
+        proc.join()
+
+class ShardRouter:
+    """Starts the writer and worker processes and forwards updates to them by user."""
+    def __init__(self, workers: int = WORKER_PROCESSES):
+        self.workers = workers
+        self._mp = multiprocessing.get_context("spawn")
+        self._requests = self._mp.Queue()
+        self._replies = [self._mp.Queue() for _ in range(workers)]
+        self._updates = [self._mp.Queue() for _ in range(workers)]
+        self._procs: List[Optional[multiprocessing.Process]] = [None] * workers
+        self._writer: Optional[multiprocessing.Process] = None
+        self.routed = [0] * workers
+
+    def start(self):
+        self._writer = self._mp.Process(target=writer_main, args=(self._requests, self._replies),
+                                        name="edu-writer", daemon=True)
+        self._writer.start()
+        for k in range(self.workers):
+            self._start_worker(k)
+
+    def _start_worker(self, k: int):
+        proc = self._mp.Process(target=worker_main, name=f"edu-worker-{k}", daemon=True,
+                                args=(k, self.workers, self._updates[k], self._requests, self._replies[k]))
+        proc.start()
+        self._procs[k] = proc
+
+    def route(self, update: Update):
+        key = update_key(update)
+        k = shard_of(key, self.workers) if key is not None else 0
+        proc = self._procs[k]
+        if proc is not None and not proc.is_alive():
+            print(f"[sharding] worker {k} exited with {proc.exitcode}; restarting")
+            self._start_worker(k)  # its queue (and the updates waiting in it) is kept
+        self._updates[k].put(update.to_dict())
+        self.routed[k] += 1
+
+    def stop(self, timeout: float = WORKER_STOP_TIMEOUT):
+        """Let workers drain their queues and flush, then stop the writer; a process still
+        running after `timeout` seconds is terminated (its unflushed rows are lost)."""
+        for q in self._updates:
+            q.put(None)
+        deadline = time.monotonic() + timeout
+        for proc in self._procs:
+            if proc is not None:
+                _join(proc, deadline)
+        if self._writer is not None:
+            self._requests.put(None)
+            _join(self._writer, time.monotonic() + timeout)
+            self._writer = None
+
+def build_front_application(router: ShardRouter):
+    """An Application that only forwards updates; handled one at a time to keep arrival order."""
+    async def forward(update: Update, context):
+        router.route(update)
+
+    async def stop_router(app):
+        await asyncio.to_thread(router.stop)
+
+    app = (
+        ApplicationBuilder()
+        .token(TELEGRAM_BOT_TOKEN)
+        .base_url(TELEGRAM_API_BASE_URL)
+        .post_shutdown(stop_router)
+        .build()
+    )
+    app.add_handler(TypeHandler(Update, forward))
+    return app
+
+def run_sharded(workers: int = WORKER_PROCESSES):
+    router = ShardRouter(workers)
+    router.start()
+    app = build_front_application(router)
+    if BOT_MODE == "webhook":
+        from webhook import run_webhook
+        run_webhook(app)
+    else:
+        app.run_polling()
@@ -0,0 +1,24 @@
+"""
+Shared test setup: a throwaway database and index directory per test session, so the
+suite never touches db/edu_chatbot.db. Set before any module reads config.
+"""
+import os
+import sys
+import tempfile
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORKDIR = tempfile.mkdtemp(prefix="edu-tests-")
+os.environ["DB_PATH"] = os.path.join(WORKDIR, "test.db")
+os.environ["FAQ_INDEX_DIR"] = os.path.join(WORKDIR, "faq_index")
+os.environ["ARCHIVE_DIR"] = os.path.join(WORKDIR, "archive")
+os.environ["LOG_DEAD_LETTER_PATH"] = os.path.join(WORKDIR, "log_dead_letter.jsonl")
+os.environ["METRICS_ENABLED"] = "0"
+sys.path.insert(0, ROOT)
+
+@pytest.fixture(scope="session")
+def seeded_db():
+    """The seed data, loaded once per session."""
+    import seed_data
+    seed_data.seed()
+    return os.environ["DB_PATH"]
@@ -0,0 +1,142 @@
+import asyncio
+import datetime
+import random
+from telegram import Chat, Message, Update, User
+from dispatcher import UserOrderedUpdateProcessor
+
+def make_update(update_id: int, user_id: int) -> Update:
+    user = User(id=user_id, first_name="u", is_bot=False)
+    message = Message(message_id=update_id, date=datetime.datetime.now(datetime.timezone.utc),
+                      chat=Chat(id=user_id, type="private"), from_user=user, text=f"m{update_id}")
+    return Update(update_id=update_id, message=message)
+
+class Recorder:
+    """Handlers that log start/end per update, and an on_shed callback that logs sheds."""
+    def __init__(self):
+        self.events = []
+        self.shed = []
+        self.running = 0
+        self.max_running = 0
+
+    def handler(self, update: Update, pause: float = 0.0, gate: asyncio.Event = None):
+        async def run():
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+            self.events.append(("start", update.update_id))
+            if gate is not None:
+                await gate.wait()
+            await asyncio.sleep(pause)
+            self.events.append(("end", update.update_id))
+            self.running -= 1
+        return run()
+
+    async def on_shed(self, update, reason):
+        self.shed.append((update.update_id, reason))
+
+    def started(self):
+        return [uid for kind, uid in self.events if kind == "start"]
+
+async def submit(processor, coroutine_for, updates):
+    """Hand updates to the processor in order, the way PTB does, letting each reach its queue."""
+    tasks = []
+    for update in updates:
+        tasks.append(asyncio.create_task(processor.process_update(update, coroutine_for(update))))
+        for _ in range(3):
+            await asyncio.sleep(0)
+    return tasks
+
+def run(coro):
+    return asyncio.run(asyncio.wait_for(coro, timeout=10))
+
+def test_updates_of_one_user_run_in_order_and_users_run_concurrently():
+    async def main():
+        rec = Recorder()
+        proc = UserOrderedUpdateProcessor(8, max_pending=0, max_user_pending=0, max_wait=0)
+        rnd = random.Random(3)
+        users = {i: 100 + i % 3 for i in range(1, 31)}  # 30 updates from 3 users, interleaved
+        tasks = await submit(proc, lambda u: rec.handler(u, rnd.uniform(0, 0.01)),
+                             [make_update(i, users[i]) for i in users])
+        await asyncio.gather(*tasks)
+        return rec, users
+
+    rec, users = run(main())
+    assert rec.shed == []
+    for user in set(users.values()):
+        mine = [(kind, uid) for kind, uid in rec.events if users[uid] == user]
+        # Strictly one at a time, in arrival order
+        expected = [ev for uid in sorted(u for u in users if users[u] == user) for ev in (("start", uid), ("end", uid))]
+        assert mine == expected
+    assert rec.max_running == 3  # one per user
+
+def test_a_busy_user_does_not_block_others():
+    async def main():
+        rec = Recorder()
+        proc = UserOrderedUpdateProcessor(4, max_pending=0, max_user_pending=0, max_wait=0)
+        gate = asyncio.Event()
+        first = await submit(proc, lambda u: rec.handler(u, gate=gate), [make_update(1, 7)])
+        # User 8's update runs to completion while user 7's is still blocked
+        await asyncio.gather(*await submit(proc, rec.handler, [make_update(2, 8)]))
+        assert rec.events == [("start", 1), ("start", 2), ("end", 2)]
+        gate.set()
+        await asyncio.gather(*first)
+        return rec
+
+    assert run(main()).events[-1] == ("end", 1)
+
+def test_concurrency_is_capped():
+    async def main():
+        rec = Recorder()
+        proc = UserOrderedUpdateProcessor(2, max_pending=0, max_user_pending=0, max_wait=0)
+        tasks = await submit(proc, lambda u: rec.handler(u, 0.01), [make_update(i, i) for i in range(1, 7)])
+        await asyncio.gather(*tasks)
+        return rec
+
+    rec = run(main())
+    assert rec.max_running == 2 and sorted(rec.started()) == list(range(1, 7))
+
+def test_full_queue_sheds_new_updates():
+    async def main():
+        rec = Recorder()
+        proc = UserOrderedUpdateProcessor(1, max_pending=2, max_user_pending=0, max_wait=0, on_shed=rec.on_shed)
+        gate = asyncio.Event()
+        tasks = await submit(proc, lambda u: rec.handler(u, gate=gate), [make_update(i, i) for i in range(1, 5)])
+        assert proc.waiting == 2  # update 1 runs, 2 and 3 wait, 4 was shed
+        gate.set()
+        await asyncio.gather(*tasks)
+        return rec, proc
+
+    rec, proc = run(main())
+    assert rec.shed == [(4, "queue_full")]
+    assert rec.started() == [1, 2, 3]
+    assert proc.shed == {"queue_full": 1, "user_backlog": 0, "stale": 0}
+
+def test_user_backlog_sheds_only_that_user():
+    async def main():
+        rec = Recorder()
+        proc = UserOrderedUpdateProcessor(4, max_pending=0, max_user_pending=2, max_wait=0, on_shed=rec.on_shed)
+        gate = asyncio.Event()
+        updates = [make_update(1, 7), make_update(2, 7), make_update(3, 7), make_update(4, 8)]
+        tasks = await submit(proc, lambda u: rec.handler(u, gate=gate), updates)
+        gate.set()
+        await asyncio.gather(*tasks)
+        return rec, proc
+
+    rec, proc = run(main())
+    assert rec.shed == [(3, "user_backlog")]
+    assert sorted(rec.started()) == [1, 2, 4]
+    assert proc.stats()["users_queued"] == 0
+
+def test_stale_updates_are_shed_when_their_turn_comes():
+    async def main():
+        rec = Recorder()
+        proc = UserOrderedUpdateProcessor(4, max_pending=0, max_user_pending=0, max_wait=0.05, on_shed=rec.on_shed)
+        updates = [make_update(1, 7), make_update(2, 7), make_update(3, 8)]
+        pauses = {1: 0.2, 2: 0.0, 3: 0.0}
+        tasks = await submit(proc, lambda u: rec.handler(u, pauses[u.update_id]), updates)
+        await asyncio.gather(*tasks)
+        return rec, proc
+
+    rec, proc = run(main())
+    assert rec.shed == [(2, "stale")]  # waited 0.2s behind update 1
+    assert sorted(rec.started()) == [1, 3]
+    assert proc.shed["stale"] == 1 and proc.running == 0 and proc.waiting == 0
@@ -0,0 +1,51 @@
+import pytest
+import dense_index
+import faq_index
+from db import get_data_version
+from importer import import_rows
+from nlu import FAQMatcher
+from seed_data import FAQS
+
+@pytest.fixture
+def seed_faqs(seeded_db):
+    rows = [{"question": q, "answer": a, "tags": t} for q, a, t in FAQS]
+    yield rows
+    import_rows("faqs", rows, rebuild=False)
+
+@pytest.mark.parametrize("module", [faq_index, dense_index])
+def test_saved_index_round_trip_and_version_check(module, seed_faqs, tmp_path, capsys):
+    path = str(tmp_path / "index")
+    built = module.rebuild(path)
+    loaded = module.load_or_build(path)
+    assert loaded.meta == built.meta and loaded.version == get_data_version("faqs")
+    assert loaded.ids.tolist() == built.ids.tolist()
+    assert loaded.search_topk("tuition installments", 1)[0][0] == built.search_topk("tuition installments", 1)[0][0]
+
+    import_rows("faqs", seed_faqs[1:], rebuild=False)  # bumps the faqs version
+    rebuilt = module.load_or_build(path)
+    assert rebuilt.version == get_data_version("faqs") != built.version
+    assert len(rebuilt) == len(built) - 1
+
+    (tmp_path / "index" / "meta.json").write_text("{not json")
+    assert module.load_or_build(path).version == rebuilt.version
+    assert "unreadable, rebuilding" in capsys.readouterr().out
+
+def test_dense_retriever_matches_the_tfidf_version(seed_faqs):
+    stale = faq_index.build_from_db()
+    dense_index.rebuild()
+    import_rows("faqs", seed_faqs[1:] + [{"question": "Is there a campus library?",
+                                          "answer": "Yes, open 8am-10pm.", "tags": "library"}], rebuild=False)
+    dense_index.rebuild()  # the saved dense index is newer than `stale`
+    matcher = FAQMatcher(stale, retriever="dense")
+    current = get_data_version("faqs")
+    assert matcher.index.version == matcher.retriever.version == current
+    for faq_id in matcher.retriever.index.ids.tolist():
+        assert matcher.answer(faq_id) is not None
+    faq_id, _score = matcher.search("campus library opening hours")
+    assert matcher.answer(faq_id) == "Yes, open 8am-10pm."
+
+def test_dense_index_of_another_version_is_rebuilt(seed_faqs):
+    tfidf = faq_index.load_or_build()
+    dense_index.rebuild()
+    older = dense_index.load_or_build(version=tfidf.version - 1)
+    assert older.version == tfidf.version  # rebuilt from the table, which is still at tfidf's version
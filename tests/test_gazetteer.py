@@ -0,0 +1,72 @@
+import pytest
+from config import ENTITY_FUZZY_MIN_LEN
+from gazetteer import Gazetteer
+
+COURSES = {
+    "158.780": "Week 4: LLM Reasoning & Optimization",
+    "159.101": "Applied Statistics",
+    "159.102": "Applied Statistics II",
+    "161.222": "Applied Machine Learning",
+    "161.333": "Machine Learning Systems",
+    "162.100": "Data Mining",
+}
+ASSIGNMENTS = ["A1", "A2", "A3"]
+
+@pytest.fixture(scope="module")
+def gazetteer():
+    return Gazetteer.build(COURSES, ASSIGNMENTS)
+
+@pytest.mark.parametrize("text, course, assignment", [
+    # Codes: dotted, joined or spaced; digits are never corrected
+    ("158780", "158.780", None),
+    ("158 780 A2", "158.780", "A2"),
+    ("when is 158780 due", "158.780", None),
+    ("158781", None, None),
+    # Assignment spellings, one typo allowed in words of ENTITY_FUZZY_MIN_LEN+ letters
+    ("A1", None, "A1"),
+    ("a 3 for 162.100", "162.100", "A3"),
+    ("assignment2", None, "A2"),
+    ("assigment 2", None, "A2"),
+    ("asignment 3", None, "A3"),
+    ("assigmnet 2", None, None),  # two edits
+    ("A3 assigment 2", None, "A3"),  # an exact match beats a corrected one
+    # Titles, their two-word runs, a week prefix dropped, stopwords skipped
+    ("LLM reasoning and optimization", "158.780", None),
+    ("reasoning & optimisation", "158.780", None),
+    ("the data mining lab", "162.100", None),
+    ("data minning", "162.100", None),
+    ("date mining", None, None),  # "date" is shorter than ENTITY_FUZZY_MIN_LEN: never corrected
+    # Overlapping names: the longest unambiguous form wins, shared forms name nothing
+    ("applied machine learning", "161.222", None),
+    ("machine learning systems", "161.333", None),
+    ("machine learning", None, None),
+    ("applied statistics ii", "159.102", None),
+    ("applied statistics", None, None),
+    ("hello there", None, None),
+])
+def test_extract(gazetteer, text, course, assignment):
+    assert gazetteer.extract(text) == {"course": course, "assignment": assignment}
+
+def test_short_words_are_not_fuzzy_matched():
+    assert ENTITY_FUZZY_MIN_LEN > len("data")
+    g = Gazetteer.build({"162.100": "Data Mining"}, [], fuzzy_min_len=4)
+    assert g.extract("date minin")["course"] == "162.100"  # both corrected once the minimum allows it
+    assert Gazetteer.build({"162.100": "Data Mining"}, []).extract("date minin")["course"] is None
+
+@pytest.mark.parametrize("text, expected", [
+    ("158780 A1", True),
+    ("applied statistics ii a2", True),
+    ("the A1", True),
+    ("assigment 2", True),
+    ("", True),
+    ("what about A1", False),
+    ("A1 deadline", False),
+    ("date mining", False),
+])
+def test_names_only(gazetteer, text, expected):
+    assert gazetteer.names_only(text) is expected
+
+def test_empty_catalog():
+    g = Gazetteer.build({}, [])
+    assert len(g) == 0
+    assert g.extract("158780 assignment 2") == {"course": None, "assignment": None}
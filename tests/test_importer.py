@@ -0,0 +1,56 @@
+import pytest
+from sqlalchemy import text
+from db import get_engine
+from importer import import_rows
+from seed_data import FAQS
+
+def _faqs():
+    with get_engine().begin() as conn:
+        return {q: (i, a) for i, q, a in conn.execute(text("SELECT id, question, answer FROM faqs"))}
+
+def _seq(table):
+    with get_engine().begin() as conn:
+        return conn.execute(text("SELECT seq FROM sqlite_sequence WHERE name=:t"), {"t": table}).scalar()
+
+@pytest.fixture
+def seed_faqs(seeded_db):
+    rows = [{"question": q, "answer": a, "tags": t} for q, a, t in FAQS]
+    yield rows
+    import_rows("faqs", rows, rebuild=False)  # back to the seed bank (same ids again)
+
+def test_reimport_keeps_ids_of_unchanged_keys(seed_faqs):
+    before, seq = _faqs(), _seq("faqs")
+    kept, dropped = seed_faqs[1:], seed_faqs[0]
+    rows = [dict(kept[0], answer="A new answer.")] + kept[1:] + [{"question": "Is there a library?",
+                                                                 "answer": "Yes.", "tags": None}]
+    import_rows("faqs", rows, rebuild=False)
+    after = _faqs()
+
+    assert dropped["question"] not in after
+    for row in kept:
+        assert after[row["question"]][0] == before[row["question"]][0]
+    assert after[kept[0]["question"]][1] == "A new answer."
+    assert after["Is there a library?"][0] > seq  # only the new key takes a fresh id
+    assert _seq("faqs") == after["Is there a library?"][0]
+
+def test_identical_reimport_changes_nothing(seed_faqs):
+    before, seq = _faqs(), _seq("faqs")
+    import_rows("faqs", seed_faqs, rebuild=False)
+    assert _faqs() == before and _seq("faqs") == seq
+
+def test_reimport_never_reuses_ids(seed_faqs):
+    before, seq = _faqs(), _seq("faqs")
+    dropped = seed_faqs[0]
+    import_rows("faqs", seed_faqs[1:], rebuild=False)
+    import_rows("faqs", seed_faqs, rebuild=False)  # the dropped question comes back as a new row
+    after = _faqs()
+    assert after[dropped["question"]][0] > seq
+    assert {q: i for q, (i, _) in after.items() if q != dropped["question"]} == \
+        {q: i for q, (i, _) in before.items() if q != dropped["question"]}
+
+def test_merge_keeps_ids_and_rows_not_in_the_input(seed_faqs):
+    before = _faqs()
+    import_rows("faqs", [dict(seed_faqs[2], answer="Changed.")], merge=True, rebuild=False)
+    after = _faqs()
+    assert {q: i for q, (i, _) in after.items()} == {q: i for q, (i, _) in before.items()}
+    assert after[seed_faqs[2]["question"]][1] == "Changed."
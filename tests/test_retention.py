@@ -0,0 +1,66 @@
+"""
+Archive round trip through Parquet. Run it under the pinned pandas/pyarrow from
+requirements.txt to check the archive format against them.
+"""
+import itertools
+import os
+import time
+import pytest
+import db
+import retention
+
+_users = itertools.count(5150)
+
+def _row(mid, uid, day, direction="in", text="hi", intent=None, conf=None):
+    return {"id": mid, "uid": uid, "dir": direction, "tx": text, "it": intent, "cf": conf, "ts": day}
+
+@pytest.fixture
+def logged(seeded_db):
+    """Six messages from 2001 (to be archived) and three from today, for one new user."""
+    uid = db.get_or_create_user(next(_users), "r", "", "")
+    first = db.last_message_id() + 1
+    today = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime())
+    rows = [
+        _row(first, uid, "2001-03-01 08:00:00", text="old ünïcode"),
+        _row(first + 1, uid, "2001-03-01 08:00:01", "out", "reply", "faq", 0.75),
+        _row(first + 2, uid, "2001-03-02 09:30:00", text="158.780 A1", intent="deadline", conf=1.0),
+        _row(first + 3, uid, "2001-03-02 09:30:01", "out", "due week 4", "deadline", 1.0),
+        _row(first + 4, uid, "2001-03-03 23:59:59", text=None),
+        _row(first + 5, uid, "2001-03-03 23:59:59", "out", "fallback", "fallback", 0.0),
+        _row(first + 6, uid, today, text="new"),
+        _row(first + 7, uid, today, "out", "new reply", "faq", 0.5),
+        _row(first + 8, uid, today, text="newer"),
+    ]
+    db.write_log_batch(rows, [])
+    return uid, rows
+
+def _expected(rows):
+    return [(r["id"], r["uid"], r["dir"], r["tx"], r["it"], r["cf"], r["ts"]) for r in rows]
+
+def test_run_once_moves_old_rows_and_iter_messages_reads_both(logged, tmp_path):
+    uid, rows = logged
+    archive = str(tmp_path / "archive")
+    assert retention.run_once(days=3650, archive_dir=archive, batch=4) == 6
+    assert sorted(os.listdir(os.path.join(archive, "messages"))) == \
+        ["date=2001-03-01", "date=2001-03-02", "date=2001-03-03"]
+    assert [r.id for r in db.iter_messages(None) if r.user_id == uid] == [r["id"] for r in rows[6:]]
+
+    got = list(retention.iter_messages(None, user_id=uid, archive_dir=archive))
+    assert [tuple(m) for m in got] == _expected(rows)
+    assert all(isinstance(m.id, int) and isinstance(m.user_id, int) for m in got)
+    assert got[0].intent is None and got[0].confidence is None and got[4].text is None
+
+    incoming = list(retention.iter_messages("in", user_id=uid, archive_dir=archive))
+    assert [m.id for m in incoming] == [r["id"] for r in rows if r["dir"] == "in"]
+    day2 = list(retention.iter_messages(None, "2001-03-02", "2001-03-03", user_id=uid, archive_dir=archive))
+    assert [m.id for m in day2] == [rows[2]["id"], rows[3]["id"]]
+
+    assert retention.run_once(days=3650, archive_dir=archive) == 0  # nothing old is left
+
+def test_rows_archived_but_not_yet_deleted_are_read_once(logged, tmp_path):
+    uid, rows = logged
+    archive = str(tmp_path / "archive")
+    live = [r for r in db.iter_messages(None) if r.user_id == uid]
+    retention.archive_batch(live, archive)  # as if the process died before the delete
+    got = list(retention.iter_messages(None, user_id=uid, archive_dir=archive))
+    assert [m.id for m in got] == [r["id"] for r in rows]
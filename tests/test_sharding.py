@@ -0,0 +1,93 @@
+import queue
+import threading
+import pytest
+import db
+import sharding
+from sharding import WriterClient, shard_of, strided_start, writer_main
+from write_behind import LogBuffer
+
+@pytest.mark.parametrize("last_id, offset, step, expected", [
+    (0, 0, 1, 1),
+    (0, 0, 4, 4),
+    (0, 1, 4, 1),
+    (0, 3, 4, 3),
+    (10, 2, 4, 14),
+    (10, 3, 4, 11),
+    (11, 3, 4, 15),  # never returns last_id itself
+    (99, 0, 3, 102),
+])
+def test_strided_start(last_id, offset, step, expected):
+    first = strided_start(last_id, offset, step)
+    assert first == expected
+    assert first > last_id and first % step == offset % step and first - last_id <= step
+
+def test_strides_never_collide():
+    workers, last_id = 5, 1234
+    ids = [strided_start(last_id, k, workers) + n * workers for k in range(workers) for n in range(100)]
+    assert len(set(ids)) == len(ids) and min(ids) == last_id + 1
+
+def test_shard_of_is_stable_and_in_range():
+    assert [shard_of(u, 4) for u in (1, 42, 123456789)] == [shard_of(u, 4) for u in (1, 42, 123456789)]
+    shards = [shard_of(u, 4) for u in range(4000)]
+    assert set(shards) == {0, 1, 2, 3}
+    assert min(shards.count(k) for k in range(4)) > 800  # roughly even
+    assert {shard_of(u, 1) for u in range(100)} == {0}
+
+def _row(mid, uid, direction="in"):
+    return {"id": mid, "uid": uid, "dir": direction, "tx": f"m{mid}", "it": None, "cf": None,
+            "ts": "2026-01-01 00:00:00"}
+
+@pytest.fixture
+def writer(seeded_db, monkeypatch):
+    """The writer loop on a thread, fed through plain queues (one reply queue per worker)."""
+    monkeypatch.setattr(sharding, "_ignore_signals", lambda: None)  # signals: main thread only
+    requests, replies = queue.Queue(), [queue.Queue(), queue.Queue()]
+    thread = threading.Thread(target=writer_main, args=(requests, replies), daemon=True)
+
+    def start():
+        thread.start()
+
+    yield requests, replies, start
+    requests.put(None)
+    thread.join(10)
+
+def test_restarted_worker_skips_ids_its_predecessor_left_behind(writer):
+    requests, replies, start = writer
+    uid = db.get_or_create_user(4242, "w", "", "")
+    base = db.last_message_id()
+    # The dead worker 1 left two batches in the writer's queue: one that commits and a
+    # bad one (CHECK violation) that fails and will never be retried
+    first = strided_start(base, 1, 2)
+    good = [_row(first, uid), _row(first + 2, uid)]
+    bad = [_row(first + 4, uid), _row(first + 6, uid, direction="sideways")]
+    requests.put(("log", 1, ("dead", 1), (good, [])))
+    requests.put(("log", 1, ("dead", 2), (bad, [])))
+    start()
+
+    client = WriterClient(1, requests, replies[1])  # the restarted worker 1
+    high = client.last_message_id()
+    assert high == first + 6  # the failed batch's ids count too
+    buf = LogBuffer(writer=client.write_log_batch, id_step=2, first_id=strided_start(high, 1, 2), interval=3600)
+    new_ids = [buf.log_message(uid, "in", f"after restart {i}", None, None) for i in range(3)]
+    buf.close()
+
+    other = LogBuffer(writer=WriterClient(0, requests, replies[0]).write_log_batch, id_step=2,
+                      first_id=strided_start(base, 0, 2), interval=3600)
+    other_ids = [other.log_message(uid, "in", f"worker 0 {i}", None, None) for i in range(6)]
+    other.close()
+
+    left_behind = {r["id"] for r in good + bad}
+    assert min(new_ids) > max(left_behind) and all(i % 2 == 1 for i in new_ids)
+    assert all(i % 2 == 0 for i in other_ids)
+    stored = [r.id for r in db.iter_messages(None) if r.id > base]
+    assert sorted(stored) == sorted({first, first + 2} | set(new_ids) | set(other_ids))
+    assert len(stored) == len(set(stored))
+
+def test_writer_answers_user_lookups_and_reports_errors(writer):
+    requests, replies, start = writer
+    start()
+    client = WriterClient(0, requests, replies[0])
+    uid = client.get_or_create_user(777, "Ann", "B", "ann")
+    assert client.get_or_create_user(777, "Ann", "B", "ann") == uid == db.find_user(777).id
+    with pytest.raises(RuntimeError, match="unknown request"):
+        client._call("bogus")
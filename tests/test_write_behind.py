@@ -0,0 +1,110 @@
+import json
+import pytest
+from write_behind import LogBuffer
+
+class FlakyWriter:
+    """write_log_batch stand-in: fails every call while `down`, and any call containing a `bad` text."""
+    def __init__(self):
+        self.down = False
+        self.bad = set()
+        self.calls = []
+        self.messages = []
+        self.feedback = []
+
+    def __call__(self, messages, feedback):
+        self.calls.append((len(messages), len(feedback)))
+        if self.down or any(m["tx"] in self.bad for m in messages) or any(f["cm"] in self.bad for f in feedback):
+            raise RuntimeError("write failed")
+        self.messages.extend(messages)
+        self.feedback.extend(feedback)
+
+@pytest.fixture
+def make_buffer(tmp_path):
+    made = []
+
+    def make(**kwargs):
+        writer = FlakyWriter()
+        kwargs.setdefault("dead_letter", str(tmp_path / "dead.jsonl"))
+        # A long interval and max_rows keep the background flusher out of the way
+        buf = LogBuffer(max_rows=10_000, interval=3600, writer=writer, first_id=1, **kwargs)
+        made.append((buf, writer))
+        return buf, writer
+
+    yield make
+    for buf, writer in made:
+        writer.down, writer.bad = False, set()
+        buf.close()
+
+def _dead_rows(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+def test_ids_follow_the_stride(make_buffer):
+    buf, _ = make_buffer(id_step=3)
+    assert [buf.log_message(1, "in", str(i), None, None) for i in range(3)] == [1, 4, 7]
+
+def test_failed_batch_is_retried_then_written_row_by_row(make_buffer, tmp_path):
+    buf, writer = make_buffer(max_retries=3)
+    writer.bad = {"bad", "bad comment"}
+    buf.log_message(1, "in", "hello", None, None)
+    bad_id = buf.log_message(1, "in", "bad", None, None)
+    buf.log_message(1, "out", "hi", "greet", 1.0)
+    buf.add_feedback(1, bad_id, 1, "bad comment")
+    buf.add_feedback(1, bad_id, 5, "fine")
+
+    for _ in range(2):  # below max_retries: the whole batch goes back in the queue
+        with pytest.raises(RuntimeError):
+            buf.flush()
+        assert buf.pending() == 5
+    assert writer.calls == [(3, 2), (3, 2)]
+
+    assert buf.flush() == 3  # third failure: one row at a time
+    assert writer.calls[2] == (3, 2) and writer.calls[3:] == [(1, 0)] * 3 + [(0, 1)] * 2
+    assert [m["tx"] for m in writer.messages] == ["hello", "hi"]
+    assert [f["cm"] for f in writer.feedback] == ["fine"]
+    assert buf.pending() == 0 and buf.dead_lettered == 2
+
+    dead = _dead_rows(tmp_path / "dead.jsonl")
+    assert [(d["table"], d["row"].get("tx") or d["row"].get("cm")) for d in dead] == \
+        [("messages", "bad"), ("feedback", "bad comment")]
+    assert dead[0]["row"]["id"] == bad_id and "write failed" in dead[0]["error"]
+
+    assert buf.flush() == 0  # nothing left over
+    buf.log_message(1, "in", "later", None, None)
+    assert buf.flush() == 1  # the failure count was reset
+
+def test_outage_keeps_every_row_queued(make_buffer, tmp_path):
+    buf, writer = make_buffer(max_retries=2)
+    writer.down = True
+    for i in range(3):
+        buf.log_message(1, "in", f"m{i}", None, None)
+    for _ in range(4):  # batch and row-by-row attempts both fail: nothing is dead-lettered
+        with pytest.raises(RuntimeError):
+            buf.flush()
+        assert buf.pending() == 3
+    assert buf.dead_lettered == 0 and not (tmp_path / "dead.jsonl").exists()
+
+    writer.down = False
+    assert buf.flush() == 3
+    assert [m["tx"] for m in writer.messages] == ["m0", "m1", "m2"]
+
+def test_queue_cap_drops_the_oldest_rows(make_buffer):
+    buf, writer = make_buffer(max_pending=5)
+    ids = [buf.log_message(1, "in", f"m{i}", None, None) for i in range(8)]
+    assert buf.pending() == 5 and buf.dropped == 3
+    assert buf.flush() == 5
+    assert [m["id"] for m in writer.messages] == ids[3:]
+
+def test_requeued_rows_count_against_the_cap(make_buffer):
+    buf, writer = make_buffer(max_pending=4, max_retries=5)
+    for i in range(3):
+        buf.log_message(1, "in", f"old{i}", None, None)
+    writer.down = True
+    with pytest.raises(RuntimeError):
+        buf.flush()
+    for i in range(3):
+        buf.log_message(1, "in", f"new{i}", None, None)
+    assert buf.pending() == 4 and buf.dropped == 2
+    writer.down = False
+    buf.flush()
+    assert [m["tx"] for m in writer.messages] == ["old2", "new0", "new1", "new2"]
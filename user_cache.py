@@ -0,0 +1,65 @@
+import threading
+from collections import OrderedDict
+from typing import Callable, Optional, Tuple
+import db
+from config import USER_CACHE_MAX
+
+Profile = Tuple[str, str, str]  # (first_name, last_name, username)
+
+class UserCache:
+    """
+    Bounded LRU map from Telegram user ID to internal user ID.
+
+    A hit costs no DB round trip; the profile seen last is kept alongside the ID so a
+    changed name/username falls through to `resolver` (db.get_or_create_user by default),
+    which refreshes it.
+    """
+    def __init__(self, max_entries: int = USER_CACHE_MAX,
+                 resolver: Optional[Callable[[int, str, str, str], int]] = None):
+        self.max_entries = max_entries
+        self._resolver = resolver or db.get_or_create_user
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[int, Tuple[int, Profile]]" = OrderedDict()
+
+    def lookup(self, tg_user_id: int, first_name: str = "", last_name: str = "", username: str = "") -> Optional[int]:
+        """Return the cached internal ID if the profile is unchanged, else None."""
+        with self._lock:
+            hit = self._entries.get(tg_user_id)
+            if hit is None or hit[1] != (first_name, last_name, username):
+                return None
+            self._entries.move_to_end(tg_user_id)
+            return hit[0]
+
+    def resolve(self, tg_user_id: int, first_name: str = "", last_name: str = "", username: str = "") -> int:
+        """Cached lookup that falls back to the resolver and remembers the result."""
+        uid = self.lookup(tg_user_id, first_name, last_name, username)
+        if uid is not None:
+            return uid
+        uid = self._resolver(tg_user_id, first_name, last_name, username)
+        with self._lock:
+            self._entries[tg_user_id] = (uid, (first_name, last_name, username))
+            self._entries.move_to_end(tg_user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return uid
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+_cache: Optional[UserCache] = None
+_cache_lock = threading.Lock()
+
+def get_user_cache() -> UserCache:
+    """Return the process-wide user cache."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = UserCache()
+    return _cache
+
+def install_user_cache(cache: UserCache):
+    """Make `cache` the process-wide user cache (e.g. one that resolves through another process)."""
+    global _cache
+    with _cache_lock:
+        _cache = cache
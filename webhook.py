@@ -0,0 +1,181 @@
+import asyncio, hmac, json, signal
+from typing import Callable, Dict, Optional, Tuple
+from telegram import Update
+from telegram.ext import Application
+from config import (
+    WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_URL, WEBHOOK_SECRET_TOKEN,
+    WEBHOOK_MAX_CONNECTIONS, WEBHOOK_MAX_BODY
+)
+
+SECRET_HEADER = "x-telegram-bot-api-secret-token"
+_REASONS = {200: "OK", 400: "Bad Request", 403: "Forbidden", 404: "Not Found",
+            405: "Method Not Allowed", 413: "Payload Too Large", 503: "Service Unavailable"}
+
+class WebhookServer:
+    """
+    Minimal asyncio HTTP/1.1 server for Telegram webhook calls.
+
+    Each POST to `path` is decoded into an Update and put on `app.update_queue`, then
+    acknowledged right away; ordering and concurrency are left to the application's
+    update processor. GET /healthz answers "ok" for load balancers; GET /readyz
+    answers 503 until `ready()` is true (e.g. the NLU has finished loading).
+    """
+    def __init__(self, app: Application, listen: str = WEBHOOK_LISTEN, port: int = WEBHOOK_PORT,
+                 path: str = WEBHOOK_PATH, secret_token: str = WEBHOOK_SECRET_TOKEN,
+                 max_body: int = WEBHOOK_MAX_BODY, ready: Optional[Callable[[], bool]] = None):
+        self.app = app
+        self.ready = ready
+        self.listen = listen
+        self.port = port
+        self.path = path
+        self.secret_token = secret_token
+        self.max_body = max_body
+        self.received = 0
+        self._server: Optional[asyncio.base_events.Server] = None
+        self._conns: Dict[asyncio.Task, asyncio.StreamWriter] = {}
+        self._busy = 0  # requests between "headers read" and "response written"
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._closing = False
+
+    @property
+    def sockets(self):
+        return self._server.sockets if self._server else ()
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._serve_conn, self.listen, self.port)
+
+    async def stop(self) -> None:
+        """Stop accepting, let requests in progress finish, then drop idle keep-alive connections."""
+        self._closing = True
+        if self._server is not None:
+            self._server.close()
+        await self._idle.wait()
+        for writer in list(self._conns.values()):
+            writer.close()  # idle keep-alive readers see EOF and return
+        if self._conns:
+            await asyncio.gather(*self._conns, return_exceptions=True)
+        if self._server is not None:
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _serve_conn(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        task = asyncio.current_task()
+        self._conns[task] = writer
+        try:
+            while not self._closing:
+                request = await self._read_head(reader)
+                if request is None:
+                    break
+                self._busy += 1
+                self._idle.clear()
+                try:
+                    method, target, version, headers = request
+                    status, body, keep_alive = await self._respond(reader, method, target, headers)
+                    keep_alive = keep_alive and version == "HTTP/1.1" and not self._closing \
+                        and headers.get("connection", "").lower() != "close"
+                    writer.write(
+                        f"HTTP/1.1 {status} {_REASONS.get(status, '')}\r\n"
+                        f"Content-Type: text/plain; charset=utf-8\r\n"
+                        f"Content-Length: {len(body)}\r\n"
+                        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode("latin-1") + body
+                    )
+                    await writer.drain()
+                finally:
+                    self._busy -= 1
+                    if not self._busy:
+                        self._idle.set()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError, ValueError):
+            pass
+        finally:
+            self._conns.pop(task, None)
+            writer.close()
+
+    @staticmethod
+    async def _read_head(reader: asyncio.StreamReader) -> Optional[Tuple[str, str, str, Dict[str, str]]]:
+        line = await reader.readline()
+        if not line.strip():
+            return None
+        method, target, version = line.decode("latin-1").split()
+        headers: Dict[str, str] = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        return method.upper(), target, version, headers
+
+    async def _respond(self, reader, method: str, target: str, headers: Dict[str, str]) -> Tuple[int, bytes, bool]:
+        length = int(headers.get("content-length") or 0)
+        if length > self.max_body:
+            return 413, b"too large", False
+        body = await reader.readexactly(length) if length else b""
+        path = target.split("?", 1)[0]
+        if path == "/healthz" and method == "GET":
+            return 200, b"ok", True
+        if path == "/readyz" and method == "GET":
+            if self.ready is None or self.ready():
+                return 200, b"ready", True
+            return 503, b"warming up", True
+        if path != self.path:
+            return 404, b"not found", True
+        if method != "POST":
+            return 405, b"method not allowed", True
+        if self.secret_token and not hmac.compare_digest(
+            headers.get(SECRET_HEADER, "").encode(), self.secret_token.encode()
+        ):
+            return 403, b"forbidden", True
+        if self._closing or not self.app.running:
+            return 503, b"shutting down", False  # Telegram retries later
+        try:
+            update = Update.de_json(json.loads(body), self.app.bot)
+        except (ValueError, TypeError, KeyError) as e:
+            return 400, f"bad update: {e}".encode(), True
+        if update is None:
+            return 400, b"empty update", True
+        await self.app.update_queue.put(update)
+        self.received += 1
+        return 200, b"", True
+
+async def serve(app: Application, ready: Optional[Callable[[], bool]] = None,
+                stop_signals=(signal.SIGINT, signal.SIGTERM)) -> None:
+    """Webhook counterpart of `app.run_polling()`: run until a stop signal, then drain."""
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in stop_signals:
+        loop.add_signal_handler(sig, stop.set)
+
+    await app.initialize()
+    if app.post_init:
+        await app.post_init(app)
+    if WEBHOOK_URL:
+        await app.bot.set_webhook(
+            WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+            secret_token=WEBHOOK_SECRET_TOKEN or None,
+            max_connections=WEBHOOK_MAX_CONNECTIONS,
+            allowed_updates=Update.ALL_TYPES,
+        )
+    await app.start()
+    server = WebhookServer(app, ready=ready)
+    await server.start()
+    print(f"[webhook] listening on {WEBHOOK_LISTEN}:{WEBHOOK_PORT}{WEBHOOK_PATH}")
+    try:
+        await stop.wait()
+    finally:
+        # Order matters: stop taking requests first, then app.stop() works off the queued
+        # updates and waits for in-flight turns, and only then are DB buffers closed.
+        await server.stop()
+        await app.stop()
+        if app.post_stop:
+            await app.post_stop(app)
+        await app.shutdown()
+        if app.post_shutdown:
+            await app.post_shutdown(app)
+        for sig in stop_signals:
+            loop.remove_signal_handler(sig)
+
+def run_webhook(app: Application, ready: Optional[Callable[[], bool]] = None) -> None:
+    asyncio.run(serve(app, ready))
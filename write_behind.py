@@ -0,0 +1,232 @@
+import atexit
+import json
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+import db
+from config import (
+    LOG_FLUSH_MAX_ROWS, LOG_FLUSH_INTERVAL, LOG_FLUSH_MAX_RETRIES, LOG_DEAD_LETTER_PATH, LOG_BUFFER_MAX_PENDING
+)
+
+class BackgroundFlusher:
+    """Daemon thread that calls `flush` every `interval` seconds, or sooner when poked."""
+    def __init__(self, flush: Callable[[], Any], interval: float, name: str = "flusher"):
+        self._flush = flush
+        self._interval = interval
+        self._name = name
+        self._wake = threading.Event()
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name=self._name, daemon=True)
+            self._thread.start()
+
+    def poke(self):
+        """Ask for a flush now instead of at the next interval."""
+        self._wake.set()
+
+    def stop(self):
+        """Stop the thread after one last flush so nothing queued is lost."""
+        self._stopping = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._flush()
+
+    def _run(self):
+        while not self._stopping:
+            self._wake.wait(self._interval)
+            self._wake.clear()
+            if self._stopping:
+                break
+            try:
+                self._flush()
+            except Exception as e:
+                # Rows stay queued; the next round retries them
+                print(f"[{self._name}] flush failed: {e}")
+
+def _utc_now() -> str:
+    # Same text format SQLite uses for CURRENT_TIMESTAMP
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime())
+
+class LogBuffer:
+    """
+    Write-behind buffer for the `messages` and `feedback` tables (and their rollups).
+
+    Rows are queued in memory and written with executemany in one transaction once
+    `max_rows` are pending or `interval` seconds have passed. Message ids are allocated
+    here (continuing from the table's AUTOINCREMENT sequence, read once at start-up), so log_message() can
+    return the id immediately and add_feedback() can reference it before it is flushed.
+    All message logging of a process must go through its buffer while it is enabled;
+    processes sharing one database use disjoint id strides (`first_id`, `id_step`).
+
+    A failed flush puts its rows back in front of the queue. After `max_retries` failures
+    in a row they are written one at a time instead; if some succeed, the ones that still
+    fail are bad rows and go to the `dead_letter` file. If none succeed (the database is
+    down), everything stays queued. The queue never exceeds `max_pending` rows: the oldest
+    are dropped first, counted in `dropped`.
+    """
+    def __init__(self, max_rows: int = LOG_FLUSH_MAX_ROWS, interval: float = LOG_FLUSH_INTERVAL,
+                 writer: Callable[[List[Dict[str, Any]], List[Dict[str, Any]]], None] = db.write_log_batch,
+                 first_id: Optional[int] = None, id_step: int = 1, max_retries: int = LOG_FLUSH_MAX_RETRIES,
+                 max_pending: int = LOG_BUFFER_MAX_PENDING, dead_letter: str = LOG_DEAD_LETTER_PATH):
+        self.max_rows = max_rows
+        self.max_retries = max_retries
+        self.max_pending = max_pending
+        self.dead_letter = dead_letter
+        self.dropped = 0  # rows discarded because the queue was full
+        self.dead_lettered = 0  # rows that could not be written on their own
+        self._failures = 0  # consecutive failed flushes
+        self._writer = writer
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._messages: List[Dict[str, Any]] = []
+        self._feedback: List[Dict[str, Any]] = []
+        self._next_id = db.last_message_id() + 1 if first_id is None else first_id
+        self._id_step = id_step
+        self._flusher = BackgroundFlusher(self.flush, interval, name="log-buffer")
+        self._flusher.start()
+
+    def log_message(self, user_id: int, direction: str, text_: str, intent: Optional[str], conf: Optional[float]) -> int:
+        """Queue a message record (in/out) and return its id."""
+        with self._lock:
+            mid = self._next_id
+            self._next_id += self._id_step
+            self._messages.append({"id": mid, "uid": user_id, "dir": direction, "tx": text_,
+                                   "it": intent, "cf": conf, "ts": _utc_now()})
+            self._trim()
+            full = self.pending() >= self.max_rows
+        if full:
+            self._flusher.poke()
+        return mid
+
+    def add_feedback(self, user_id: int, message_id: Optional[int], rating: int, comment: str,
+                     reply_intent: Optional[str] = None, faq_id: Optional[int] = None):
+        """Queue a feedback record; it is written after any message it references."""
+        with self._lock:
+            self._feedback.append({"uid": user_id, "mid": message_id, "rt": rating, "cm": comment,
+                                   "ri": reply_intent, "fq": faq_id, "ts": _utc_now()})
+            self._trim()
+            full = self.pending() >= self.max_rows
+        if full:
+            self._flusher.poke()
+
+    def pending(self) -> int:
+        return len(self._messages) + len(self._feedback)
+
+    def _trim(self):
+        """Drop the oldest queued rows beyond max_pending (caller holds _lock)."""
+        excess = self.pending() - self.max_pending if self.max_pending else 0
+        if excess <= 0:
+            return
+        for _ in range(excess):
+            # Oldest first across both queues (timestamps have the same text format)
+            if self._messages and (not self._feedback or self._messages[0]["ts"] <= self._feedback[0]["ts"]):
+                del self._messages[0]
+            else:
+                del self._feedback[0]
+        first = not self.dropped
+        self.dropped += excess
+        if first or self.dropped % 1000 < excess:  # the first drop, then every 1000th
+            print(f"[log-buffer] queue full ({self.max_pending} rows); {self.dropped} oldest rows dropped so far")
+
+    def flush(self) -> int:
+        """Write everything queued so far; returns the number of rows written."""
+        with self._flush_lock:
+            with self._lock:
+                messages, self._messages = self._messages, []
+                feedback, self._feedback = self._feedback, []
+            if not messages and not feedback:
+                return 0
+            try:
+                self._writer(messages, feedback)
+                self._failures = 0
+                return len(messages) + len(feedback)
+            except Exception:
+                self._failures += 1
+                if self._failures < self.max_retries:
+                    self._requeue(messages, feedback)
+                    raise
+            self._failures = 0
+            return self._flush_rows(messages, feedback)
+
+    def _requeue(self, messages: List[Dict[str, Any]], feedback: List[Dict[str, Any]]):
+        with self._lock:
+            self._messages[:0] = messages
+            self._feedback[:0] = feedback
+            self._trim()
+
+    def _flush_rows(self, messages: List[Dict[str, Any]], feedback: List[Dict[str, Any]]) -> int:
+        """Write a batch that keeps failing row by row; set aside the rows that fail on their own."""
+        written = 0
+        failed = []
+        for table, rows in (("messages", messages), ("feedback", feedback)):
+            for row in rows:
+                try:
+                    if table == "messages":
+                        self._writer([row], [])
+                    else:
+                        self._writer([], [row])
+                    written += 1
+                except Exception as e:
+                    failed.append((table, row, e))
+        if failed and not written:
+            # Not bad rows but an unavailable database: keep everything for later
+            self._requeue(messages, feedback)
+            raise failed[-1][2]
+        if failed:
+            self._dead_letter(failed)
+        return written
+
+    def _dead_letter(self, failed: List[Any]):
+        self.dead_lettered += len(failed)
+        print(f"[log-buffer] {len(failed)} rows could not be written (e.g. {failed[0][2]!r}); "
+              f"{'appended to ' + self.dead_letter if self.dead_letter else 'dropped'}")
+        if not self.dead_letter:
+            return
+        try:
+            with open(self.dead_letter, "a", encoding="utf-8") as f:
+                for table, row, e in failed:
+                    f.write(json.dumps({"table": table, "row": row, "error": repr(e)}, ensure_ascii=False) + "\n")
+        except OSError as e:
+            print(f"[log-buffer] dead-letter file not writable: {e}")
+
+    def close(self):
+        """Stop the background flusher and drain the queue."""
+        self._flusher.stop()
+
+_buffer: Optional[LogBuffer] = None
+_buffer_lock = threading.Lock()
+
+def get_log_buffer() -> LogBuffer:
+    """Return the process-wide log buffer, starting it on first use."""
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = LogBuffer()
+    return _buffer
+
+def install_log_buffer(buffer: LogBuffer):
+    """Make `buffer` the process-wide log buffer (e.g. one that writes through another process)."""
+    global _buffer
+    with _buffer_lock:
+        if _buffer is not None and _buffer is not buffer:
+            _buffer.close()
+        _buffer = buffer
+
+def has_log_buffer() -> bool:
+    """True once the process-wide buffer exists (creating it reads the DB)."""
+    return _buffer is not None
+
+@atexit.register
+def close_log_buffer():
+    """Drain and stop the process-wide log buffer (safe to call more than once)."""
+    global _buffer
+    with _buffer_lock:
+        if _buffer is not None:
+            _buffer.close()
+            _buffer = None